@@ -1,4 +1,4 @@
-api# pages/admin_portal.py
+# pages/admin_portal.py
 import streamlit as st
 import pandas as pd
 import os
@@ -12,6 +12,9 @@ from utils.sentiment_analyzer import SentimentAnalyzer
 from utils.smart_topic_analyzer import SmartTopicAnalyzer
 from utils.ai_dashboard import AIDashboard
 from utils.emergency_handler import EmergencyHandler
+from utils.conversation_summarizer import ConversationSummarizer
+from utils.trace_store import TraceStore
+from utils.employee_directory import EmployeeDirectory
 
 # Initialize components
 db_manager = DBManager()
@@ -20,6 +23,7 @@ sentiment_analyzer = SentimentAnalyzer()
 topic_analyzer = SmartTopicAnalyzer()
 emergency_handler = EmergencyHandler(db_manager)
 ai_dashboard = AIDashboard(db_manager, topic_analyzer, sentiment_analyzer)
+trace_store = TraceStore.shared()
 
 # Custom CSS for styling
 st.markdown("""
@@ -188,12 +192,13 @@ def main():
         st.error(f"⚠️ {len(open_tickets)} EMERGENCY TICKETS REQUIRING IMMEDIATE ATTENTION")
     
     # Tabs for different sections
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "Dashboard", 
         "Conversation History", 
         "Employee Reports", 
         "AI Analytics", 
-        "System Management"
+        "System Management",
+        "Performance"
     ])
     
     # Tab 1: Dashboard
@@ -246,6 +251,21 @@ def main():
             st.markdown("<div class='metric-label'>Emergency Tickets</div>", unsafe_allow_html=True)
             st.markdown("</div>", unsafe_allow_html=True)
         
+        # Answer latency as employees perceive it
+        response_times = db_manager.get_response_time_stats(days=7)
+        if response_times["count"]:
+            st.markdown("**Response Times (last 7 days)**")
+            first_token = response_times["time_to_first_token"]
+            generation = response_times["generation_time"]
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Median Time to First Token", f"{first_token['p50']:.1f}s" if first_token['p50'] is not None else "N/A")
+            col2.metric("95th Percentile Time to First Token", f"{first_token['p95']:.1f}s" if first_token['p95'] is not None else "N/A")
+            col3.metric("Median Generation Time", f"{generation['p50']:.1f}s" if generation['p50'] is not None else "N/A")
+            col4.metric("95th Percentile Generation Time", f"{generation['p95']:.1f}s" if generation['p95'] is not None else "N/A")
+            prompt_size = response_times["prompt_tokens"]
+            if prompt_size["p50"] is not None:
+                st.caption(f"Prompt size: {prompt_size['p50']:,} tokens median, {prompt_size['p95']:,} tokens 95th percentile")
+        
         # Show emergency tickets if any
         if open_tickets:
             st.markdown("---")
@@ -825,12 +845,11 @@ def main():
             st.write(f"**Server Time:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
             
             # Emergency system status
-            emergency_tickets_file = os.path.join("data", "emergency_tickets.json")
-            if os.path.exists(emergency_tickets_file):
+            try:
+                total_tickets = db_manager.count_emergency_tickets()
                 st.write(f"**Emergency System:** Operational")
-                total_tickets = len(emergency_handler.get_all_emergency_tickets())
                 st.write(f"**Total Emergency Tickets:** {total_tickets}")
-            else:
+            except Exception:
                 st.write(f"**Emergency System:** Not initialized")
         
         st.markdown("</div>", unsafe_allow_html=True)
@@ -875,6 +894,15 @@ def main():
                     except Exception as e:
                         st.error(f"Backup failed: {e}")
         
+        # Summaries are extracted locally, so filling in older conversations needs no API calls
+        if st.button("Generate Missing Summaries", key="backfill_summaries"):
+            with st.spinner("Summarizing conversations..."):
+                try:
+                    updated = ConversationSummarizer().backfill(db_manager)
+                    st.success(f"Added summaries to {updated} conversations")
+                except Exception as e:
+                    st.error(f"Error generating summaries: {e}")
+        
         # Emergency system management
         st.markdown("</div>", unsafe_allow_html=True)
         
@@ -907,12 +935,8 @@ def main():
                     with open(archive_path, 'w') as f:
                         json.dump(resolved_tickets, f, indent=2)
                     
-                    # Update tickets file to remove resolved
-                    all_tickets = emergency_handler.get_all_emergency_tickets()
-                    active_tickets = [t for t in all_tickets if t['status'] != 'RESOLVED']
-                    
-                    with open(os.path.join("data", "emergency_tickets.json"), 'w') as f:
-                        json.dump(active_tickets, f, indent=2)
+                    # Remove resolved tickets from the database
+                    db_manager.delete_emergency_tickets([ticket['id'] for ticket in resolved_tickets])
                     
                     st.success(f"Archived {len(resolved_tickets)} resolved tickets to {archive_path}")
                 else:
@@ -954,14 +978,13 @@ def main():
                     
                     # Update departments from employee database
                     try:
-                        with open("data/employee_database.json", "r") as f:
-                            employee_data = json.load(f)
+                        directory = EmployeeDirectory.shared()
                         
                         cursor.execute("SELECT id, employee_id FROM conversations")
                         conversations = cursor.fetchall()
                         
                         for conv_id, emp_id in conversations:
-                            department = employee_data.get(emp_id, {}).get("department", "Unknown")
+                            department = directory.get_department(emp_id)
                             cursor.execute(
                                 "UPDATE conversations SET department = ? WHERE id = ?", 
                                 (department, conv_id)
@@ -996,6 +1019,104 @@ def main():
         
         st.markdown("</div>", unsafe_allow_html=True)
     
+    # Tab 6: Performance
+    with tab6:
+        st.subheader("Chat Performance")
+        st.caption(
+            f"Traces of every slow (over {trace_store.slow_threshold:.0f}s) or failed chat turn and "
+            f"{trace_store.sample_rate:.0%} of the rest; percentiles weight sampled turns accordingly."
+        )
+        
+        col1, col2, col3 = st.columns([2, 2, 2])
+        with col1:
+            trace_days = st.selectbox("Period", [1, 7, 30], index=1, format_func=lambda days: f"Last {days} day{'s' if days > 1 else ''}", key="trace_days")
+        with col2:
+            trace_employee = st.text_input("Employee ID", key="trace_employee", help="Show only this employee's requests")
+        with col3:
+            trace_min_seconds = st.number_input("Slower than (seconds)", min_value=0.0, value=0.0, step=1.0, key="trace_min_seconds")
+        
+        summary = trace_store.get_latency_summary(days=trace_days)
+        if not summary["stored"]:
+            st.info("No traced chat requests in this period yet.")
+        else:
+            col1, col2, col3, col4, col5 = st.columns(5)
+            col1.metric("Chat Requests (est.)", f"{summary['estimated_requests']:,}")
+            col2.metric("Median", f"{summary['p50']:.1f}s")
+            col3.metric("95th Percentile", f"{summary['p95']:.1f}s")
+            col4.metric("99th Percentile", f"{summary['p99']:.1f}s")
+            col5.metric("Slow / Failed", f"{summary['slow']} / {summary['errors']}")
+            
+            # Where the time goes, stage by stage
+            st.markdown("**Latency by Stage**")
+            breakdown = trace_store.get_stage_breakdown(days=trace_days)
+            if breakdown:
+                stage_df = pd.DataFrame(breakdown)
+                total_time = stage_df["total"].sum()
+                stage_df["share"] = stage_df["total"] / total_time if total_time else 0
+                st.bar_chart(stage_df.set_index("stage")[["p50", "p95"]])
+                st.dataframe(
+                    pd.DataFrame({
+                        "Stage": stage_df["stage"],
+                        "Spans": stage_df["count"],
+                        "Mean (ms)": (stage_df["mean"] * 1000).round(1),
+                        "p50 (ms)": (stage_df["p50"] * 1000).round(1),
+                        "p95 (ms)": (stage_df["p95"] * 1000).round(1),
+                        "Share of Time": (stage_df["share"] * 100).round(1).astype(str) + "%"
+                    }),
+                    hide_index=True,
+                    use_container_width=True
+                )
+            
+            # Slowest requests, with the full span timeline of the selected one
+            st.markdown("**Slowest Requests**")
+            slow_traces = trace_store.get_traces(
+                days=trace_days,
+                min_duration=trace_min_seconds,
+                employee_id=trace_employee.strip() or None,
+                limit=50
+            )
+            if not slow_traces:
+                st.info("No requests match these filters.")
+            else:
+                traces_df = pd.DataFrame(slow_traces)
+                st.dataframe(
+                    pd.DataFrame({
+                        "Started": traces_df["started_at"].str[:19],
+                        "Employee": traces_df["employee_id"],
+                        "Duration (s)": traces_df["duration"].round(2),
+                        "Outcome": traces_df["outcome"].fillna("answered"),
+                        "Kept Because": traces_df["sample_reason"],
+                        "Trace ID": traces_df["trace_id"]
+                    }),
+                    hide_index=True,
+                    use_container_width=True
+                )
+                
+                selected_trace = st.selectbox(
+                    "Inspect request",
+                    [trace["trace_id"] for trace in slow_traces],
+                    format_func=lambda trace_id: next(
+                        f"{trace['started_at'][:19]} - {trace['employee_id'] or 'unknown'} - {trace['duration']:.2f}s"
+                        for trace in slow_traces if trace["trace_id"] == trace_id
+                    ),
+                    key="selected_trace"
+                )
+                spans = trace_store.get_trace_spans(selected_trace)
+                if spans:
+                    st.dataframe(
+                        pd.DataFrame({
+                            "Span": ["\u2003" * span["depth"] + span["name"] for span in spans],
+                            "Starts at (ms)": [round(span["start_offset"] * 1000, 1) for span in spans],
+                            "Duration (ms)": [round(span["duration"] * 1000, 1) if span["duration"] is not None else None for span in spans],
+                            "Details": [
+                                span["error"] or ", ".join(f"{key}={value}" for key, value in span["attributes"].items())
+                                for span in spans
+                            ]
+                        }),
+                        hide_index=True,
+                        use_container_width=True
+                    )
+    
     # Footer
     st.markdown("<div class='footer'>© 2025 Valley Water HR Assistant | Developed by Team Sapphire</div>", unsafe_allow_html=True)
 
@@ -1019,14 +1140,13 @@ def check_and_update_database():
             
             # Update existing records with department information
             try:
-                with open("data/employee_database.json", "r") as f:
-                    employee_data = json.load(f)
+                directory = EmployeeDirectory.shared()
                 
                 cursor.execute("SELECT id, employee_id FROM conversations")
                 conversations = cursor.fetchall()
                 
                 for conv_id, emp_id in conversations:
-                    department = employee_data.get(emp_id, {}).get("department", "Unknown")
+                    department = directory.get_department(emp_id)
                     cursor.execute(
                         "UPDATE conversations SET department = ? WHERE id = ?", 
                         (department, conv_id)
@@ -3,13 +3,27 @@ import streamlit as st
 import os
 import time
 import re
+import uuid
+import hashlib
 from datetime import datetime
 import json
-from openai import OpenAI
 from utils.user_auth import login_required, logout_user
+from utils.llm_gateway import get_llm_gateway
 from utils.pdf_processor import PDFProcessor
+from utils.document_corpus import DocumentCorpus
+from utils.call_fanout import CallFanout
+from utils.enrichment_worker import EnrichmentWorker
+from utils.answer_cache import AnswerCache
+from utils.structured_answer import StructuredAnswerParser
+from utils.topic_classifier import TopicClassifier
+from utils.conversation_summarizer import ConversationSummarizer
+from utils.prompt_builder import PromptBuilder
 from utils.db_manager import DBManager
 from utils.emergency_handler import EmergencyHandler
+from utils.keyword_matcher import KeywordMatcher
+from utils.tracing import Tracer
+from utils.trace_store import TraceStore
+from utils.answer_prefetcher import AnswerPrefetcher, PrefetchCancelled
 
 # Custom CSS for styling
 st.markdown("""
@@ -97,12 +111,51 @@ st.markdown("""
 
 # Initialize components
 pdf_processor = PDFProcessor()
+document_corpus = DocumentCorpus(pdf_processor)
 db_manager = DBManager()
 emergency_handler = EmergencyHandler(db_manager)
+call_fanout = CallFanout()
+answer_cache = AnswerCache()
+answer_parser = StructuredAnswerParser()
+topic_classifier = TopicClassifier.shared(db_manager, answer_parser.TOPIC_CATEGORIES)
+conversation_summarizer = ConversationSummarizer()
 
-# Initialize OpenAI client
-def get_openai_client():
-    """Get an OpenAI client with error handling for proxy issues"""
+# Keeps a sample of request traces, plus every slow or failed one, for the admin Performance tab
+trace_store = TraceStore.shared()
+answer_prefetcher = AnswerPrefetcher()
+
+# Most tokens the prompt sent for an answer may use; gpt-4's 8k context also has to hold the reply
+PROMPT_TOKEN_BUDGET = int(os.environ.get("HR_BOT_PROMPT_TOKEN_BUDGET", "6000"))
+prompt_builder = PromptBuilder(max_prompt_tokens=PROMPT_TOKEN_BUDGET)
+
+# Seconds to wait for each LLM side call (follow-ups, topic) before using a fallback
+POST_ANSWER_TIMEOUTS = {"suggestions": 8, "topic": 5}
+
+# Render answers token by token as they are generated (set HR_BOT_STREAM_RESPONSES=0 to disable)
+STREAM_RESPONSES = os.environ.get("HR_BOT_STREAM_RESPONSES", "1") != "0"
+
+# Minimum seconds between redraws of a streaming answer
+STREAM_REFRESH_INTERVAL = 0.05
+
+# Answer the suggested follow-ups in the background so a click shows its answer at once
+# (set HR_BOT_PREFETCH_SUGGESTIONS=0 to disable; each prefetch is an extra API call whether or not it's clicked)
+PREFETCH_SUGGESTIONS = os.environ.get("HR_BOT_PREFETCH_SUGGESTIONS", "1") != "0"
+
+# How a chat turn is answered, set per deployment with HR_BOT_PIPELINE_MODE:
+# "multi_call" makes separate calls for the answer, follow-ups, topic and summary;
+# "single_shot" gets all four from one JSON response and falls back to multi_call if it can't be parsed
+PIPELINE_MODE = os.environ.get("HR_BOT_PIPELINE_MODE", "multi_call")
+
+# Questions about the employee's own balances, dates or pay depend on more than the cached profile
+PERSONAL_QUESTION_RE = re.compile(
+    r"\b(my|i|me)\b.*\b(balance|review|manager|tenure|salary|pay|raise|hire date|anniversary)\b"
+    r"|\bhow (much|many)\b.*\b(do i|have i|i have)\b",
+    re.IGNORECASE
+)
+
+# Get an OpenAI client that routes through the shared LLM gateway
+def get_openai_client(lane="interactive"):
+    """Get a client for a gateway lane ('interactive' for chat, 'background' for the enrichment worker), with error handling for proxy issues"""
     api_key = os.environ.get("OPENAI_API_KEY") 
     
     if not api_key:
@@ -111,7 +164,7 @@ def get_openai_client():
         api_key = "your_openai_api_key_here"
     
     try:
-        return OpenAI(api_key=api_key)
+        return get_llm_gateway(api_key).client(lane)
     except Exception as e:
         print(f"Error creating OpenAI client: {e}")
         
@@ -172,7 +225,7 @@ RESOURCE_LINKS = {
     "human resources": "https://valleywater.org/departments/human-resources",
     "finance": "https://valleywater.org/departments/finance",
     "operations": "https://valleywater.org/departments/operations",
-    "it": "https://valleywater.org/departments/information-technology",
+    "information technology": "https://valleywater.org/departments/information-technology",
     "legal": "https://valleywater.org/departments/legal",
     
     # General
@@ -181,6 +234,9 @@ RESOURCE_LINKS = {
     "forms": "https://valleywater.org/employee/forms"
 }
 
+# Matches every resource keyword as a whole word in one pass over the text
+RESOURCE_MATCHER = KeywordMatcher(RESOURCE_LINKS.items())
+
 def is_new_hire(hire_date_str):
     """Check if employee is within first 90 days"""
     try:
@@ -208,13 +264,10 @@ def calculate_tenure(hire_date_str):
 
 def get_relevant_resource_links(question, answer=None):
     """Find relevant resource links based on question and answer content"""
-    combined_text = (question + " " + (answer or "")).lower()
+    combined_text = question + " " + (answer or "")
     
     # Find matching links
-    relevant_links = []
-    for keyword, url in RESOURCE_LINKS.items():
-        if keyword.lower() in combined_text:
-            relevant_links.append((keyword.title(), url))
+    relevant_links = [(keyword.title(), url) for keyword, url in RESOURCE_MATCHER.find(combined_text)]
     
     # Remove duplicates (keeping the first occurrence)
     unique_links = []
@@ -233,25 +286,14 @@ def get_relevant_resource_links(question, answer=None):
     
     return ""
 
-# Function to get PDF content
-def get_pdf_content():
-    # If content already in session state, return it
-    if "pdf_content" in st.session_state and st.session_state.pdf_content:
-        return st.session_state.pdf_content
-    
-    # Otherwise load default PDFs
-    pdf_files = pdf_processor.get_available_pdfs()
-    if pdf_files:
-        # Load the first available PDF
-        content = pdf_processor.load_pdf_content(filename=pdf_files[0])
-        st.session_state.pdf_content = content
-        return content
-    
-    return "No PDF content available."
+# Function to get the knowledge corpus across all policy PDFs
+def get_document_corpus():
+    # Extracts and indexes only new or changed PDFs; shards are shared across sessions
+    return document_corpus.refresh()
 
 # Function to classify message topic
-def classify_topic(question, answer):
-    client = get_openai_client()
+def classify_topic(question, answer, client=None, raise_errors=False):
+    client = client or get_openai_client()
     
     prompt = f"""
     Classify the following HR conversation into one of these categories:
@@ -279,92 +321,255 @@ def classify_topic(question, answer):
                 {"role": "user", "content": prompt}
             ],
             temperature=0.3,
-            max_tokens=10
+            max_tokens=10,
+            timeout=POST_ANSWER_TIMEOUTS["topic"]
         )
         
+        # Store the bare category name so LLM and locally classified topics group together in reports
         topic = response.choices[0].message.content.strip()
-        return topic
+        return topic_classifier.normalize_label(topic) or topic
     except Exception as e:
         print(f"Error classifying topic: {e}")
+        if raise_errors:
+            raise
         return "Other"
 
-# Function to generate conversation summary
+# Function to generate conversation summary (extractive, so no API call is needed)
 def generate_summary(question, answer):
-    client = get_openai_client()
-    
-    prompt = f"""
-    Summarize the following HR conversation in one short sentence:
-    
-    Question: {question}
-    Answer: {answer}
-    
-    Summary:
-    """
+    try:
+        return conversation_summarizer.summarize(question, answer)
+    except Exception as e:
+        print(f"Error generating summary: {e}")
+        return f"Conversation about {question[:30]}..."
+
+# Function to get fallback follow-up questions
+def get_default_suggestions(employee_data, new_hire):
+    if new_hire:
+        return [
+            "What should I prioritize in my first 90 days?",
+            "When is the next new hire orientation session?",
+            "How do I complete my benefits enrollment?"
+        ]
+    return [
+        f"How does this affect my specific role in {employee_data['department']}?",
+        "Who should I contact for more information about this?",
+        "What's the next step I should take?"
+    ]
+
+# Function to generate follow-up questions based on the conversation
+def generate_suggestions(question, answer, employee_data, new_hire, client=None):
+    client = client or get_openai_client()
     
     try:
-        response = client.chat.completions.create(
+        suggestion_prompt = f"""
+        Based on this conversation between {'a new employee (less than 90 days)' if new_hire else 'an employee'} and HR:
+        
+        Employee question: "{question}"
+        HR assistant answer: "{answer}"
+        
+        Generate 3 helpful follow-up questions this employee might want to ask next. These should:
+        1. Build naturally on the current conversation
+        2. Be relevant to someone in the {employee_data['department']} department
+        3. Help the employee get more specific information or take next steps
+        4. Be phrased in a casual, conversational way
+        {f"5. Focus on onboarding-related questions since this is a new employee" if new_hire else ""}
+        
+        Each question should be a single sentence ending with a question mark.
+        """
+        
+        suggestion_response = client.chat.completions.create(
             model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that summarizes conversations concisely."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=60
+            messages=[{"role": "user", "content": suggestion_prompt}],
+            temperature=0.7,
+            max_tokens=200,
+            timeout=POST_ANSWER_TIMEOUTS["suggestions"]
         )
         
-        summary = response.choices[0].message.content.strip()
-        return summary
+        # Extract and clean suggestions
+        suggestion_text = suggestion_response.choices[0].message.content.strip()
+        suggestions = []
+        
+        # Process each line looking for questions
+        for line in suggestion_text.split('\n'):
+            # Remove numbering and bullet points
+            clean_line = re.sub(r'^\d+[\.\)]\s*', '', line).strip()
+            clean_line = re.sub(r'^[-*•]\s*', '', clean_line).strip()
+            
+            # Only keep lines that are questions
+            if clean_line and '?' in clean_line:
+                suggestions.append(clean_line)
     except Exception as e:
-        print(f"Error generating summary: {e}")
-        return f"Conversation about {question[:30]}..."
+        print(f"Error generating suggestions: {e}")
+        suggestions = []
+    
+    # Ensure we have exactly 3 suggestions, topping up with generic but relevant questions
+    if len(suggestions) < 3:
+        default_suggestions = get_default_suggestions(employee_data, new_hire)
+        suggestions.extend(default_suggestions[:(3-len(suggestions))])
+    
+    # Trim to exactly 3 suggestions
+    return suggestions[:3]
 
-def find_semantic_matches(question, pdf_content):
-    """Use OpenAI to find semantically relevant sections in the PDF content"""
-    client = get_openai_client()
+# Function to generate the topic and summary stored with a conversation (runs in the enrichment worker)
+@Tracer.traced("enrichment")
+def enrich_conversation(question, answer):
+    # The local classifier, trained on earlier conversations, handles the topic when it's confident;
+    # otherwise the LLM classifies it, raising on failure so the worker retries the job
+    with Tracer.span("classification") as span:
+        topic = topic_classifier.predict(question, answer)
+        topic_source = "local" if topic else "llm"
+        if not topic:
+            topic = classify_topic(question, answer, get_openai_client("background"), raise_errors=True)
+        span["attributes"]["topic_source"] = topic_source
+    if not topic:
+        raise RuntimeError("Topic classification failed")
+    
+    with Tracer.span("summary"):
+        summary = generate_summary(question, answer)
     
-    search_prompt = f"""
-    Given this question from an employee: "{question}"
+    return topic, summary, topic_source
+
+# Function to stream a chat completion into a Streamlit placeholder
+def stream_chat_completion(client, placeholder, render=None, **kwargs):
+    """Stream a completion into placeholder, returning (text, seconds until the first visible text arrived)"""
+    # render maps the text received so far to what is displayed, e.g. the answer field of a JSON response
+    start_time = time.time()
+    stream = client.chat.completions.create(stream=True, **kwargs)
     
-    Please identify the 3-5 most relevant sections from this HR document that contain information to answer the question.
-    Consider different ways the question could be phrased and look for semantic matches, not just keyword matches.
-    If the exact information isn't present, identify sections with related information that could help address the question.
+    # Clients without streaming support return the whole response at once
+    if hasattr(stream, "choices"):
+        return stream.choices[0].message.content, time.time() - start_time
     
-    HR Document:
-    {pdf_content[:15000]}  # Limit for token constraints
+    parts = []
+    first_token_time = None
+    last_render = 0
+    for chunk in stream:
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+        parts.append(chunk.choices[0].delta.content)
+        
+        # Throttle redraws so long answers don't re-render the markdown for every token
+        if first_token_time is None or time.time() - last_render >= STREAM_REFRESH_INTERVAL:
+            text = "".join(parts)
+            display = render(text) if render else text
+            if display:
+                if first_token_time is None:
+                    first_token_time = time.time() - start_time
+                placeholder.markdown(display + "▌")
+                last_render = time.time()
     
-    Return the relevant sections, separated by "===SECTION===" markers.
-    If you can't find any relevant information, respond with "NO_RELEVANT_CONTENT_FOUND" and suggest related topics the employee might want to ask about instead.
-    """
+    # Show the complete text while follow-up suggestions are generated
+    text = "".join(parts)
+    placeholder.markdown(render(text) if render else text)
     
+    return text, first_token_time
+
+# Function to get the profile attributes a cached answer depends on
+def get_answer_cache_profile(employee_data, new_hire):
+    return (
+        employee_data.get('department', 'Unknown'),
+        new_hire,
+        tuple(sorted(employee_data.get('enrolled_benefits', [])))
+    )
+
+# Function to describe the employee in the system prompt; a cacheable answer is reused for everyone with the
+# same cache profile, so its prompt only gets the fields in that profile
+def get_employee_prompt_details(employee_data, cacheable):
+    department = f"- Department: {employee_data['department']}"
+    benefits = f"- Benefits Enrolled: {', '.join(employee_data.get('enrolled_benefits', []))}"
+    if cacheable:
+        return f"{department}\n{benefits}"
+    return "\n".join([
+        f"- Name: {employee_data['name']}",
+        f"- Position: {employee_data['position']}",
+        department,
+        f"- Tenure: {calculate_tenure(employee_data['hire_date'])}",
+        f"- Manager: {employee_data.get('manager', 'Not specified')}",
+        f"- PTO Balance: {employee_data['pto_balance']} days",
+        f"- Next Review: {employee_data['next_review_date']}",
+        benefits
+    ])
+
+# Function to list the names that personalize an answer, with the placeholders used in cached copies
+def get_personal_names(employee_data):
+    # Full names come first so they aren't split by the first-name replacement
+    names = [
+        ("[[name]]", employee_data.get('name', '')),
+        ("[[first_name]]", employee_data.get('name', '').split()[0] if employee_data.get('name') else ''),
+        ("[[manager]]", employee_data.get('manager', ''))
+    ]
+    return [(placeholder, value) for placeholder, value in names if value]
+
+# Function to strip an employee's names from an answer before caching it
+def depersonalize_answer(answer, employee_data):
+    for placeholder, value in get_personal_names(employee_data):
+        answer = re.sub(rf'\b{re.escape(value)}\b', placeholder, answer)
+    return answer
+
+# Function to fill a cached answer in with the current employee's names
+def personalize_answer(answer, employee_data):
+    for placeholder, value in get_personal_names(employee_data):
+        answer = answer.replace(placeholder, value)
+    return answer
+
+def find_semantic_matches(question, corpus):
+    """Find semantically relevant sections across all policy documents with the local vector index"""
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo-16k",  # Using larger context model for search
-            messages=[{"role": "user", "content": search_prompt}],
-            temperature=0.3,
-            max_tokens=2000
-        )
-        
-        content = response.choices[0].message.content.strip()
-        
-        # Check if no relevant content was found
-        if "NO_RELEVANT_CONTENT_FOUND" in content:
-            # Return empty string to trigger fallback
-            return ""
-            
-        return content
+        # Fetch a few extra so chunks dropped as duplicates by the prompt builder still leave enough
+        return corpus.get_relevant_chunks(question, top_k=6, method="semantic", min_score=0.05)
     except Exception as e:
         print(f"Error finding semantic matches: {e}")
-        return ""
+        return []
 
-# Function to get chatbot response
-def get_chatbot_response(question, conversation_history=[], uploaded_document=None):
-    client = get_openai_client()
+# Function to get the session details a chat turn uses, so it can also run outside the script thread
+def get_session_details():
+    return {
+        "employee_id": st.session_state.employee_id,
+        "employee_data": st.session_state.employee_data,
+        "conversation_id": st.session_state.conversation_id,
+        "prefetch_key": st.session_state.get("prefetch_key")
+    }
+
+# Function to identify the conversation state a follow-up is asked in
+def get_prefetch_context(history, session):
+    state = [session["conversation_id"]] + [[message["role"], message["content"]] for message in history]
+    return hashlib.sha256(json.dumps(state).encode('utf-8')).hexdigest()
+
+# Function to get chatbot response; each step is timed as a span of the "chat_turn" trace.
+# session defaults to the current Streamlit session; with save=False the turn is returned without being stored
+@Tracer.traced("chat_turn")
+def get_chatbot_response(question, conversation_history=[], uploaded_document=None, stream_placeholder=None, session=None, save=True, lane="interactive"):
+    request_start = time.time()
+    session = session or get_session_details()
+    # Lets admins find the traces behind an employee's report of a slow answer
+    Tracer.annotate(employee_id=session["employee_id"], conversation_id=session["conversation_id"])
+    
+    # A clicked suggestion may already have been answered in the background; any other question
+    # cancels the prefetches, since the conversation has moved on
+    if save and session.get("prefetch_key"):
+        with Tracer.span("prefetch_wait"):
+            prefetched = answer_prefetcher.take(
+                session["prefetch_key"], get_prefetch_context(conversation_history, session), question
+            )
+        if prefetched:
+            Tracer.annotate(outcome="prefetch_hit")
+            if stream_placeholder is not None:
+                stream_placeholder.markdown(prefetched["answer"])
+            # The employee only waited for the prefetch to finish, if it hadn't already
+            prefetched.setdefault("metrics", {}).update(time_to_first_token=time.time() - request_start, streamed=stream_placeholder is not None, prefetched=True)
+            if "record" in prefetched:
+                save_response(prefetched, session)
+            return prefetched
+    
+    client = get_openai_client(lane)
     
     # First, check for red flags in the question
-    red_flags, found_keywords = emergency_handler.detect_red_flags(question)
+    with Tracer.span("red_flags"):
+        red_flags, found_keywords = emergency_handler.detect_red_flags(question)
     
     # If red flags are detected
     if red_flags:
+        Tracer.annotate(outcome="red_flag")
         return {
             "answer": f"""I notice your message contains some sensitive topics that may require immediate HR attention.
 
@@ -381,49 +586,78 @@ For matters involving harassment, safety concerns, discrimination, or legal issu
             "found_keywords": found_keywords
         }
     
-    # Get full PDF content
-    full_pdf_content = get_pdf_content()
+    # Get the knowledge corpus covering every policy PDF
+    with Tracer.span("corpus_refresh"):
+        corpus = get_document_corpus()
     
-    # Get employee data from session state
-    employee_data = st.session_state.employee_data
+    # Get employee data from the session
+    employee_data = session["employee_data"]
     
     # Check if this is a new hire
     new_hire = is_new_hire(employee_data.get('hire_date', ''))
     
+    # Standalone, non-personal questions get the same answer for everyone with the same profile,
+    # so repeats are served from the cache; follow-ups depend on the conversation and always go to the model
+    corpus_version = corpus.get_version()
+    cache_profile = get_answer_cache_profile(employee_data, new_hire)
+    use_cache = (
+        not any(message["role"] == "user" for message in conversation_history)
+        and not PERSONAL_QUESTION_RE.search(question)
+    )
+    
+    with Tracer.span("cache_lookup"):
+        cached = answer_cache.get(question, corpus_version, cache_profile) if use_cache else None
+    if cached:
+        Tracer.annotate(outcome="cache_hit")
+        answer = personalize_answer(cached["answer"], employee_data)
+        if stream_placeholder is not None:
+            stream_placeholder.markdown(answer)
+        return record_response(
+            question, answer, list(cached["suggestions"]), topic=None, summary=None,
+            time_to_first_token=time.time() - request_start, generation_time=None,
+            streamed=stream_placeholder is not None, cache_hit=True, session=session, save=save
+        )
+    
     # Since we're removing document analysis, we'll handle regular questions
     # Step 1: Use semantic search to find relevant content
-    relevant_content = find_semantic_matches(question, full_pdf_content)
-    
-    # If no relevant content found through semantic search, use fallback method
-    if not relevant_content:
-        # Use the more general chunk-based approach as fallback
-        relevant_content = pdf_processor.get_relevant_chunks(question, full_pdf_content, num_chunks=4)
+    with Tracer.span("retrieval"):
+        relevant_chunks = find_semantic_matches(question, corpus)
+        
+        # If no relevant content found through semantic search, use fallback method
+        if not relevant_chunks:
+            # Use the BM25 keyword index as fallback
+            relevant_chunks = corpus.get_relevant_chunks(question, top_k=6, method="keyword")
+        
+        if not relevant_chunks:
+            relevant_chunks = corpus.get_default_chunks(num_chunks=4)
     
-    # Step 2: Create a personalized, conversational system message
+    # Step 2: Create a personalized, conversational system message; answers that may be cached
+    # leave out the employee's own details so they fit anyone with the same profile
+    if use_cache:
+        personalization = "refer to the employee's situation (department, benefits, etc.)"
+        address_guideline = "Keep the answer general to anyone in the employee's department with the same benefits; don't guess personal details such as their name, tenure or PTO balance"
+        policy_focus = "department"
+    else:
+        personalization = "refer to the employee's specific situation (name, department, tenure, etc.)"
+        address_guideline = "Address the employee by their first name at least once"
+        policy_focus = "position/department"
     system_message = f"""You are an AI HR Assistant for Valley Water. Your role is to help employees with their HR-related questions in a friendly, personalized way.
 
 Your response should be:
 1. CONVERSATIONAL and FRIENDLY - talk like a helpful HR colleague would, not a policy manual
 2. EASY TO READ - use simple language, clear headings, and bullet points
-3. PERSONALIZED - refer to the employee's specific situation (name, department, tenure, etc.)
+3. PERSONALIZED - {personalization}
 4. HELPFUL - include practical next steps when appropriate
 5. COMPREHENSIVE - if the exact answer isn't in the documents, use reasonable inference and general HR knowledge
 
 About the employee you're helping:
-- Name: {employee_data['name']}
-- Position: {employee_data['position']}
-- Department: {employee_data['department']}
-- Tenure: {calculate_tenure(employee_data['hire_date'])}
-- Manager: {employee_data.get('manager', 'Not specified')}
-- PTO Balance: {employee_data['pto_balance']} days
-- Next Review: {employee_data['next_review_date']}
-- Benefits Enrolled: {', '.join(employee_data.get('enrolled_benefits', []))}
+{get_employee_prompt_details(employee_data, cacheable=use_cache)}
 
 {"IMPORTANT: This is a NEW EMPLOYEE (less than 90 days). Prioritize onboarding-related information and be extra welcoming!" if new_hire else ""}
 
-Here is the relevant information from our HR documents:
+Here is the relevant information from our HR documents (each section is labeled with its source document and pages):
 
-{relevant_content}
+{prompt_builder.CONTEXT_PLACEHOLDER}
 
 Today's date is {datetime.now().strftime('%B %d, %Y')}.
 
@@ -431,34 +665,66 @@ Important guidelines:
 1. If you find the answer in the documents, reformulate it in a conversational, easy-to-understand way - NEVER say "I don't have information" if you can make a reasonable inference
 2. Start with a direct answer to the question, then provide details
 3. Use emoji occasionally to make your response engaging (1-2 emoji max)
-4. Address the employee by their first name at least once
-5. When appropriate, explain how policies specifically affect THIS employee based on their position/department
+4. {address_guideline}
+5. When appropriate, explain how policies specifically affect THIS employee based on their {policy_focus}
 6. If you're not 100% certain, you can say "Based on my understanding..." rather than refusing to answer
 7. Format your response with headings and bullet points when appropriate for readability
 """
     
-    # Prepare conversation history for API
-    messages = [
-        {"role": "system", "content": system_message}
-    ]
-    
-    # Add relevant conversation history (last 10 exchanges max)
-    for message in conversation_history[-10:]:
-        messages.append(message)
+    # Single-shot mode asks for the answer, follow-ups, topic and summary in one JSON response
+    single_shot = PIPELINE_MODE == "single_shot"
+    if single_shot:
+        system_message += answer_parser.get_instructions()
     
-    # Add current question
-    messages.append({"role": "user", "content": question})
+    # Fit the documents and conversation history (last 10 messages verbatim, older ones summarized)
+    # into the token budget, after the system prompt and the question
+    with Tracer.span("prompt_build"):
+        messages, prompt_report = prompt_builder.build(
+            system_message,
+            question,
+            context_chunks=relevant_chunks,
+            history=conversation_history,
+            empty_context="No PDF content available."
+        )
+        # How the budget was spent (tokens, chunks used, history kept, summarized and dropped) goes on the trace
+        Tracer.annotate(**prompt_report)
+    prompt_tokens = prompt_report["prompt_tokens"]
+    # Latency as the employee perceives it: seconds from the question until the first answer text,
+    # and seconds spent generating the answer
+    time_to_first_token = None
+    generation_time = None
     
     try:
-        # Step 3: Get main response from OpenAI
-        response = client.chat.completions.create(
+        # Step 3: Get main response from OpenAI, streamed into the chat when a placeholder is given
+        generation_start = time.time()
+        completion_args = dict(
             model="gpt-4",  # Using most capable model for best responses
             messages=messages,
             temperature=0.7,  # Higher temperature for more conversational tone
-            max_tokens=1000
+            max_tokens=1200 if single_shot else 1000  # Room for the follow-ups, topic and summary
         )
+        with Tracer.span("answer", model=completion_args["model"], streamed=stream_placeholder is not None):
+            if stream_placeholder is not None:
+                render = answer_parser.get_display_text if single_shot else None
+                answer, first_token_delay = stream_chat_completion(client, stream_placeholder, render=render, **completion_args)
+                answer = (answer or "").strip()
+                time_to_first_token = generation_start - request_start + (first_token_delay or 0)
+            else:
+                response = client.chat.completions.create(**completion_args)
+                answer = response.choices[0].message.content.strip()
+                time_to_first_token = time.time() - request_start
+        generation_time = time.time() - generation_start
         
-        answer = response.choices[0].message.content.strip()
+        # Unpack the single-shot JSON; if it's malformed, keep whatever answer text there is
+        # and let the multi-call steps below produce the rest
+        structured = None
+        if single_shot:
+            try:
+                structured = answer_parser.parse(answer)
+                answer = structured["answer"]
+            except ValueError as e:
+                print(f"Could not parse structured response, falling back to separate calls: {e}")
+                answer = answer_parser.extract_partial_answer(answer) or answer
         
         # Add new hire welcome information if applicable
         if new_hire and "welcome" not in answer.lower():
@@ -477,76 +743,45 @@ As you're in your first 90 days, don't forget to:
 Need help with anything specific about onboarding? Just ask!"""
         
         # Step 4: Identify and add relevant resource links
-        resource_links = get_relevant_resource_links(question, answer)
+        with Tracer.span("resource_links"):
+            resource_links = get_relevant_resource_links(question, answer)
         if resource_links:
             answer += f"\n\n{resource_links}"
         
-        # Step 5: Generate custom follow-up questions based on the conversation
-        suggestion_prompt = f"""
-        Based on this conversation between {'a new employee (less than 90 days)' if new_hire else 'an employee'} and HR:
-        
-        Employee question: "{question}"
-        HR assistant answer: "{answer}"
-        
-        Generate 3 helpful follow-up questions this employee might want to ask next. These should:
-        1. Build naturally on the current conversation
-        2. Be relevant to someone in the {employee_data['department']} department
-        3. Help the employee get more specific information or take next steps
-        4. Be phrased in a casual, conversational way
-        {f"5. Focus on onboarding-related questions since this is a new employee" if new_hire else ""}
-        
-        Each question should be a single sentence ending with a question mark.
-        """
-        
-        suggestion_response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": suggestion_prompt}],
-            temperature=0.7,
-            max_tokens=200
-        )
-        
-        # Extract and clean suggestions
-        suggestion_text = suggestion_response.choices[0].message.content.strip()
-        suggestions = []
-        
-        # Process each line looking for questions
-        for line in suggestion_text.split('\n'):
-            # Remove numbering and bullet points
-            clean_line = re.sub(r'^\d+[\.\)]\s*', '', line).strip()
-            clean_line = re.sub(r'^[-*•]\s*', '', clean_line).strip()
+        if structured:
+            # Steps 5 and 6 came back with the answer; top up follow-ups if the model gave fewer than 3
+            suggestions = structured["suggestions"]
+            suggestions += get_default_suggestions(employee_data, new_hire)[:3 - len(suggestions)]
+            topic = structured["topic"]
+            topic_source = "llm"
+            summary = structured["summary"] or generate_summary(question, answer)
+        else:
+            # Step 5: Generate custom follow-up questions, bounded by a timeout
+            with Tracer.span("suggestions"):
+                results = call_fanout.run(
+                    {"suggestions": lambda: generate_suggestions(question, answer, employee_data, new_hire, client)},
+                    fallbacks={"suggestions": get_default_suggestions(employee_data, new_hire)},
+                    timeouts=POST_ANSWER_TIMEOUTS
+                )
+            suggestions = results["suggestions"]
             
-            # Only keep lines that are questions
-            if clean_line and '?' in clean_line:
-                suggestions.append(clean_line)
+            # Step 6: The topic is only stored for reporting, so the enrichment worker classifies it;
+            # the summary is extracted locally when the conversation is saved
+            topic = None
+            topic_source = None
+            summary = None
         
-        # Ensure we have exactly 3 suggestions
-        if len(suggestions) < 3:
-            # If less than 3, add generic but relevant questions
-            default_suggestions = []
-            if new_hire:
-                default_suggestions = [
-                    "What should I prioritize in my first 90 days?",
-                    "When is the next new hire orientation session?",
-                    "How do I complete my benefits enrollment?"
-                ]
-            else:
-                default_suggestions = [
-                    f"How does this affect my specific role in {employee_data['department']}?",
-                    "Who should I contact for more information about this?",
-                    "What's the next step I should take?"
-                ]
-            suggestions.extend(default_suggestions[:(3-len(suggestions))])
-        
-        # Trim to exactly 3 suggestions
-        suggestions = suggestions[:3]
-        
-        # Step 6: Generate topic and summary for database
-        topic = classify_topic(question, answer)
-        summary = generate_summary(question, answer)
+        # Keep the answer for the next employee with the same profile who asks the same thing
+        if use_cache:
+            answer_cache.put(question, corpus_version, cache_profile, {
+                "answer": depersonalize_answer(answer, employee_data),
+                "suggestions": suggestions
+            })
         
     except Exception as e:
         error_msg = str(e)
         print(f"Error getting chatbot response: {error_msg}")
+        Tracer.annotate(outcome="error", error=error_msg)
         answer = f"I'm sorry, I encountered an error while processing your question. Please try again or contact HR directly for assistance."
         suggestions = [
             "Can you rephrase your question?",
@@ -554,35 +789,132 @@ Need help with anything specific about onboarding? Just ask!"""
             "Would you like to speak with someone from HR directly?"
         ]
         topic = "Error"
+        topic_source = None
         summary = "Error occurred while processing question"
     
-    # Step 7: Save the conversation to the database with conversation ID and department
-    db_manager.save_conversation(
-        employee_id=st.session_state.employee_id,
-        employee_name=employee_data['name'],
-        question=question,
-        answer=answer,
-        summary=summary,
-        topic=topic,
-        conversation_id=st.session_state.conversation_id,
-        department=employee_data.get('department', 'Unknown')
+    # Step 7: Save the conversation and build the response
+    return record_response(
+        question, answer, suggestions, topic, summary,
+        time_to_first_token=time_to_first_token, generation_time=generation_time,
+        streamed=stream_placeholder is not None, topic_source=topic_source, prompt_tokens=prompt_tokens,
+        session=session, save=save
     )
+
+# Function to build the response returned to the UI and save the chat turn (unless save is False)
+def record_response(question, answer, suggestions, topic, summary, time_to_first_token, generation_time, streamed, cache_hit=False, topic_source=None, prompt_tokens=None, session=None, save=True):
+    if summary is None:
+        with Tracer.span("summary"):
+            summary = generate_summary(question, answer)
     
-    return {
+    response = {
         "answer": answer,
         "suggestions": suggestions,
         "topic": topic,
-        "red_flags": red_flags if red_flags else None,
-        "found_keywords": found_keywords if red_flags else None
+        "red_flags": None,
+        "found_keywords": None,
+        "metrics": {
+            "time_to_first_token": time_to_first_token,
+            "generation_time": generation_time,
+            "streamed": streamed,
+            "cache_hit": cache_hit,
+            "pipeline_mode": PIPELINE_MODE,
+            "prompt_tokens": prompt_tokens
+        },
+        # The rest of what is saved, kept so a prefetched answer can be saved once it's shown
+        "record": {"question": question, "summary": summary, "topic_source": topic_source}
     }
+    
+    if save:
+        save_response(response, session or get_session_details())
+    return response
+
+# Function to save a chat turn right away; a pending topic is queued for the enrichment worker
+def save_response(response, session):
+    employee_data = session["employee_data"]
+    metrics = response["metrics"]
+    record = response["record"]
+    needs_enrichment = response["topic"] is None
+    with Tracer.span("save_conversation"):
+        db_manager.save_conversation(
+            employee_id=session["employee_id"],
+            employee_name=employee_data['name'],
+            question=record["question"],
+            answer=response["answer"],
+            summary=record["summary"],
+            topic=response["topic"],
+            conversation_id=session["conversation_id"],
+            department=employee_data.get('department', 'Unknown'),
+            enrich=needs_enrichment,
+            time_to_first_token=metrics["time_to_first_token"],
+            generation_time=metrics["generation_time"],
+            pipeline_mode=metrics["pipeline_mode"],
+            topic_source=record["topic_source"],
+            prompt_tokens=metrics["prompt_tokens"]
+        )
+    
+    if needs_enrichment:
+        EnrichmentWorker.start(db_manager, enrich_conversation).notify()
+
+# Function to start answering the suggested follow-ups in the background
+def prefetch_suggestions(suggestions):
+    session = get_session_details()
+    # The history a clicked suggestion will be asked with: the whole conversation so far
+    history = [{"role": msg["role"], "content": msg["content"]} for msg in st.session_state.messages]
+    
+    def answer(question, placeholder):
+        # Traced separately, so speculative answers don't count as chat turns employees waited for
+        with Tracer.span("prefetch"):
+            try:
+                response = get_chatbot_response(question, history, stream_placeholder=placeholder, session=session, save=False, lane="background")
+            except PrefetchCancelled:
+                Tracer.annotate(outcome="cancelled")
+                response = None
+        if response is None:
+            raise PrefetchCancelled()
+        # Never serve the apology for a failed call; the click will try again
+        if response["topic"] == "Error":
+            raise RuntimeError("Prefetched answer failed")
+        return response
+    
+    answer_prefetcher.prefetch(session["prefetch_key"], get_prefetch_context(history, session), suggestions, answer)
+
+# Function to answer the pending question below the conversation
+def respond_to_question(question):
+    # Format conversation history
+    history = [
+        {"role": msg["role"], "content": msg["content"]} 
+        for msg in st.session_state.messages[:-1]  # Exclude the latest message
+    ]
+    
+    with st.chat_message("assistant"):
+        if STREAM_RESPONSES:
+            placeholder = st.empty()
+            placeholder.markdown("_Thinking..._")
+            response_data = get_chatbot_response(question, history, stream_placeholder=placeholder)
+        else:
+            with st.spinner("Thinking..."):
+                response_data = get_chatbot_response(question, history)
+    
+    # Add assistant response
+    st.session_state.messages.append({
+        "role": "assistant", 
+        "content": response_data["answer"],
+        "red_flags": response_data.get("red_flags"),
+        "timestamp": datetime.now().isoformat()
+    })
+    
+    # Update suggestions
+    st.session_state.suggestions = response_data["suggestions"]
+    
+    # Red-flag suggestions lead to the report form rather than answers
+    if PREFETCH_SUGGESTIONS and not response_data.get("red_flags"):
+        prefetch_suggestions(response_data["suggestions"])
+    
+    # Rerun to render the final answer, resource links and suggestions
+    st.rerun()
 
 @login_required
 def main():
-    # Clear cached resources to ensure we use the latest API key
-    if 'first_load' not in st.session_state:
-        st.cache_resource.clear()
-        st.session_state.first_load = True
-    
     # Logout button
     if st.button("Logout", key="logout_btn", help="Logout from the HR portal"):
         logout_user()
@@ -611,6 +943,10 @@ def main():
     if "show_emergency_form" not in st.session_state:
         st.session_state.show_emergency_form = False
     
+    # Identifies this browser session's prefetched answers
+    if "prefetch_key" not in st.session_state:
+        st.session_state.prefetch_key = uuid.uuid4().hex
+    
     # Sidebar with employee profile
     with st.sidebar:
         # Profile picture - just the image without any wrapper
@@ -663,6 +999,7 @@ def main():
         if st.button("Start New Conversation", key="new_conversation_btn"):
             # Generate a new conversation ID
             st.session_state.conversation_id = f"{st.session_state.employee_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            answer_prefetcher.cancel(st.session_state.prefetch_key)
             # Clear messages
             st.session_state.messages = []
             st.success("Started a new conversation thread!")
@@ -740,6 +1077,10 @@ What would you like to know about today?"""
                     # Display user messages normally
                     st.write(message["content"])
         
+        # Answer a newly asked question, streaming it below the conversation
+        if st.session_state.get("pending_question"):
+            respond_to_question(st.session_state.pop("pending_question"))
+        
         st.markdown("</div>", unsafe_allow_html=True)
         
         # Suggestion buttons (only show if last message was from assistant)
@@ -764,30 +1105,12 @@ What would you like to know about today?"""
         user_input = st.chat_input("Ask your HR question here...")
         
         if user_input:
-            # Add user message
-            st.session_state.messages.append({"role": "user", "content": user_input})
+            # The employee asked something else, so stop answering the suggestions
+            answer_prefetcher.cancel(st.session_state.prefetch_key)
             
-            # Get chatbot response
-            with st.spinner("Thinking..."):
-                # Format conversation history
-                history = [
-                    {"role": msg["role"], "content": msg["content"]} 
-                    for msg in st.session_state.messages[:-1]  # Exclude the latest message
-                ]
-                
-                # Get response (no document data passed)
-                response_data = get_chatbot_response(user_input, history)
-                
-                # Add assistant response
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": response_data["answer"],
-                    "red_flags": response_data.get("red_flags"),
-                    "timestamp": datetime.now().isoformat()
-                })
-                
-                # Update suggestions
-                st.session_state.suggestions = response_data["suggestions"]
+            # Add user message; the answer is generated on the rerun so the question shows immediately
+            st.session_state.messages.append({"role": "user", "content": user_input})
+            st.session_state.pending_question = user_input
             
             # Rerun to update UI
             st.rerun()
@@ -797,30 +1120,9 @@ What would you like to know about today?"""
 
 # Helper function to handle suggestion clicks
 def handle_suggestion_click(suggestion_text):
-    # Add user message
+    # Add user message; the answer is generated on the rerun so it streams below the conversation
     st.session_state.messages.append({"role": "user", "content": suggestion_text})
-    
-    # Get chatbot response
-    with st.spinner("Thinking..."):
-        # Format conversation history
-        history = [
-            {"role": msg["role"], "content": msg["content"]} 
-            for msg in st.session_state.messages[:-1]  # Exclude the latest message
-        ]
-        
-        # Get response
-        response_data = get_chatbot_response(suggestion_text, history)
-        
-        # Add assistant response
-        st.session_state.messages.append({
-            "role": "assistant", 
-            "content": response_data["answer"],
-            "red_flags": response_data.get("red_flags"),
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        # Update suggestions
-        st.session_state.suggestions = response_data["suggestions"]
+    st.session_state.pending_question = suggestion_text
     
     # Force a rerun to update the UI
     st.rerun()
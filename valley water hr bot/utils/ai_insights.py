@@ -8,17 +8,17 @@ import json
 import os
 from collections import Counter
 import re
-from openai import OpenAI
+from utils.llm_gateway import get_llm_gateway
 from io import BytesIO
 from fpdf import FPDF
 
 class AIPoweredInsights:
     """AI-powered insights generator for HR dashboard"""
     
-    def __init__(self, db_manager, topic_analyzer):
+    def __init__(self, db_manager, topic_analyzer, openai_client=None):
         self.db_manager = db_manager
         self.topic_analyzer = topic_analyzer
-        self.client = self._get_openai_client()
+        self.client = openai_client or self._get_openai_client()
         self.emergency_handler = None  # Will be injected from dashboard
         
         # Initialize session state for insights
@@ -32,9 +32,9 @@ class AIPoweredInsights:
         self.emergency_handler = emergency_handler
     
     def _get_openai_client(self):
-        """Initialize OpenAI client"""
+        """Get a client for the shared LLM gateway's batch lane"""
         api_key = os.environ.get("OPENAI_API_KEY") or st.secrets.get("openai_api_key", "")
-        return OpenAI(api_key=api_key) if api_key else None
+        return get_llm_gateway(api_key).client("batch") if api_key else None
     
     def generate_insights(self, conversations, timeframe="Last 7 Days", start_date=None, end_date=None):
         """Generate AI-powered insights from conversations"""
@@ -0,0 +1,115 @@
+# utils/answer_cache.py
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Words whose presence never changes what is being asked; interrogatives, numbers and qualifiers
+# such as "this"/"next" or "part"/"full" are deliberately kept
+FILLER_WORDS = {'a', 'an', 'the', 'is', 'are', 'do', 'does', 'can', 'could', 'would', 'will', 'please', 'i', 'me', 'my'}
+
+class AnswerCache:
+    """Process-wide LRU cache of chatbot answers that also matches reworded questions with the same content words"""
+
+    # Shared by every session in the process; keys are ((corpus_version, profile), normalized question)
+    _entries = OrderedDict()
+    # (scope, content words) -> key in _entries, for questions that differ only in word order or inflection
+    _variants = {}
+    _lock = threading.Lock()
+    _corpus_version = None
+
+    def __init__(self, max_entries=500, ttl=6 * 60 * 60):
+        """Initialize with the cache size and entry lifetime in seconds"""
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def normalize_question(self, question):
+        """Lowercase, drop punctuation and collapse whitespace so trivial variants share a key"""
+        return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', question.lower())).strip()
+
+    @staticmethod
+    def _stem(word):
+        """Strip plural and tense endings so "accrues", "accrued" and "accrue" compare equal; numbers are left alone"""
+        if word.isdigit() or len(word) <= 3:
+            return word
+        if word.endswith('ies') and len(word) > 4:
+            return word[:-3] + 'y'
+        for suffix in ('ing', 'ed', 's'):
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                word = word[:-len(suffix)]
+                break
+        return word[:-1] if word.endswith('e') else word
+
+    def content_words(self, normalized):
+        """Sorted stemmed content words; two questions share them only if they differ in word order, inflection or filler"""
+        return tuple(sorted(self._stem(word) for word in normalized.split() if word not in FILLER_WORDS))
+
+    def get(self, question, corpus_version, profile):
+        """Return the cached value for a question (or a reworded one) from the same documents and profile"""
+        self.set_corpus_version(corpus_version)
+        scope = (corpus_version, profile)
+        normalized = self.normalize_question(question)
+        now = time.time()
+
+        with self._lock:
+            key = (scope, normalized)
+            entry = self._entries.get(key)
+
+            # Fall back to a question with exactly the same content words; any other word (a tier number,
+            # "this" vs "next" year, part- vs full-time) may change the answer
+            if entry is None:
+                key = self._variants.get((scope, self.content_words(normalized)))
+                entry = self._entries.get(key) if key else None
+
+            if entry is None:
+                return None
+            if entry['expires_at'] <= now:
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return entry['value']
+
+    def put(self, question, corpus_version, profile, value):
+        """Cache a value for a question, evicting the least recently used entries"""
+        self.set_corpus_version(corpus_version)
+        scope = (corpus_version, profile)
+        normalized = self.normalize_question(question)
+        variant = (scope, self.content_words(normalized))
+
+        with self._lock:
+            key = (scope, normalized)
+            self._entries[key] = {
+                'value': value,
+                'variant': variant,
+                'expires_at': time.time() + self.ttl
+            }
+            self._entries.move_to_end(key)
+            self._variants[variant] = key
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        """Drop an entry and its content-word index entry; caller holds the lock"""
+        entry = self._entries.pop(key)
+        if self._variants.get(entry['variant']) == key:
+            del self._variants[entry['variant']]
+
+    def set_corpus_version(self, corpus_version):
+        """Drop answers built from other versions of the policy documents once they change"""
+        with self._lock:
+            if corpus_version == AnswerCache._corpus_version:
+                return
+            AnswerCache._corpus_version = corpus_version
+            for key in [key for key in self._entries if key[0][0] != corpus_version]:
+                self._remove(key)
+
+    def clear(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._entries.clear()
+            self._variants.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,110 @@
+# utils/answer_prefetcher.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+class PrefetchCancelled(BaseException):
+    """Raised inside a prefetch that is no longer wanted; a BaseException so the answer
+    pipeline's own error handling doesn't turn it into an error answer"""
+
+class CancellablePlaceholder:
+    """Stands in for a Streamlit placeholder while a prefetched answer streams, stopping the stream once cancelled"""
+
+    def __init__(self, cancel_event):
+        """Initialize with the event that cancels the prefetch"""
+        self.cancel_event = cancel_event
+
+    def markdown(self, *args, **kwargs):
+        # Called as tokens arrive; raising here stops reading, which closes the upstream request
+        if self.cancel_event.is_set():
+            raise PrefetchCancelled()
+
+class AnswerPrefetcher:
+    """Answers the suggested follow-up questions in the background so clicking one is served from a per-session cache"""
+
+    # Shared by every session in the process; keys are session keys
+    _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="answer-prefetch")
+    _sessions = {}
+    _lock = threading.Lock()
+    stats = {"started": 0, "hits": 0, "misses": 0, "cancelled": 0, "failed": 0}
+
+    def __init__(self, ttl=300, max_questions=3):
+        """Initialize with how long (seconds) a prefetched answer stays usable and how many questions to prefetch per turn"""
+        self.ttl = ttl
+        self.max_questions = max_questions
+
+    def _cancel_entries(self, entries):
+        """Stop prefetches: queued ones never start, running ones stop at their next streamed token"""
+        for entry in entries.values():
+            entry["cancel"].set()
+            if entry["future"].cancel() or not entry["future"].done():
+                self.stats["cancelled"] += 1
+
+    def _expire(self, now):
+        """Drop sessions whose prefetches are too old to serve, e.g. from closed browser tabs"""
+        for session_key in [key for key, session in self._sessions.items() if now - session["created_at"] > self.ttl]:
+            self._cancel_entries(self._sessions.pop(session_key)["entries"])
+
+    def prefetch(self, session_key, context_key, questions, answer_func):
+        """Start answering questions for a session in the background, replacing anything prefetched before;
+        answer_func(question, placeholder) must return the response without saving it"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            previous = self._sessions.pop(session_key, None)
+            if previous:
+                self._cancel_entries(previous["entries"])
+
+            entries = {}
+            for question in questions[:self.max_questions]:
+                cancel = threading.Event()
+                future = self._executor.submit(self._run, answer_func, question, cancel)
+                entries[question] = {"future": future, "cancel": cancel}
+                self.stats["started"] += 1
+            self._sessions[session_key] = {"context_key": context_key, "created_at": now, "entries": entries}
+
+    def _run(self, answer_func, question, cancel):
+        """Answer one question unless the prefetch was cancelled before it started"""
+        if cancel.is_set():
+            raise PrefetchCancelled()
+        try:
+            return answer_func(question, CancellablePlaceholder(cancel))
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+
+    def take(self, session_key, context_key, question, timeout=60):
+        """Return the prefetched response for a question asked in the same conversation state, or None;
+        waits up to timeout seconds for one still being generated. Other prefetches for the session are cancelled"""
+        with self._lock:
+            session = self._sessions.pop(session_key, None)
+        if not session:
+            self.stats["misses"] += 1
+            return None
+
+        entry = session["entries"].pop(question, None)
+        self._cancel_entries(session["entries"])
+        if entry is None or session["context_key"] != context_key or time.time() - session["created_at"] > self.ttl:
+            if entry:
+                self._cancel_entries({question: entry})
+            self.stats["misses"] += 1
+            return None
+
+        try:
+            # A prefetch already under way finishes sooner than starting the same question again
+            response = entry["future"].result(timeout=timeout)
+        except FutureTimeoutError:
+            self._cancel_entries({question: entry})
+            response = None
+        except (PrefetchCancelled, Exception):
+            # Cancelled or failed; the question is answered the normal way
+            response = None
+        self.stats["hits" if response else "misses"] += 1
+        return response
+
+    def cancel(self, session_key):
+        """Cancel a session's prefetches, e.g. when the employee types their own question"""
+        with self._lock:
+            session = self._sessions.pop(session_key, None)
+        if session:
+            self._cancel_entries(session["entries"])
@@ -0,0 +1,119 @@
+# utils/bm25_index.py
+import heapq
+import json
+import math
+import os
+import re
+
+STOP_WORDS = {'a', 'an', 'the', 'is', 'are', 'do', 'does', 'what', 'when', 'where', 'how', 'why', 'who'}
+
+def tokenize(text):
+    """Lowercase a piece of text and split it into index terms"""
+    return [word for word in re.findall(r'\b\w+\b', text.lower()) if word not in STOP_WORDS]
+
+class BM25Index:
+    """Inverted index over document chunks ranked with Okapi BM25"""
+
+    def __init__(self, k1=1.5, b=0.75):
+        """Initialize an empty index with BM25 tuning parameters"""
+        self.k1 = k1
+        self.b = b
+        self.chunks = []
+        self.metadata = []  # optional per-chunk dicts, e.g. section and page range
+        self.postings = {}  # term -> [[chunk_id, term_frequency], ...]
+        self.idf = {}
+        self.chunk_lengths = []
+        self.avg_chunk_length = 0.0
+
+    def build(self, chunks, metadata=None):
+        """Build postings and BM25 statistics for a list of text chunks"""
+        self.chunks = list(chunks)
+        self.metadata = list(metadata) if metadata else []
+        self.postings = {}
+        self.chunk_lengths = []
+
+        for chunk_id, chunk in enumerate(self.chunks):
+            terms = tokenize(chunk)
+            self.chunk_lengths.append(len(terms))
+
+            # Count term frequencies within this chunk
+            frequencies = {}
+            for term in terms:
+                frequencies[term] = frequencies.get(term, 0) + 1
+
+            for term, tf in frequencies.items():
+                self.postings.setdefault(term, []).append([chunk_id, tf])
+
+        num_chunks = len(self.chunks)
+        self.avg_chunk_length = sum(self.chunk_lengths) / num_chunks if num_chunks else 0.0
+
+        # Precompute IDF so queries only walk postings lists
+        self.idf = {
+            term: math.log(1 + (num_chunks - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+        return self
+
+    def search(self, query, top_k=3):
+        """Return the top_k (chunk_id, score) pairs for a query, best first"""
+        if not self.chunks:
+            return []
+
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for chunk_id, tf in postings:
+                length_norm = 1 - self.b + self.b * self.chunk_lengths[chunk_id] / (self.avg_chunk_length or 1)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def get_chunks(self, query, top_k=3):
+        """Return the text of the top_k chunks for a query"""
+        return [self.chunks[chunk_id] for chunk_id, _ in self.search(query, top_k)]
+
+    def get_metadata(self, chunk_id):
+        """Return the metadata stored for a chunk, or an empty dict"""
+        return self.metadata[chunk_id] if chunk_id < len(self.metadata) else {}
+
+    def to_dict(self):
+        """Serialize the index to a JSON-compatible dictionary"""
+        return {
+            'k1': self.k1,
+            'b': self.b,
+            'chunks': self.chunks,
+            'metadata': self.metadata,
+            'postings': self.postings,
+            'idf': self.idf,
+            'chunk_lengths': self.chunk_lengths,
+            'avg_chunk_length': self.avg_chunk_length
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild an index from a dictionary produced by to_dict"""
+        index = cls(k1=data.get('k1', 1.5), b=data.get('b', 0.75))
+        index.chunks = data['chunks']
+        index.metadata = data.get('metadata', [])
+        index.postings = data['postings']
+        index.idf = data['idf']
+        index.chunk_lengths = data['chunk_lengths']
+        index.avg_chunk_length = data['avg_chunk_length']
+        return index
+
+    def save(self, path):
+        """Write the index to disk as JSON"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index previously written with save"""
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
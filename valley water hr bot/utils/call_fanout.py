@@ -0,0 +1,39 @@
+# utils/call_fanout.py
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from utils.tracing import Tracer
+
+class CallFanout:
+    """Runs independent blocking calls concurrently with per-call timeouts and fallbacks"""
+
+    # One pool per process so page reruns don't leak threads
+    _executor = ThreadPoolExecutor(max_workers=8)
+
+    def __init__(self, default_timeout=10):
+        """Initialize with the timeout used for calls that don't specify one"""
+        self.default_timeout = default_timeout
+
+    def run(self, calls, fallbacks=None, timeouts=None):
+        """Run {name: callable} concurrently; calls that fail or time out yield their fallback"""
+        fallbacks = fallbacks or {}
+        timeouts = timeouts or {}
+
+        # Timeouts count from submission, so the total wait is the largest budget, not the sum
+        start = time.time()
+        # Spans opened by the calls nest under the caller's span
+        futures = {name: self._executor.submit(Tracer.wrap(func)) for name, func in calls.items()}
+
+        results = {}
+        for name, future in futures.items():
+            remaining = max(0, timeouts.get(name, self.default_timeout) - (time.time() - start))
+            try:
+                results[name] = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                # The worker can't be interrupted; it finishes in the background and is ignored
+                future.cancel()
+                print(f"Timed out after {timeouts.get(name, self.default_timeout)}s waiting for {name}, using fallback")
+                results[name] = fallbacks.get(name)
+            except Exception as e:
+                print(f"Error running {name}: {e}")
+                results[name] = fallbacks.get(name)
+        return results
@@ -0,0 +1,109 @@
+# utils/conversation_summarizer.py
+import re
+from collections import Counter
+from utils.vector_index import STOP_WORDS
+
+LINK_RE = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+MARKUP_RE = re.compile(r'\*\*|__|`|^\s*#+\s*|^\s*([-*•]|\d+[.)])\s+')
+EMOJI_RE = re.compile('[\u2190-\u2bff\ufe0f\U0001f000-\U0001faff]')
+# Don't split after abbreviations such as "Jr." or initials
+SENTENCE_RE = re.compile(r'(?<=[.!?])(?<!\b[A-Z][a-z]\.)(?<!\b[A-Z]\.)\s+(?=[A-Z0-9"(])')
+WORD_RE = re.compile(r'\b[a-z0-9]+\b')
+
+# Greetings, sign-offs and onboarding reminders say nothing about the question
+LOW_VALUE_RE = re.compile(
+    r"^(hi|hello|hey|dear|welcome|great question|good question|absolutely|sure|of course|certainly|thanks|thank you)\b"
+    r"|let me know|feel free|don't hesitate|hope this helps|happy to help|just ask|reach out|"
+    r"i'?m (really |so )?sorry|i am (really |so )?sorry|i'?m here to help|^remember\b|^(it's great|i'?m glad)\b",
+    re.IGNORECASE
+)
+
+class ConversationSummarizer:
+    """Extractive one-line summaries of question/answer exchanges, picked from the answer's own sentences"""
+
+    def __init__(self, max_length=200):
+        """Initialize with the maximum summary length in characters"""
+        self.max_length = max_length
+
+    def split_sentences(self, answer):
+        """Strip markdown, links and emoji and split an answer into sentences; list items count as sentences"""
+        # The portal's new-hire wrapper and resource links aren't part of the answer itself
+        answer = answer.replace('’', "'").split("**Helpful Resources:**")[0]
+        answer = re.split(r"\n\s*As you're in your first 90 days", answer)[0]
+        answer = re.sub(r"(?s)^.*?As a new employee, here's what you need to know:", '', answer)
+
+        sentences = []
+        for line in answer.splitlines():
+            line = EMOJI_RE.sub('', LINK_RE.sub(r'\1', line))
+            line = re.sub(r'\s+', ' ', MARKUP_RE.sub('', line)).strip()
+            # Short headings introduce content rather than summarize it; a longer lead-in sentence
+            # such as "Here is the list of the 14 holidays we observe:" often says the most
+            if not line or (line.endswith(':') and len(line.split()) < 6):
+                continue
+            line = re.sub(r':$', '.', line)
+            sentences.extend(sentence.strip() for sentence in SENTENCE_RE.split(line) if sentence.strip())
+        return sentences
+
+    def _content_words(self, text):
+        """Lowercased words without stop words"""
+        return [word for word in WORD_RE.findall(text.lower()) if word not in STOP_WORDS]
+
+    def score_sentences(self, question, sentences):
+        """Score sentences by overlap with the question, centrality in the answer and position"""
+        question_words = set(self._content_words(question))
+        sentence_words = [self._content_words(sentence) for sentence in sentences]
+        frequencies = Counter(word for words in sentence_words for word in set(words))
+        max_frequency = max(frequencies.values()) if frequencies else 1
+
+        scores = []
+        for position, (sentence, words) in enumerate(zip(sentences, sentence_words)):
+            if not words:
+                scores.append(0.0)
+                continue
+            overlap = len(question_words.intersection(words)) / len(question_words) if question_words else 0.0
+            centrality = sum(frequencies[word] for word in set(words)) / (len(set(words)) * max_frequency)
+            # The prompt asks for a direct answer first, so early sentences carry the most weight
+            score = 2 * overlap + centrality + 1 / (1 + 0.3 * position)
+            if LOW_VALUE_RE.search(sentence):
+                score *= 0.1
+            if len(words) < 4:
+                score *= 0.3
+            if sentence.endswith('?'):
+                score *= 0.5
+            scores.append(score)
+        return scores
+
+    def _truncate(self, text):
+        """Cut text to max_length at a word boundary"""
+        if len(text) <= self.max_length:
+            return text
+        return text[:self.max_length - 3].rsplit(' ', 1)[0].rstrip(',;:') + "..."
+
+    def summarize(self, question, answer):
+        """Return a short summary built from the most representative sentences of the answer"""
+        sentences = self.split_sentences(answer or "")
+        scores = self.score_sentences(question or "", sentences)
+        ranked = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)
+
+        if not ranked or scores[ranked[0]] <= 0:
+            return f"Conversation about {(question or '')[:30]}..."
+
+        # Add the runner-up when the best sentence leaves room, keeping answer order
+        chosen = [ranked[0]]
+        if len(ranked) > 1 and scores[ranked[1]] > 0 and len(sentences[ranked[0]]) + len(sentences[ranked[1]]) < self.max_length:
+            chosen.append(ranked[1])
+
+        summary = " ".join(sentences[i].rstrip(',;:') for i in sorted(chosen))
+        return self._truncate(summary)
+
+    def backfill(self, db_manager, batch_size=500):
+        """Summarize stored conversations that have no summary, returning how many were updated"""
+        updated = 0
+        after_id = 0
+        while True:
+            rows = db_manager.get_conversations_without_summary(after_id=after_id, limit=batch_size)
+            if not rows:
+                return updated
+            summaries = [(self.summarize(row['question'], row['answer']), row['id']) for row in rows]
+            updated += db_manager.update_conversation_summaries(summaries)
+            after_id = rows[-1]['id']
@@ -1,16 +1,22 @@
 # utils/db_manager.py
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import json
 import pandas as pd
+from utils.tracing import TracedConnection
+from utils.employee_directory import EmployeeDirectory
+from utils.quantile_sketch import QuantileSketch
 
 class DBManager:
     """Manager class for database operations"""
     
-    def __init__(self, db_path="data/conversation_database.db"):
-        """Initialize with path to SQLite database"""
-        self.db_path = db_path
+    # Buckets for ticket resolution hours; persisted bucket counts assume these settings never change
+    RESOLUTION_SKETCH = QuantileSketch(relative_accuracy=0.02, min_value=1 / 60)
+    
+    def __init__(self, db_path=None):
+        """Initialize with path to SQLite database; defaults to HR_BOT_CONVERSATION_DB or data/conversation_database.db"""
+        self.db_path = db_path or os.environ.get("HR_BOT_CONVERSATION_DB", "data/conversation_database.db")
         self._ensure_db_dir()
         self._init_db()
     
@@ -21,7 +27,8 @@ class DBManager:
     
     def _get_connection(self):
         """Get a connection to the SQLite database"""
-        conn = sqlite3.connect(self.db_path)
+        # Queries made while a request is traced are recorded as spans
+        conn = sqlite3.connect(self.db_path, factory=TracedConnection)
         # Enable foreign key support
         conn.execute("PRAGMA foreign_keys = ON")
         # Return rows as dictionaries
@@ -58,11 +65,95 @@ class DBManager:
         )
         ''')
         
+        # Add columns introduced after the original schema: enrichment state, answer latency, pipeline mode,
+        # where the topic came from ('llm', 'local', 'admin' or 'fallback'; NULL for older rows) and prompt size
+        cursor.execute("PRAGMA table_info(conversations)")
+        columns = [column[1] for column in cursor.fetchall()]
+        new_columns = [
+            ("enrichment_status", "TEXT"),
+            ("time_to_first_token", "REAL"),
+            ("generation_time", "REAL"),
+            ("pipeline_mode", "TEXT"),
+            ("topic_source", "TEXT"),
+            ("prompt_tokens", "INTEGER")
+        ]
+        for column, column_type in new_columns:
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE conversations ADD COLUMN {column} {column_type}")
+        
+        # Create job table for background topic/summary generation
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS enrichment_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_row_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_enrichment_jobs_due
+        ON enrichment_jobs (status, next_attempt_at)
+        ''')
+        
+        # Create emergency tickets table; categories are stored as a JSON list
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS emergency_tickets (
+            id TEXT PRIMARY KEY,
+            employee_id TEXT,
+            employee_name TEXT,
+            department TEXT,
+            manager TEXT,
+            categories TEXT NOT NULL DEFAULT '[]',
+            message TEXT,
+            urgency TEXT,
+            timestamp TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'OPEN',
+            assigned_to TEXT,
+            resolution_notes TEXT,
+            resolved_timestamp TEXT,
+            conversation_id TEXT,
+            position TEXT,
+            hire_date TEXT
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_emergency_tickets_status ON emergency_tickets (status, timestamp)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_emergency_tickets_department ON emergency_tickets (department)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_emergency_tickets_timestamp ON emergency_tickets (timestamp)")
+        
+        # Create migrations table, recording one-off data imports that must not run twice
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS migrations (
+            name TEXT PRIMARY KEY,
+            applied_at TEXT NOT NULL
+        )
+        ''')
+        
+        # Create ticket aggregates table, kept up to date with every ticket change so analytics never scan the tickets
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS emergency_ticket_stats (
+            dimension TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, key)
+        )
+        ''')
+        cursor.execute("SELECT 1 FROM emergency_ticket_stats WHERE dimension = 'all'")
+        stats_missing = cursor.fetchone() is None
+        
         conn.commit()
         conn.close()
+        
+        # Tickets stored before the aggregates existed are counted once
+        if stats_missing:
+            self.rebuild_emergency_ticket_stats()
     
-    def save_conversation(self, employee_id, employee_name, question, answer, summary=None, topic=None, conversation_id=None, department=None):
-        """Save a conversation to the database with conversation grouping and department"""
+    def save_conversation(self, employee_id, employee_name, question, answer, summary=None, topic=None, conversation_id=None, department=None, enrich=False, time_to_first_token=None, generation_time=None, pipeline_mode=None, topic_source=None, prompt_tokens=None):
+        """Save a conversation to the database; with enrich=True topic and summary are filled in later by a background job"""
         conn = self._get_connection()
         cursor = conn.cursor()
         
@@ -80,9 +171,17 @@ class DBManager:
         # Insert the conversation
         cursor.execute('''
         INSERT INTO conversations 
-        (employee_id, employee_name, question, answer, summary, topic, date_time, conversation_id, department) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (employee_id, employee_name, question, answer, summary, topic, timestamp, conversation_id, department))
+        (employee_id, employee_name, question, answer, summary, topic, date_time, conversation_id, department, enrichment_status, time_to_first_token, generation_time, pipeline_mode, topic_source, prompt_tokens) 
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (employee_id, employee_name, question, answer, summary, topic, timestamp, conversation_id, department, 'pending' if enrich else None, time_to_first_token, generation_time, pipeline_mode, topic_source, prompt_tokens))
+        last_id = cursor.lastrowid
+        
+        # Queue topic/summary generation in the same transaction so no row is left without a job
+        if enrich:
+            cursor.execute('''
+            INSERT INTO enrichment_jobs (conversation_row_id, next_attempt_at, created_at, updated_at)
+            VALUES (?, ?, ?, ?)
+            ''', (last_id, timestamp, timestamp, timestamp))
         
         # Update topic statistics if topic is provided
         if topic:
@@ -92,19 +191,158 @@ class DBManager:
             ''', (topic,))
         
         conn.commit()
-        last_id = cursor.lastrowid
         conn.close()
         
         return last_id
     
+    def claim_enrichment_jobs(self, limit=5, lease_seconds=120):
+        """Claim due enrichment jobs; a claimed job becomes due again if not finished within the lease"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        now = datetime.now()
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+        lease_until = (now + timedelta(seconds=lease_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+        
+        try:
+            # Take the write lock up front so two workers can't claim the same job
+            conn.execute("BEGIN IMMEDIATE")
+            
+            cursor.execute('''
+            SELECT j.id, j.conversation_row_id, j.attempts, c.question, c.answer
+            FROM enrichment_jobs j
+            JOIN conversations c ON c.id = j.conversation_row_id
+            WHERE j.status IN ('pending', 'running') AND j.next_attempt_at <= ?
+            ORDER BY j.next_attempt_at
+            LIMIT ?
+            ''', (timestamp, limit))
+            
+            jobs = [dict(row) for row in cursor.fetchall()]
+            for job in jobs:
+                job['attempts'] += 1
+                cursor.execute('''
+                UPDATE enrichment_jobs
+                SET status = 'running', attempts = ?, next_attempt_at = ?, updated_at = ?
+                WHERE id = ?
+                ''', (job['attempts'], lease_until, timestamp, job['id']))
+            
+            conn.commit()
+        finally:
+            conn.close()
+        
+        return jobs
+    
+    def _finish_enrichment_job(self, job_id, topic, summary, job_status, error=None, topic_source=None):
+        """Write topic and summary to the job's conversation and close the job"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            
+            cursor.execute("SELECT conversation_row_id FROM enrichment_jobs WHERE id = ?", (job_id,))
+            job = cursor.fetchone()
+            
+            if job:
+                cursor.execute('''
+                UPDATE conversations
+                SET topic = ?, summary = COALESCE(?, summary), enrichment_status = ?, topic_source = ?
+                WHERE id = ?
+                ''', (topic, summary, 'complete' if job_status == 'done' else 'failed', topic_source, job['conversation_row_id']))
+                
+                # Count the topic only if the conversation still exists
+                if topic and cursor.rowcount > 0:
+                    cursor.execute('''
+                    INSERT INTO topics (name, count) VALUES (?, 1)
+                    ON CONFLICT(name) DO UPDATE SET count = count + 1
+                    ''', (topic,))
+                
+                cursor.execute('''
+                UPDATE enrichment_jobs
+                SET status = ?, last_error = ?, updated_at = ?
+                WHERE id = ?
+                ''', (job_status, error, timestamp, job_id))
+            
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def complete_enrichment_job(self, job_id, topic, summary, topic_source=None):
+        """Store the generated topic and summary for a job's conversation"""
+        self._finish_enrichment_job(job_id, topic, summary, 'done', topic_source=topic_source)
+    
+    def fail_enrichment_job(self, job_id, error, retry_delay, max_attempts, fallback_topic="Other", fallback_summary=None):
+        """Schedule a retry for a failed job, or give up and store fallbacks after max_attempts"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT attempts FROM enrichment_jobs WHERE id = ?", (job_id,))
+        job = cursor.fetchone()
+        
+        if job and job['attempts'] < max_attempts:
+            now = datetime.now()
+            cursor.execute('''
+            UPDATE enrichment_jobs
+            SET status = 'pending', last_error = ?, next_attempt_at = ?, updated_at = ?
+            WHERE id = ?
+            ''', (error, (now + timedelta(seconds=retry_delay)).strftime("%Y-%m-%d %H:%M:%S"), now.strftime("%Y-%m-%d %H:%M:%S"), job_id))
+            conn.commit()
+            conn.close()
+            return
+        
+        conn.close()
+        if job:
+            self._finish_enrichment_job(job_id, fallback_topic, fallback_summary, 'failed', error, topic_source='fallback')
+    
+    def get_topic_training_rows(self, after_id=0):
+        """Get conversations with trustworthy topics for training the local classifier, oldest first"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        # Topics the local model assigned itself or that were fallbacks after failures would only reinforce its mistakes
+        cursor.execute('''
+        SELECT id, question, answer, topic FROM conversations
+        WHERE id > ? AND topic IS NOT NULL
+        AND (topic_source IS NULL OR topic_source NOT IN ('local', 'fallback'))
+        ORDER BY id
+        ''', (after_id,))
+        
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+    
+    def get_conversations_without_summary(self, after_id=0, limit=500):
+        """Get conversations with no summary yet, oldest first, for backfilling"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+        SELECT id, question, answer FROM conversations
+        WHERE id > ? AND (summary IS NULL OR summary = '')
+        ORDER BY id
+        LIMIT ?
+        ''', (after_id, limit))
+        
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+    
+    def update_conversation_summaries(self, summaries):
+        """Store summaries given as (summary, conversation row id) pairs; returns the number of rows updated"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        cursor.executemany("UPDATE conversations SET summary = ? WHERE id = ?", summaries)
+        updated = cursor.rowcount
+        
+        conn.commit()
+        conn.close()
+        return updated
+    
     def get_employee_department(self, employee_id):
         """Get department for an employee from the employee database"""
-        try:
-            with open("data/employee_database.json", "r") as f:
-                employee_data = json.load(f)
-            return employee_data.get(employee_id, {}).get("department", "Unknown")
-        except:
-            return "Unknown"
+        return EmployeeDirectory.shared().get_department(employee_id)
     
     def get_employee_conversations(self, employee_id, limit=50):
         """Get conversations for a specific employee"""
@@ -412,6 +650,38 @@ class DBManager:
             "department_count": department_count
         }
     
+    def get_response_time_stats(self, days=7, pipeline_mode=None):
+        """Get time-to-first-token and generation time (seconds) and prompt size (tokens) statistics for recent answers; cached answers have neither generation time nor prompt"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        query = '''
+        SELECT time_to_first_token, generation_time, prompt_tokens FROM conversations
+        WHERE date_time >= date('now', ?) AND time_to_first_token IS NOT NULL
+        '''
+        params = [f'-{days} days']
+        
+        # Compare answer pipelines by filtering on the mode that produced each answer
+        if pipeline_mode:
+            query += " AND pipeline_mode = ?"
+            params.append(pipeline_mode)
+        
+        cursor.execute(query, params)
+        
+        rows = cursor.fetchall()
+        conn.close()
+        
+        stats = {"count": len(rows)}
+        for metric in ("time_to_first_token", "generation_time", "prompt_tokens"):
+            values = sorted(row[metric] for row in rows if row[metric] is not None)
+            stats[metric] = {
+                "avg": sum(values) / len(values) if values else None,
+                "p50": values[int(0.50 * (len(values) - 1))] if values else None,
+                "p95": values[int(0.95 * (len(values) - 1))] if values else None
+            }
+        
+        return stats
+    
     def delete_conversation(self, conversation_id):
         """Delete a specific conversation (admin function)"""
         conn = self._get_connection()
@@ -502,7 +772,7 @@ class DBManager:
             
             # Update the conversation
             cursor.execute(
-                "UPDATE conversations SET topic = ? WHERE id = ?", 
+                "UPDATE conversations SET topic = ?, topic_source = 'admin' WHERE id = ?", 
                 (new_topic, conversation_id)
             )
             
@@ -539,4 +809,221 @@ class DBManager:
         conn.commit()
         conn.close()
         
-        return len(conversations)
\ No newline at end of file
+        return len(conversations)
+    
+    def _ticket_from_row(self, row):
+        """Convert an emergency_tickets row to the ticket dict used by EmergencyHandler"""
+        ticket = dict(row)
+        ticket['categories'] = json.loads(ticket['categories'] or '[]')
+        return ticket
+    
+    def save_emergency_ticket(self, ticket):
+        """Insert an emergency ticket; raises sqlite3.IntegrityError if its ID is taken"""
+        self.import_emergency_tickets([ticket], skip_existing=False)
+    
+    def import_emergency_tickets(self, tickets, skip_existing=True, migration=None):
+        """Insert emergency tickets in one transaction, skipping IDs that already exist unless skip_existing is False;
+        a named migration imports at most once per database and returns 0 after that"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            if migration:
+                # Recorded in the same transaction as the tickets, so a failed import can simply run again
+                cursor.execute("INSERT OR IGNORE INTO migrations (name, applied_at) VALUES (?, ?)", (migration, datetime.now().isoformat()))
+                if not cursor.rowcount:
+                    return 0
+            inserted = 0
+            for ticket in tickets:
+                cursor.execute(f'''
+                INSERT {"OR IGNORE " if skip_existing else ""}INTO emergency_tickets
+                (id, employee_id, employee_name, department, manager, categories, message, urgency, timestamp, status,
+                 assigned_to, resolution_notes, resolved_timestamp, conversation_id, position, hire_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    ticket['id'], ticket.get('employee_id'), ticket.get('employee_name'), ticket.get('department'),
+                    ticket.get('manager'), json.dumps(ticket.get('categories') or []), ticket.get('message'),
+                    ticket.get('urgency'), ticket.get('timestamp') or datetime.now().isoformat(), ticket.get('status') or 'OPEN',
+                    ticket.get('assigned_to'), ticket.get('resolution_notes'), ticket.get('resolved_timestamp'),
+                    ticket.get('conversation_id'), ticket.get('position'), ticket.get('hire_date')
+                ))
+                if cursor.rowcount:
+                    cursor.execute("SELECT * FROM emergency_tickets WHERE id = ?", (ticket['id'],))
+                    self._apply_ticket_stats(cursor, self._ticket_from_row(cursor.fetchone()), 1)
+                    inserted += 1
+            conn.commit()
+            return inserted
+        finally:
+            conn.close()
+    
+    def get_emergency_tickets(self, status=None):
+        """Get emergency tickets, newest first, optionally filtered by status"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        if status:
+            cursor.execute("SELECT * FROM emergency_tickets WHERE status = ? ORDER BY timestamp DESC", (status,))
+        else:
+            cursor.execute("SELECT * FROM emergency_tickets ORDER BY timestamp DESC")
+        
+        tickets = [self._ticket_from_row(row) for row in cursor.fetchall()]
+        conn.close()
+        return tickets
+    
+    def get_emergency_ticket(self, ticket_id):
+        """Get an emergency ticket by ID, or None"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT * FROM emergency_tickets WHERE id = ?", (ticket_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return self._ticket_from_row(row) if row else None
+    
+    def count_emergency_tickets(self, status=None):
+        """Count emergency tickets, optionally with a given status"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        if status:
+            cursor.execute("SELECT COUNT(*) FROM emergency_tickets WHERE status = ?", (status,))
+        else:
+            cursor.execute("SELECT COUNT(*) FROM emergency_tickets")
+        
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+    
+    def update_emergency_ticket(self, ticket_id, status, assigned_to=None, resolution_notes=None, resolved_timestamp=None):
+        """Set a ticket's status, and its assignee, notes or resolution time when given; returns whether the ticket exists"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            
+            # Take the write lock first so the ticket read here is still current when its aggregates are moved
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT * FROM emergency_tickets WHERE id = ?", (ticket_id,))
+            old_row = cursor.fetchone()
+            if old_row is None:
+                return False
+            
+            cursor.execute('''
+            UPDATE emergency_tickets
+            SET status = ?,
+                assigned_to = COALESCE(?, assigned_to),
+                resolution_notes = COALESCE(?, resolution_notes),
+                resolved_timestamp = COALESCE(?, resolved_timestamp)
+            WHERE id = ?
+            ''', (status, assigned_to, resolution_notes, resolved_timestamp, ticket_id))
+            
+            cursor.execute("SELECT * FROM emergency_tickets WHERE id = ?", (ticket_id,))
+            new_row = cursor.fetchone()
+            self._apply_ticket_stats(cursor, self._ticket_from_row(old_row), -1)
+            self._apply_ticket_stats(cursor, self._ticket_from_row(new_row), 1)
+            
+            conn.commit()
+            return True
+        finally:
+            conn.close()
+    
+    def delete_emergency_tickets(self, ticket_ids):
+        """Delete emergency tickets by ID (admin function)"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            deleted = 0
+            for ticket_id in ticket_ids:
+                cursor.execute("SELECT * FROM emergency_tickets WHERE id = ?", (ticket_id,))
+                row = cursor.fetchone()
+                if row is None:
+                    continue
+                cursor.execute("DELETE FROM emergency_tickets WHERE id = ?", (ticket_id,))
+                self._apply_ticket_stats(cursor, self._ticket_from_row(row), -1)
+                deleted += 1
+            
+            conn.commit()
+            return deleted
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _resolution_hours(ticket):
+        """Hours from creation to resolution for a resolved ticket, or None"""
+        if ticket.get('status') != 'RESOLVED' or not ticket.get('resolved_timestamp'):
+            return None
+        try:
+            created = datetime.fromisoformat(ticket['timestamp'])
+            resolved = datetime.fromisoformat(ticket['resolved_timestamp'])
+            return (resolved - created).total_seconds() / 3600
+        except (TypeError, ValueError):
+            return None
+    
+    def _apply_ticket_stats(self, cursor, ticket, sign):
+        """Add (sign=1) or remove (sign=-1) a ticket's contribution to the aggregates, inside the caller's transaction"""
+        deltas = [
+            ('all', '', 0),
+            ('status', ticket.get('status') or 'Unknown', 0),
+            ('department', ticket.get('department') or 'Unknown', 0),
+            ('urgency', ticket.get('urgency') or 'Unknown', 0)
+        ]
+        deltas.extend(('category', category, 0) for category in ticket.get('categories') or [])
+        
+        hours = self._resolution_hours(ticket)
+        if hours is not None:
+            deltas.append(('resolution_hours', '', hours))
+            deltas.append(('resolution_bucket', str(self.RESOLUTION_SKETCH.bucket(hours)), 0))
+        
+        cursor.executemany('''
+        INSERT INTO emergency_ticket_stats (dimension, key, count, total) VALUES (?, ?, ?, ?)
+        ON CONFLICT(dimension, key) DO UPDATE SET count = count + excluded.count, total = total + excluded.total
+        ''', [(dimension, key, sign, sign * total) for dimension, key, total in deltas])
+    
+    def rebuild_emergency_ticket_stats(self):
+        """Recompute the ticket aggregates from every ticket (only needed once, for tickets stored before they existed)"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("DELETE FROM emergency_ticket_stats")
+            cursor.execute("INSERT INTO emergency_ticket_stats (dimension, key, count, total) VALUES ('all', '', 0, 0)")
+            
+            cursor.execute("SELECT * FROM emergency_tickets")
+            for row in cursor.fetchall():
+                self._apply_ticket_stats(cursor, self._ticket_from_row(row), 1)
+            
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def get_emergency_ticket_stats(self):
+        """Ticket counts by status, category, department and urgency, and resolution hours (count, mean, p50/p90/p95);
+        reads only the aggregates, so the cost doesn't grow with the number of tickets"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT dimension, key, count, total FROM emergency_ticket_stats WHERE count > 0")
+        rows = cursor.fetchall()
+        conn.close()
+        
+        stats = {'total': 0, 'by_status': {}, 'by_category': {}, 'by_department': {}, 'by_urgency': {}}
+        resolution = {'count': 0, 'total': 0.0}
+        buckets = {}
+        for row in rows:
+            if row['dimension'] == 'all':
+                stats['total'] = row['count']
+            elif row['dimension'] == 'resolution_hours':
+                resolution = {'count': row['count'], 'total': row['total']}
+            elif row['dimension'] == 'resolution_bucket':
+                buckets[int(row['key'])] = row['count']
+            else:
+                stats[f"by_{row['dimension']}"][row['key']] = row['count']
+        
+        stats['resolution_hours'] = {
+            'count': resolution['count'],
+            'mean': resolution['total'] / resolution['count'] if resolution['count'] else 0,
+            'p50': self.RESOLUTION_SKETCH.quantile(buckets, 50),
+            'p90': self.RESOLUTION_SKETCH.quantile(buckets, 90),
+            'p95': self.RESOLUTION_SKETCH.quantile(buckets, 95)
+        }
+        return stats
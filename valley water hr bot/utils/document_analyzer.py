@@ -6,13 +6,13 @@ import PyPDF2
 import json
 import re
 from datetime import datetime
-from openai import OpenAI
+from utils.llm_gateway import get_llm_gateway
 
 class DocumentAnalyzer:
     """Class for analyzing documents uploaded by employees"""
     
     def __init__(self, openai_client=None):
-        self.client = openai_client or OpenAI()
+        self.client = openai_client or get_llm_gateway().client("interactive")
         self.document_types = {
             'pay_stub': ['gross pay', 'net pay', 'deductions', 'pay period'],
             'tax_form': ['w-2', '1099', 'tax', 'withholding'],
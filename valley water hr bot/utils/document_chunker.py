@@ -0,0 +1,155 @@
+# utils/document_chunker.py
+import re
+
+ARTICLE_RE = re.compile(r'^(ARTICLE|Article)\s+(\d+|[IVXLC]+)\s*\.\s+\S.*$')
+SECTION_RE = re.compile(r'^(SECTION|Section)\s+\d+(\.\d+)*\s*\.(\s+\S.*)?$')
+TOC_ENTRY_RE = re.compile(r'(\.\s?){5,}|\s\.\s*\d+\s*$')
+COLUMN_GAP_RE = re.compile(r'\s{3,}')
+SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.!?:;])\s+(?=[A-Z0-9"“(•])')
+
+class DocumentChunker:
+    """Splits page text into chunks that follow the document's headings"""
+
+    # Bump when chunking rules change so persisted indexes are rebuilt
+    CHUNKER_VERSION = "1"
+
+    def __init__(self, max_chars=900, min_chars=200, normalize=None):
+        """Initialize with chunk size limits and an optional text normalizer"""
+        self.max_chars = max_chars
+        self.min_chars = min_chars
+        self.normalize = normalize or (lambda text: re.sub(r'\s+', ' ', text).strip())
+
+    def _segment_key(self, segment):
+        """Normalize a line segment so running headers with page numbers compare equal"""
+        key = re.sub(r'[^a-z#]', '', re.sub(r'\d+', '#', segment.lower()))
+        return re.sub(r'#+', '#', key)
+
+    def strip_boilerplate(self, line, boilerplate):
+        """Remove header/footer segments from a line, including ones run into body text"""
+        segments = []
+        for segment in COLUMN_GAP_RE.split(line.strip()):
+            if not segment or self._segment_key(segment) in boilerplate:
+                continue
+            words = segment.split()
+            for length in range(min(6, len(words) - 1), 1, -1):
+                if self._segment_key(' '.join(words[:length])) in boilerplate:
+                    segment = ' '.join(words[length:])
+                    break
+            segments.append(segment)
+        return ' '.join(segments)
+
+    def find_boilerplate(self, pages):
+        """Find header/footer segments that repeat across most pages"""
+        page_counts = {}
+        for page in pages:
+            lines = [line for line in page.splitlines() if line.strip()]
+            # Running headers are often glued to the first line of body text by a wide gap
+            segments = [segment for line in lines[:3] + lines[-3:] for segment in COLUMN_GAP_RE.split(line.strip())]
+            candidates = {self._segment_key(segment) for segment in segments if len(segment.split()) >= 2}
+            for key in candidates:
+                page_counts[key] = page_counts.get(key, 0) + 1
+
+        threshold = max(3, len(pages) // 2)
+        return {key for key, count in page_counts.items() if count >= threshold}
+
+    def is_heading(self, line):
+        """Check whether a line is an article, section or all-caps heading"""
+        if len(line) > 120 or TOC_ENTRY_RE.search(line):
+            return False
+        if ARTICLE_RE.match(line) or SECTION_RE.match(line):
+            return True
+
+        # Short all-caps lines such as "PAID HOLIDAYS" or "VISION CARE"; a trailing number is a page header
+        letters = [char for char in line if char.isalpha()]
+        return len(line.split()) >= 2 and not line[-1].isdigit() and len(letters) >= 6 and all(char.isupper() for char in letters)
+
+    def split_sentences(self, text):
+        """Split text into sentences, hard-wrapping any that exceed max_chars"""
+        sentences = []
+        for sentence in SENTENCE_BOUNDARY_RE.split(text):
+            while len(sentence) > self.max_chars:
+                cut = sentence.rfind(' ', 0, self.max_chars)
+                cut = cut if cut > 0 else self.max_chars
+                sentences.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
+            if sentence.strip():
+                sentences.append(sentence)
+        return sentences
+
+    def iter_blocks(self, pages):
+        """Yield (kind, text, page_number) blocks where kind is 'article', 'section', 'heading' or 'text'"""
+        boilerplate = self.find_boilerplate(pages)
+
+        for page_number, page in enumerate(pages, start=1):
+            lines = []
+            for line in page.splitlines():
+                line = self.strip_boilerplate(line, boilerplate)
+                # Table of contents entries only repeat headings found later
+                if line and not TOC_ENTRY_RE.search(line):
+                    lines.append(line)
+
+            # Pages extracted one word per line carry no usable line structure
+            words_per_line = sum(len(line.split()) for line in lines) / len(lines) if lines else 0
+            structured = words_per_line >= 2.5
+
+            paragraph = []
+            for line in lines:
+                if structured and self.is_heading(line):
+                    if paragraph:
+                        yield 'text', ' '.join(paragraph), page_number
+                        paragraph = []
+                    kind = 'article' if ARTICLE_RE.match(line) else 'section' if SECTION_RE.match(line) else 'heading'
+                    yield kind, self.normalize(line), page_number
+                else:
+                    paragraph.append(line)
+            if paragraph:
+                yield 'text', ' '.join(paragraph), page_number
+
+    def chunk_pages(self, pages):
+        """Chunk a list of page texts into dicts with text, section and page range"""
+        chunks = []
+        article = None
+        section = None
+        current = {'sentences': [], 'length': 0, 'section': None, 'page_start': None, 'page_end': None}
+
+        def flush():
+            if current['sentences']:
+                body = self.normalize(' '.join(current['sentences']))
+                label = current['section']
+                chunks.append({
+                    'text': f"{label}\n{body}" if label else body,
+                    'section': label or "",
+                    'page_start': current['page_start'],
+                    'page_end': current['page_end']
+                })
+            current.update(sentences=[], length=0, section=None, page_start=None, page_end=None)
+
+        def section_label():
+            return " > ".join(title for title in (article, section) if title) or None
+
+        for kind, text, page_number in self.iter_blocks(pages):
+            if kind != 'text':
+                # A new heading starts a new chunk unless the current one is still tiny
+                if current['length'] >= self.min_chars:
+                    flush()
+                if kind == 'article':
+                    article, section = text, None
+                else:
+                    section = text
+                if current['sentences']:
+                    current['sentences'].append(text + ".")
+                    current['length'] += len(text) + 1
+                continue
+
+            for sentence in self.split_sentences(text):
+                if current['length'] + len(sentence) > self.max_chars and current['length'] >= self.min_chars:
+                    flush()
+                if not current['sentences']:
+                    current['section'] = section_label()
+                    current['page_start'] = page_number
+                current['sentences'].append(sentence)
+                current['length'] += len(sentence) + 1
+                current['page_end'] = page_number
+
+        flush()
+        return chunks
@@ -0,0 +1,193 @@
+# utils/document_corpus.py
+import os
+import heapq
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class DocumentShard:
+    """Extracted text and search indexes for a single policy document"""
+
+    def __init__(self, filename, fingerprint, text, keyword_index, vector_index):
+        self.filename = filename
+        self.fingerprint = fingerprint
+        self.text = text
+        self.keyword_index = keyword_index
+        self.vector_index = vector_index
+
+    def search(self, question, top_k, method):
+        """Search this shard and tag every hit with its source document, section and pages"""
+        index = self.vector_index if method == "semantic" else self.keyword_index
+        return [
+            dict(
+                index.get_metadata(chunk_id),
+                document=self.filename,
+                chunk_id=chunk_id,
+                text=index.chunks[chunk_id],
+                score=score
+            )
+            for chunk_id, score in index.search(question, top_k)
+        ]
+
+def format_source(hit):
+    """Label a hit with its document and page range (chunk text already opens with its section)"""
+    if not hit.get('page_start'):
+        return f"[Source: {hit['document']}]"
+    pages = hit['page_start'] if hit['page_start'] == hit.get('page_end') else f"{hit['page_start']}-{hit['page_end']}"
+    return f"[Source: {hit['document']}, p. {pages}]"
+
+class DocumentCorpus:
+    """Knowledge corpus spanning every PDF in the policy directory"""
+
+    # Shards are shared by every session in the process, keyed by pdf_dir and filename
+    _shards = {}
+    _lock = threading.Lock()
+    _executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+
+    # OCR of scanned pages runs off the request path, one document at a time
+    _ocr_executor = ThreadPoolExecutor(max_workers=1)
+    _ocr_pending = set()
+
+    def __init__(self, pdf_processor):
+        """Initialize with the PDFProcessor used for extraction and indexing"""
+        self.pdf_processor = pdf_processor
+
+    def _fingerprint(self, filename):
+        """Cheap change detector for a PDF on disk, or None if it is missing"""
+        try:
+            stat = os.stat(self.pdf_processor.get_pdf_path(filename))
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _shard_key(self, filename):
+        """Key identifying a document's shard across PDFProcessor instances"""
+        return (os.path.abspath(self.pdf_processor.pdf_dir), filename)
+
+    def refresh(self):
+        """Extract and index new or changed PDFs, and drop removed ones"""
+        filenames = sorted(self.pdf_processor.get_available_pdfs())
+
+        # Only bookkeeping happens under the lock, so one session extracting a large PDF doesn't stall the others
+        with self._lock:
+            stale = []
+            for filename in filenames:
+                fingerprint = self._fingerprint(filename)
+                if fingerprint is None:
+                    continue
+
+                shard = self._shards.get(self._shard_key(filename))
+                if not shard or shard.fingerprint != fingerprint:
+                    stale.append((filename, fingerprint))
+
+            # Forget documents that were removed from the directory
+            pdf_dir = os.path.abspath(self.pdf_processor.pdf_dir)
+            for key in [key for key in self._shards if key[0] == pdf_dir and key[1] not in filenames]:
+                del self._shards[key]
+
+        for filename, fingerprint in stale:
+            shard = self._create_shard(filename, fingerprint)
+            with self._lock:
+                # The file may have changed again, or another session indexed this version, during extraction
+                current = self._shards.get(self._shard_key(filename))
+                if self._fingerprint(filename) != fingerprint or (current and current.fingerprint == fingerprint):
+                    continue
+                self._shards[self._shard_key(filename)] = shard
+
+                # Scanned pages have no text layer; OCR them in the background and swap the shard later
+                extraction = self.pdf_processor.get_cached_extraction(self.pdf_processor.get_pdf_path(filename))
+                if extraction.get('empty_pages'):
+                    self._schedule_ocr(filename, fingerprint)
+
+        return self
+
+    def _create_shard(self, filename, fingerprint, use_ocr=False):
+        """Extract and index a single document"""
+        pdf_path = self.pdf_processor.get_pdf_path(filename)
+        text = self.pdf_processor.load_pdf_content(filename=filename, use_ocr=use_ocr)
+        return DocumentShard(
+            filename=filename,
+            fingerprint=fingerprint,
+            text=text,
+            keyword_index=self.pdf_processor.get_document_search_index(pdf_path, use_ocr),
+            vector_index=self.pdf_processor.get_document_vector_index(pdf_path, use_ocr)
+        )
+
+    def _schedule_ocr(self, filename, fingerprint):
+        """Queue a background OCR pass for a document, once per version of the file"""
+        # Keys are never removed, so a file is OCR'd at most once per fingerprint per process
+        key = (self._shard_key(filename), fingerprint)
+        if key in self._ocr_pending or not self.pdf_processor.ocr_engine.is_available():
+            return
+        self._ocr_pending.add(key)
+        self._ocr_executor.submit(self._run_ocr, filename, fingerprint)
+
+    def _run_ocr(self, filename, fingerprint):
+        """Re-extract a document with OCR and replace its shard if the file hasn't changed"""
+        try:
+            shard = self._create_shard(filename, fingerprint, use_ocr=True)
+            with self._lock:
+                current = self._shards.get(self._shard_key(filename))
+                if shard.text and current and current.fingerprint == fingerprint:
+                    self._shards[self._shard_key(filename)] = shard
+        except Exception as e:
+            print(f"Error running OCR for {filename}: {e}")
+
+    def get_shards(self):
+        """Get the current shards for this corpus, ordered by filename"""
+        pdf_dir = os.path.abspath(self.pdf_processor.pdf_dir)
+        return [shard for key, shard in sorted(self._shards.items()) if key[0] == pdf_dir and shard.text]
+
+    def get_documents(self):
+        """Get the filenames of all indexed documents"""
+        return [shard.filename for shard in self.get_shards()]
+
+    def get_version(self):
+        """Identify the current documents and their contents; changes whenever a PDF is added, edited or removed"""
+        # Text length distinguishes the OCR'd shard from the one it replaces for the same file version
+        state = [(shard.filename, shard.fingerprint, len(shard.text)) for shard in self.get_shards()]
+        return hashlib.sha256(repr(state).encode('utf-8')).hexdigest()[:16]
+
+    def search(self, question, top_k=4, method="semantic", min_score=0.0):
+        """Search every document and return the top_k hits with provenance"""
+        shards = self.get_shards()
+        if not shards:
+            return []
+
+        # Shards are searched concurrently so latency tracks the largest shard, not the count
+        if len(shards) == 1:
+            shard_results = [shards[0].search(question, top_k, method)]
+        else:
+            shard_results = self._executor.map(lambda shard: shard.search(question, top_k, method), shards)
+
+        # Each shard scores against its own index statistics (IDF, average chunk length), so raw scores only
+        # compare within a document; merge on each hit's share of its document's best score instead
+        hits = []
+        for results in shard_results:
+            best = max((hit['score'] for hit in results), default=0.0)
+            for hit in results:
+                if hit['score'] > min_score:
+                    hit['relevance'] = hit['score'] / best if best > 0 else 0.0
+                    hits.append(hit)
+        return heapq.nlargest(top_k, hits, key=lambda hit: (hit['relevance'], hit['score']))
+
+    def get_relevant_chunks(self, question, top_k=4, method="semantic", min_score=0.0):
+        """The most relevant chunks across all documents, each prefixed with its source, best first"""
+        return [f"{format_source(hit)}\n{hit['text']}" for hit in self.search(question, top_k, method, min_score)]
+
+    def get_relevant_content(self, question, top_k=4, method="semantic", min_score=0.0):
+        """Format the most relevant chunks across all documents for a prompt"""
+        return "\n\n==========\n\n".join(self.get_relevant_chunks(question, top_k, method, min_score))
+
+    def get_default_chunks(self, num_chunks=4):
+        """Leading chunks from each document, each prefixed with its source"""
+        chunks = []
+        for shard in self.get_shards():
+            for chunk_id, chunk in enumerate(shard.keyword_index.chunks[:num_chunks]):
+                hit = dict(shard.keyword_index.get_metadata(chunk_id), document=shard.filename)
+                chunks.append(f"{format_source(hit)}\n{chunk}")
+        return chunks[:num_chunks]
+
+    def get_default_content(self, num_chunks=4):
+        """Leading chunks from each document, used when nothing matches"""
+        return "\n\n".join(self.get_default_chunks(num_chunks))
@@ -4,9 +4,11 @@ from datetime import datetime
 import json
 import time
 import os
+import sqlite3
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from utils.keyword_matcher import KeywordMatcher
 
 class EmergencyHandler:
     """Handles red flag detection and emergency HR contacts"""
@@ -18,38 +20,48 @@ class EmergencyHandler:
         'legal': ['violation', 'illegal', 'lawsuit', 'rights violated', 'retaliation', 'wrongful', 'labor law'],
         'ethics': ['unethical', 'fraud', 'corruption', 'misconduct', 'breach', 'confidential']
     }
+
+    # Compiled once per process and shared by every handler
+    RED_FLAG_MATCHER = KeywordMatcher.from_groups(RED_FLAG_KEYWORDS)
     
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, tickets_file=None):
         self.db_manager = db_manager
-        self.emergency_tickets_file = "data/emergency_tickets.json"
-        self._ensure_tickets_file()
+        # Tickets were kept in a JSON file next to the database before they moved into it
+        self.emergency_tickets_file = tickets_file or os.path.join(os.path.dirname(db_manager.db_path), "emergency_tickets.json")
+        self._migrate_tickets_file()
     
-    def _ensure_tickets_file(self):
-        """Ensure emergency tickets file exists"""
-        os.makedirs("data", exist_ok=True)
+    def _migrate_tickets_file(self):
+        """Copy tickets from the old JSON file into the emergency_tickets table, once per database"""
         if not os.path.exists(self.emergency_tickets_file):
-            with open(self.emergency_tickets_file, 'w') as f:
-                json.dump([], f)
+            return
+        try:
+            with open(self.emergency_tickets_file, 'r') as f:
+                tickets = json.load(f)
+            # The file stays in place; the database records the import, so tickets deleted later don't come back
+            imported = self.db_manager.import_emergency_tickets(tickets, migration="emergency_tickets_json")
+            if imported:
+                print(f"Migrated {imported} emergency tickets from {self.emergency_tickets_file}")
+        except Exception as e:
+            print(f"Error migrating emergency tickets: {e}")
     
     def detect_red_flags(self, message):
         """Detect red flags in employee messages"""
         red_flags = []
         found_keywords = {}
         
-        message_lower = message.lower()
-        
-        for category, keywords in self.RED_FLAG_KEYWORDS.items():
-            found = []
-            for keyword in keywords:
-                if keyword in message_lower:
-                    found.append(keyword)
-            
-            if found:
+        # One pass over the message; whole words only, so "asterisk" is not a "risk"
+        for keyword, category in self.RED_FLAG_MATCHER.find(message):
+            if category not in found_keywords:
                 red_flags.append(category)
-                found_keywords[category] = found
+                found_keywords[category] = []
+            found_keywords[category].append(keyword)
         
         return red_flags, found_keywords
     
+    def count_red_flags(self, messages):
+        """Count messages per red flag category, e.g. over a whole conversation history"""
+        return self.RED_FLAG_MATCHER.count(messages)
+    
     def create_emergency_ticket(self, employee_data, categories, message, urgency='HIGH'):
         """Create an emergency HR ticket"""
         ticket_id = f"HR-{datetime.now().strftime('%Y%m%d%H%M%S')}"
@@ -73,61 +85,33 @@ class EmergencyHandler:
             'hire_date': employee_data.get('hire_date', 'Unknown')
         }
         
-        # Save ticket to file
-        with open(self.emergency_tickets_file, 'r') as f:
-            tickets = json.load(f)
-        
-        tickets.append(ticket)
-        
-        with open(self.emergency_tickets_file, 'w') as f:
-            json.dump(tickets, f, indent=2)
-        
-        # Also save to database if you have a tickets table
-        try:
-            self.db_manager.save_emergency_ticket(ticket)
-        except:
-            pass  # Fallback to file system if DB method doesn't exist
+        # IDs have one-second resolution; a second ticket in the same second gets a numbered suffix
+        for attempt in range(2, 100):
+            try:
+                self.db_manager.save_emergency_ticket(ticket)
+                break
+            except sqlite3.IntegrityError:
+                ticket['id'] = f"{ticket_id}-{attempt}"
         
-        return ticket_id
+        return ticket['id']
     
     def get_all_emergency_tickets(self, status=None):
         """Get all emergency tickets, optionally filtered by status"""
-        with open(self.emergency_tickets_file, 'r') as f:
-            tickets = json.load(f)
-        
-        if status:
-            tickets = [t for t in tickets if t.get('status') == status]
-        
-        return sorted(tickets, key=lambda x: x.get('timestamp', ''), reverse=True)
+        return self.db_manager.get_emergency_tickets(status)
     
     def update_ticket_status(self, ticket_id, status, assigned_to=None, resolution_notes=None):
         """Update emergency ticket status"""
-        with open(self.emergency_tickets_file, 'r') as f:
-            tickets = json.load(f)
-        
-        for ticket in tickets:
-            if ticket['id'] == ticket_id:
-                ticket['status'] = status
-                if assigned_to:
-                    ticket['assigned_to'] = assigned_to
-                if resolution_notes:
-                    ticket['resolution_notes'] = resolution_notes
-                if status == 'RESOLVED':
-                    ticket['resolved_timestamp'] = datetime.now().isoformat()
-                break
-        
-        with open(self.emergency_tickets_file, 'w') as f:
-            json.dump(tickets, f, indent=2)
+        resolved_timestamp = datetime.now().isoformat() if status == 'RESOLVED' else None
+        return self.db_manager.update_emergency_ticket(
+            ticket_id, status,
+            assigned_to=assigned_to or None,
+            resolution_notes=resolution_notes or None,
+            resolved_timestamp=resolved_timestamp
+        )
     
     def get_ticket_by_id(self, ticket_id):
         """Get specific ticket by ID"""
-        with open(self.emergency_tickets_file, 'r') as f:
-            tickets = json.load(f)
-        
-        for ticket in tickets:
-            if ticket['id'] == ticket_id:
-                return ticket
-        return None
+        return self.db_manager.get_emergency_ticket(ticket_id)
     
     def notify_hr_team(self, ticket_id, categories):
         """Send notifications to HR team about emergency ticket"""
@@ -389,46 +373,21 @@ class EmergencyHandler:
     
     def get_emergency_analytics(self):
         """Get analytics data for emergency tickets"""
-        all_tickets = self.get_all_emergency_tickets()
+        # Aggregates are maintained as tickets change, so this reads a handful of rows however many tickets exist
+        stats = self.db_manager.get_emergency_ticket_stats()
+        resolution = stats['resolution_hours']
         
         analytics = {
-            'total_tickets': len(all_tickets),
-            'open_tickets': len([t for t in all_tickets if t['status'] == 'OPEN']),
-            'resolved_tickets': len([t for t in all_tickets if t['status'] == 'RESOLVED']),
-            'by_category': {},
-            'by_department': {},
-            'by_urgency': {},
-            'resolution_time': [],
+            'total_tickets': stats['total'],
+            'open_tickets': stats['by_status'].get('OPEN', 0),
+            'resolved_tickets': stats['by_status'].get('RESOLVED', 0),
+            'by_status': stats['by_status'],
+            'by_category': stats['by_category'],
+            'by_department': stats['by_department'],
+            'by_urgency': stats['by_urgency'],
+            'resolution_time': {key: resolution[key] for key in ('count', 'p50', 'p90', 'p95')},
+            'avg_resolution_time': resolution['mean'],
             'trends': []
         }
         
-        # Analyze by category
-        for ticket in all_tickets:
-            for category in ticket['categories']:
-                analytics['by_category'][category] = analytics['by_category'].get(category, 0) + 1
-            
-            # Analyze by department
-            dept = ticket.get('department', 'Unknown')
-            analytics['by_department'][dept] = analytics['by_department'].get(dept, 0) + 1
-            
-            # Analyze by urgency
-            urgency = ticket.get('urgency', 'Unknown')
-            analytics['by_urgency'][urgency] = analytics['by_urgency'].get(urgency, 0) + 1
-            
-            # Calculate resolution time
-            if ticket['status'] == 'RESOLVED' and ticket.get('resolved_timestamp'):
-                try:
-                    created = datetime.fromisoformat(ticket['timestamp'])
-                    resolved = datetime.fromisoformat(ticket['resolved_timestamp'])
-                    resolution_hours = (resolved - created).total_seconds() / 3600
-                    analytics['resolution_time'].append(resolution_hours)
-                except:
-                    pass
-        
-        # Calculate average resolution time
-        if analytics['resolution_time']:
-            analytics['avg_resolution_time'] = sum(analytics['resolution_time']) / len(analytics['resolution_time'])
-        else:
-            analytics['avg_resolution_time'] = 0
-        
         return analytics
\ No newline at end of file
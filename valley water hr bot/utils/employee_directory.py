@@ -0,0 +1,95 @@
+# utils/employee_directory.py
+import json
+import os
+import threading
+
+class EmployeeDirectory:
+    """Employee records from the employee database JSON, indexed by ID, department and manager and reloaded when the file changes"""
+
+    # One directory per file per process, shared by every page and session
+    _directories = {}
+    _lock = threading.Lock()
+
+    def __init__(self, db_path="data/employee_database.json"):
+        """Initialize with the path to the employee database JSON"""
+        self.db_path = db_path
+        self._reload_lock = threading.Lock()
+        # (fingerprint, employees, by_department, by_manager), swapped as a whole so readers never see half a reload
+        self._snapshot = (None, {}, {}, {})
+
+    @classmethod
+    def shared(cls, db_path="data/employee_database.json"):
+        """The process-wide directory for an employee database file"""
+        key = os.path.abspath(db_path)
+        with cls._lock:
+            directory = cls._directories.get(key)
+            if directory is None:
+                directory = cls._directories[key] = cls(db_path)
+            return directory
+
+    def _fingerprint(self):
+        """Cheap change detector for the file on disk, or None if it is missing"""
+        try:
+            stat = os.stat(self.db_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _current(self):
+        """The loaded snapshot, re-reading the file first if it changed since the last load"""
+        fingerprint = self._fingerprint()
+        snapshot = self._snapshot
+        if fingerprint == snapshot[0]:
+            return snapshot
+
+        with self._reload_lock:
+            # Another session may have reloaded while this one waited
+            if self._snapshot[0] != fingerprint:
+                self._snapshot = self._load(fingerprint)
+            return self._snapshot
+
+    def _load(self, fingerprint):
+        """Read the file and build the indexes; keeps the previous records if it can't be read"""
+        if fingerprint is None:
+            print(f"Employee database not found at {self.db_path}")
+            return (None, {}, {}, {})
+        try:
+            with open(self.db_path, 'r') as f:
+                employees = json.load(f)
+        except Exception as e:
+            print(f"Error loading employee database: {e}")
+            return (fingerprint,) + self._snapshot[1:]
+
+        by_department = {}
+        by_manager = {}
+        for employee_id, employee in employees.items():
+            by_department.setdefault(employee.get("department"), []).append(employee_id)
+            if employee.get("manager"):
+                by_manager.setdefault(employee["manager"], []).append(employee_id)
+        return (fingerprint, employees, by_department, by_manager)
+
+    def get(self, employee_id):
+        """Get an employee's record by ID, or None"""
+        employee = self._current()[1].get(employee_id)
+        # A copy, since the shared record must not change under other sessions
+        return dict(employee) if employee is not None else None
+
+    def get_department(self, employee_id, default="Unknown"):
+        """Get an employee's department by ID"""
+        return self._current()[1].get(employee_id, {}).get("department", default)
+
+    def get_all(self):
+        """All records keyed by employee ID; shared, so treat it as read-only"""
+        return self._current()[1]
+
+    def get_department_members(self, department):
+        """IDs of the employees in a department"""
+        return list(self._current()[2].get(department, []))
+
+    def get_direct_reports(self, manager):
+        """IDs of the employees whose manager is the given name"""
+        return list(self._current()[3].get(manager, []))
+
+    def get_departments(self):
+        """Sorted names of the departments that have employees"""
+        return sorted(department for department in self._current()[2] if department)
@@ -0,0 +1,75 @@
+# utils/enrichment_worker.py
+import threading
+import time
+
+class EnrichmentWorker:
+    """Background thread that fills in conversation topics and summaries from the job table"""
+
+    # One worker per database per process, shared by every session
+    _workers = {}
+    _lock = threading.Lock()
+
+    MAX_ATTEMPTS = 5
+    RETRY_DELAY = 15     # seconds before the first retry, doubled after each failure
+    POLL_INTERVAL = 5    # seconds between checks for due jobs when idle
+    LEASE_SECONDS = 120  # a claimed job is retried if not finished within this time
+
+    def __init__(self, db_manager, enrich_func, batch_size=4):
+        """Initialize with the DBManager and a function (question, answer) -> (topic, summary, topic_source)"""
+        self.db_manager = db_manager
+        self.enrich_func = enrich_func
+        self.batch_size = batch_size
+        self._wake = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="enrichment-worker", daemon=True)
+
+    @classmethod
+    def start(cls, db_manager, enrich_func):
+        """Start the worker for a database if it isn't already running, and return it"""
+        with cls._lock:
+            worker = cls._workers.get(db_manager.db_path)
+            if worker is None or not worker.thread.is_alive():
+                worker = cls(db_manager, enrich_func)
+                worker.thread.start()
+                cls._workers[db_manager.db_path] = worker
+            else:
+                # Page reruns redefine the function; use the latest one
+                worker.enrich_func = enrich_func
+            return worker
+
+    def notify(self):
+        """Wake the worker so a newly queued job is picked up without waiting for the next poll"""
+        self._wake.set()
+
+    def _run(self):
+        """Process due jobs until the process exits"""
+        while True:
+            try:
+                processed = self.process_due_jobs()
+            except Exception as e:
+                print(f"Error in enrichment worker: {e}")
+                processed = 0
+
+            if not processed:
+                self._wake.wait(self.POLL_INTERVAL)
+                self._wake.clear()
+
+    def process_due_jobs(self):
+        """Claim and process one batch of due jobs, returning how many were claimed"""
+        jobs = self.db_manager.claim_enrichment_jobs(self.batch_size, self.LEASE_SECONDS)
+
+        for job in jobs:
+            start_time = time.time()
+            try:
+                topic, summary, topic_source = self.enrich_func(job['question'], job['answer'])
+                self.db_manager.complete_enrichment_job(job['id'], topic, summary, topic_source)
+            except Exception as e:
+                print(f"Error enriching conversation {job['conversation_row_id']} "
+                      f"(attempt {job['attempts']}, {time.time() - start_time:.1f}s): {e}")
+                self.db_manager.fail_enrichment_job(
+                    job['id'],
+                    str(e),
+                    retry_delay=self.RETRY_DELAY * 2 ** (job['attempts'] - 1),
+                    max_attempts=self.MAX_ATTEMPTS
+                )
+
+        return len(jobs)
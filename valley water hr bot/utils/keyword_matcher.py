@@ -0,0 +1,106 @@
+# utils/keyword_matcher.py
+import re
+from collections import Counter
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+class KeywordMatcher:
+    """Finds every keyword of a fixed list in a text in one pass (Aho-Corasick), matching whole words only"""
+
+    # Endings a matched keyword may carry, so "accident" still finds "accidents" but "risk" never fires inside "asterisk"
+    DEFAULT_SUFFIXES = ("s", "es", "d", "ed", "ing")
+
+    def __init__(self, keywords, suffixes=DEFAULT_SUFFIXES):
+        """Initialize with (keyword, value) pairs, matched case-insensitively; a keyword may appear with several values"""
+        self.keywords = []
+        self.suffixes = frozenset(suffixes)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for keyword, value in keywords:
+            self._add(keyword, value)
+        self._build()
+
+    @classmethod
+    def from_groups(cls, groups, **kwargs):
+        """Build from {value: [keywords]}, e.g. keyword lists per category"""
+        return cls(((keyword, value) for value, keywords in groups.items() for keyword in keywords), **kwargs)
+
+    @staticmethod
+    def _normalize(text):
+        """Lowercase and collapse whitespace so multi-word keywords match across line breaks and double spaces"""
+        return WHITESPACE_RE.sub(' ', text.lower())
+
+    def _add(self, keyword, value):
+        """Add a keyword to the trie"""
+        pattern = self._normalize(keyword).strip()
+        if not pattern:
+            return
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append(len(self.keywords))
+        self.keywords.append((keyword, value, len(pattern)))
+
+    def _build(self):
+        """Set failure links breadth-first, merging each node's outputs with those of its failure node"""
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+                queue.append(child)
+
+    @staticmethod
+    def _is_word_char(char):
+        """Letters, digits and underscores make up words"""
+        return char.isalnum() or char == '_'
+
+    def _is_whole_word(self, text, start, end):
+        """Whether text[start:end] starts a word and ends one, allowing one of the accepted suffixes"""
+        if start > 0 and self._is_word_char(text[start - 1]):
+            return False
+        word_end = end
+        while word_end < len(text) and self._is_word_char(text[word_end]):
+            word_end += 1
+        return word_end == end or text[end:word_end] in self.suffixes
+
+    def _scan(self, text):
+        """Yield (keyword index, end offset) of every whole-word match in already normalized text"""
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in output[node]:
+                if self._is_whole_word(text, position + 1 - self.keywords[index][2], position + 1):
+                    yield index, position + 1
+
+    def iter_matches(self, text):
+        """Yield (start, end, keyword, value) for every match, as offsets into the normalized text, in the order they end"""
+        for index, end in self._scan(self._normalize(text)):
+            keyword, value, length = self.keywords[index]
+            yield end - length, end, keyword, value
+
+    def find(self, text):
+        """Distinct (keyword, value) pairs found in text, in the order the keywords were given"""
+        indexes = {index for index, _ in self._scan(self._normalize(text))}
+        return [self.keywords[index][:2] for index in sorted(indexes)]
+
+    def count(self, texts):
+        """Counter of values over many texts (e.g. a whole conversation history), each value counted once per text"""
+        counts = Counter()
+        for text in texts:
+            counts.update({self.keywords[index][1] for index, _ in self._scan(self._normalize(text or ""))})
+        return counts
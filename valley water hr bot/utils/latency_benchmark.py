@@ -0,0 +1,407 @@
+# utils/latency_benchmark.py
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+from utils.llm_replay import Cassette
+from utils.tracing import Tracer
+
+QUESTIONS_PATH = "data/benchmarks/questions.json"
+RESULTS_DIR = "data/benchmarks/results"
+PORTAL_PATH = "pages/Employee_portal.py"
+
+PERCENTILES = (50, 95, 99)
+
+# Report order for the stages of a chat turn; spans with other names are listed after these
+STAGE_ORDER = [
+    "red_flags", "corpus_refresh", "cache_lookup", "retrieval", "prompt_build", "answer",
+    "resource_links", "suggestions", "summary", "save_conversation",
+    "enrichment/classification", "enrichment/summary"
+]
+
+# Runs are only compared with earlier runs made with the same settings
+COMPARABLE_SETTINGS = ("llm", "latency", "pipeline_mode", "streamed", "questions")
+
+# Ignore changes smaller than this many seconds; sub-millisecond stages are mostly noise
+MIN_REGRESSION_DELTA = 0.005
+
+# Synthetic responses for each kind of request the portal makes, used when no recorded cassette is given
+STUB_ANSWER = """Hi there! 👋 Based on the Benefits Summary and the Employees Association MOU, here's how this works for you.
+
+### The short answer
+Full-time employees accrue paid leave every pay period, and the exact rate depends on your years of service. Most requests are approved by your manager and then recorded in the timekeeping system.
+
+### What this means for you
+- Check your current balance on your pay stub or in the employee self-service portal
+- Submit requests at least two weeks in advance when you can
+- Unused hours carry over up to the cap in the MOU; anything above the cap stops accruing
+
+### Next steps
+1. Review the relevant section of the MOU for the details that apply to your bargaining unit
+2. Talk with your manager about scheduling
+3. Reach out to HR if your balance looks wrong
+
+Let me know if you'd like help with anything else!"""
+
+STUB_SUGGESTIONS = """1. How do I check my current balance?
+2. Who do I talk to if my manager denies the request?
+3. Does this work differently for part-time employees?"""
+
+def percentile(values, p):
+    """The p-th percentile of values, interpolating between the nearest ranks"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def summarize_timings(values):
+    """Count, mean, percentiles and max of a list of durations in seconds"""
+    summary = {"count": len(values), "mean": sum(values) / len(values) if values else None}
+    for p in PERCENTILES:
+        summary[f"p{p}"] = percentile(values, p)
+    summary["max"] = max(values) if values else None
+    return summary
+
+def write_stub_cassette(path, single_shot=False):
+    """Write one synthetic recording per kind of request: the answer, the follow-ups and the topic"""
+    answer = STUB_ANSWER
+    if single_shot:
+        answer = json.dumps({
+            "answer": STUB_ANSWER,
+            "suggestions": [line[3:] for line in STUB_SUGGESTIONS.splitlines()],
+            "topic": "Time Off",
+            "summary": "Employee asked how leave accrues and carries over; explained the accrual rules and next steps."
+        }, ensure_ascii=False)
+
+    cassette = Cassette(path)
+    # The replay matches on model and the start of the system message, so these prompts only need the same shape
+    cassette.add({"model": "gpt-4", "messages": [
+        {"role": "system", "content": "You are an AI HR Assistant for Valley Water. Your role is to help employees with their HR-related questions in a friendly, personalized way."},
+        {"role": "user", "content": "How does paid leave accrue?"}
+    ]}, answer, None, None, streamed=True)
+    cassette.add({"model": "gpt-3.5-turbo", "messages": [
+        {"role": "user", "content": "Generate 3 helpful follow-up questions this employee might want to ask next."}
+    ]}, STUB_SUGGESTIONS, None, None, streamed=False)
+    cassette.add({"model": "gpt-3.5-turbo", "messages": [
+        {"role": "system", "content": "You are a helpful assistant that classifies HR conversations."},
+        {"role": "user", "content": "Classify the following HR conversation"}
+    ]}, "Time Off", None, None, streamed=False)
+    return cassette
+
+def get_version():
+    """The git commit being benchmarked, marked dirty if there are uncommitted changes"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except Exception as e:
+        print(f"Error reading git version: {e}")
+        return "unknown"
+
+def load_portal():
+    """Import the employee portal page without running its main()"""
+    spec = importlib.util.spec_from_file_location("employee_portal_benchmark", PORTAL_PATH)
+    portal = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(portal)
+    return portal
+
+class NullPlaceholder:
+    """Stands in for the Streamlit placeholder a streamed answer is drawn into"""
+
+    def markdown(self, *args, **kwargs):
+        pass
+
+class LatencyBenchmark:
+    """Drives get_chatbot_response headlessly over a question corpus and reports per-stage latency percentiles"""
+
+    def __init__(self, portal, questions, repeat=1, warmup=2, streamed=True, enrichment_timeout=60):
+        """Initialize with the loaded portal module, conversations (lists of questions) and run options"""
+        self.portal = portal
+        self.questions = questions
+        self.repeat = repeat
+        self.warmup = warmup
+        self.streamed = streamed
+        self.enrichment_timeout = enrichment_timeout
+        self.traces = []
+        self._lock = threading.Lock()
+
+    def _collect(self, trace):
+        """Trace listener that keeps every finished trace"""
+        with self._lock:
+            self.traces.append(trace)
+
+    def _ask_conversation(self, employee_id, employee_data, conversation):
+        """Ask each question of a conversation in turn, as the chat page would; returns the responses"""
+        st = self.portal.st
+        st.session_state.employee_id = employee_id
+        st.session_state.employee_data = employee_data
+        st.session_state.conversation_id = f"{employee_id}_bench_{time.time_ns()}"
+        history = []
+        responses = []
+        for question in conversation:
+            placeholder = NullPlaceholder() if self.streamed else None
+            response = self.portal.get_chatbot_response(question, list(history), stream_placeholder=placeholder)
+            history.append({"role": "user", "content": question})
+            history.append({"role": "assistant", "content": response["answer"]})
+            responses.append(response)
+        return responses
+
+    def _wait_for_enrichment(self, expected):
+        """Wait until the worker has classified every saved turn, or the timeout passes"""
+        deadline = time.time() + self.enrichment_timeout
+        done = 0
+        while time.time() < deadline:
+            with self._lock:
+                # Failed attempts are retried, so only successful ones count
+                done = sum(1 for trace in self.traces if trace["name"] == "enrichment" and not trace["error"])
+            if done >= expected:
+                return True
+            time.sleep(0.1)
+        print(f"Timed out waiting for enrichment ({done} of {expected} turns classified)")
+        return False
+
+    def run(self, employees):
+        """Run the corpus repeat times, rotating through employees; returns the per-stage report"""
+        Tracer.add_listener(self._collect)
+        try:
+            # The first turns load indexes and warm caches, which is not what a steady-state turn costs;
+            # their enrichment has to finish too, or it would be timed as part of the run
+            self.portal.get_document_corpus()
+            first_employee_id, first_employee = employees[0]
+            warmup_enrichments = 0
+            for conversation in self.questions[:self.warmup]:
+                responses = self._ask_conversation(first_employee_id, first_employee, conversation)
+                warmup_enrichments += sum(1 for response in responses if response["topic"] is None)
+            self._wait_for_enrichment(warmup_enrichments)
+            with self._lock:
+                self.traces = []
+
+            expected_enrichments = 0
+            turn = 0
+            start = time.time()
+            for _ in range(self.repeat):
+                # Every pass starts cold so repeats measure the full pipeline rather than cache hits
+                self.portal.answer_cache.clear()
+                for conversation in self.questions:
+                    employee_id, employee_data = employees[turn % len(employees)]
+                    turn += 1
+                    responses = self._ask_conversation(employee_id, employee_data, conversation)
+                    expected_enrichments += sum(1 for response in responses if response["topic"] is None)
+            wall_time = time.time() - start
+            self._wait_for_enrichment(expected_enrichments)
+            self.portal.trace_store.flush()
+        finally:
+            Tracer.remove_listener(self._collect)
+
+        return self.report(wall_time)
+
+    def report(self, wall_time=None):
+        """Percentiles for each stage, for whole turns and for the time to the first answer token"""
+        turns = [trace for trace in self.traces if trace["name"] == "chat_turn"]
+        stage_timings = {}
+        for trace in self.traces:
+            # Direct children of the root span are the stages; nested spans would double count.
+            # Stages of the background enrichment are named after their trace
+            for span in trace["spans"]:
+                if span["depth"] == 1:
+                    name = span["name"] if trace["name"] == "chat_turn" else f"{trace['name']}/{span['name']}"
+                    stage_timings.setdefault(name, []).append(span["duration"])
+
+        outcomes = {}
+        for trace in turns:
+            outcome = trace["spans"][0]["attributes"].get("outcome", "answered")
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+        ordered = [name for name in STAGE_ORDER if name in stage_timings]
+        ordered += sorted(name for name in stage_timings if name not in STAGE_ORDER)
+        return {
+            "turns": len(turns),
+            "outcomes": outcomes,
+            "wall_time": wall_time,
+            "overall": summarize_timings([trace["duration"] for trace in turns]),
+            "answered_turns": summarize_timings([
+                trace["duration"] for trace in turns if "outcome" not in trace["spans"][0]["attributes"]
+            ]),
+            "enrichment": summarize_timings([trace["duration"] for trace in self.traces if trace["name"] == "enrichment"]),
+            "stages": {name: summarize_timings(stage_timings[name]) for name in ordered}
+        }
+
+def format_seconds(value):
+    """Milliseconds for display"""
+    return "-" if value is None else f"{value * 1000:9.1f}"
+
+def print_report(results):
+    """Print the percentile table"""
+    report = results["report"]
+    print(f"\nLatency benchmark {results['version']} ({results['settings']['llm']}, {results['settings']['pipeline_mode']}, "
+          f"{report['turns']} turns: {', '.join(f'{count} {outcome}' for outcome, count in sorted(report['outcomes'].items()))})")
+    print(f"{'stage (ms)':<28}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    rows = list(report["stages"].items()) + [
+        ("enrichment (async)", report["enrichment"]),
+        ("answered turn", report["answered_turns"]),
+        ("overall", report["overall"])
+    ]
+    for name, summary in rows:
+        print(f"{name:<28}{summary['count']:>7}{format_seconds(summary['p50'])}{format_seconds(summary['p95'])}"
+              f"{format_seconds(summary['p99'])}{format_seconds(summary['max'])}")
+
+def find_baseline(results, exclude):
+    """The most recent saved run made with the same settings"""
+    candidates = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")), key=os.path.getmtime, reverse=True)
+    for path in candidates:
+        if os.path.abspath(path) == os.path.abspath(exclude):
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+        except Exception as e:
+            print(f"Error reading benchmark results {path}: {e}")
+            continue
+        if all(previous.get("settings", {}).get(key) == results["settings"].get(key) for key in COMPARABLE_SETTINGS):
+            return path, previous
+    return None, None
+
+def compare(results, baseline, threshold):
+    """Print p50/p95 changes against a baseline run and return the stages that got slower than threshold allows"""
+    print(f"\nCompared with {baseline['version']} ({baseline['created_at']}):")
+    print(f"{'stage':<28}{'p50 change':>14}{'p95 change':>14}")
+    current = dict(results["report"]["stages"], overall=results["report"]["overall"])
+    previous = dict(baseline["report"]["stages"], overall=baseline["report"]["overall"])
+    regressions = []
+    for name, summary in current.items():
+        if name not in previous:
+            continue
+        changes = []
+        for key in ("p50", "p95"):
+            new, old = summary.get(key), previous[name].get(key)
+            if new is None or old is None:
+                changes.append("-")
+                continue
+            change = (new - old) / old if old else 0.0
+            slower = new - old > MIN_REGRESSION_DELTA and change > threshold
+            if slower:
+                regressions.append(f"{name} {key}")
+            changes.append(f"{change:+.0%}{' !' if slower else ''}")
+        print(f"{name:<28}{changes[0]:>14}{changes[1]:>14}")
+    return regressions
+
+def main():
+    """Run the benchmark from the command line (from the app directory)"""
+    parser = argparse.ArgumentParser(description="Measure per-stage chat latency against a stubbed LLM")
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="JSON file with a 'conversations' list of question lists")
+    parser.add_argument("--cassette", default=None, help="replay recordings made with HR_BOT_LLM_RECORD instead of synthetic responses")
+    parser.add_argument("--latency", default="lognormal:0.6:0.4:120", help='LLM timing, "distribution[:median[:spread[:tokens_per_second]]]"')
+    parser.add_argument("--stub-server", action="store_true", help="serve the responses over HTTP so the SDK and connection pool are timed too")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the question corpus")
+    parser.add_argument("--warmup", type=int, default=2, help="conversations run before timing starts")
+    parser.add_argument("--no-stream", action="store_true", help="request whole answers instead of streaming them")
+    parser.add_argument("--database", default="data/conversation_database.db", help="copied to a scratch file so the benchmark never writes to it")
+    parser.add_argument("--baseline", default=None, help="results file to compare with; defaults to the latest run with the same settings")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 if any stage regressed")
+    parser.add_argument("--no-save", action="store_true", help="don't write the results file")
+    args = parser.parse_args()
+
+    with open(args.questions, 'r', encoding='utf-8') as f:
+        questions = json.load(f)["conversations"]
+
+    scratch_dir = tempfile.mkdtemp(prefix="hr-bot-benchmark-")
+    server = None
+    try:
+        # The LLM settings are read when the portal first creates its gateway, so set them before loading it
+        pipeline_mode = os.environ.get("HR_BOT_PIPELINE_MODE", "multi_call")
+        cassette_path = args.cassette
+        if not cassette_path:
+            cassette_path = os.path.join(scratch_dir, "stub.jsonl")
+            write_stub_cassette(cassette_path, single_shot=pipeline_mode == "single_shot")
+        os.environ.pop("HR_BOT_LLM_RECORD", None)
+        # Traces are still written, as in production, but not into the real trace database
+        os.environ["HR_BOT_TRACE_DB"] = os.path.join(scratch_dir, "trace_database.db")
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+        # Turns run back to back, far above real traffic, so the gateway's per-minute limits would dominate the
+        # timings; set these variables to benchmark with the production limits
+        os.environ.setdefault("HR_BOT_LLM_REQUESTS_PER_MINUTE", "100000")
+        os.environ.setdefault("HR_BOT_LLM_TOKENS_PER_MINUTE", "100000000")
+        if args.stub_server:
+            from utils.llm_replay import LatencyModel
+            from utils.llm_stub_server import StubServer
+            server = StubServer(cassette_path, LatencyModel.from_spec(args.latency, args.seed), seed=args.seed).start()
+            os.environ["OPENAI_BASE_URL"] = server.base_url
+            os.environ.pop("HR_BOT_LLM_REPLAY", None)
+        else:
+            os.environ["HR_BOT_LLM_REPLAY"] = cassette_path
+            os.environ["HR_BOT_LLM_REPLAY_LATENCY"] = args.latency
+            os.environ["HR_BOT_LLM_REPLAY_SEED"] = str(args.seed)
+
+        # The portal opens its database (and migrates the schema and old ticket file next to it) as soon as it is
+        # loaded, so it must only ever see the scratch copy
+        db_path = os.path.join(scratch_dir, "conversation_database.db")
+        if os.path.exists(args.database):
+            shutil.copy(args.database, db_path)
+        os.environ["HR_BOT_CONVERSATION_DB"] = db_path
+
+        from utils.user_auth import UserAuth
+        auth = UserAuth()
+        employees = sorted(auth.employees.items())
+        if not employees:
+            raise RuntimeError("No employees in the employee database to ask questions as")
+
+        portal = load_portal()
+        benchmark = LatencyBenchmark(portal, questions, repeat=args.repeat, warmup=args.warmup, streamed=not args.no_stream)
+        report = benchmark.run(employees)
+    finally:
+        if server:
+            server.stop()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    results = {
+        "version": get_version(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "settings": {
+            "llm": f"{'stub-server' if args.stub_server else 'replay'}:{os.path.basename(args.cassette) if args.cassette else 'synthetic'}",
+            "latency": args.latency,
+            "seed": args.seed,
+            "pipeline_mode": portal.PIPELINE_MODE,
+            "streamed": not args.no_stream,
+            "questions": os.path.basename(args.questions),
+            "repeat": args.repeat
+        },
+        "report": report
+    }
+    print_report(results)
+
+    results_path = os.path.join(RESULTS_DIR, f"latency_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{results['version']}.json")
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(results_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {results_path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    else:
+        _, baseline = find_baseline(results, results_path)
+    if baseline is None:
+        print("\nNo earlier run with the same settings to compare with")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nSlower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1 if args.fail_on_regression else 0
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,408 @@
+# utils/llm_gateway.py
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+import openai
+import streamlit as st
+from utils.openai_client import get_shared_openai_client
+from utils.llm_replay import Cassette, LatencyModel, RecordingClient, ReplayClient
+from utils.tracing import Tracer
+
+# Lower numbers are served first when calls are queued
+LANE_PRIORITIES = {"interactive": 0, "background": 1, "batch": 2}
+
+# Errors that mean the API itself is struggling, as opposed to a bad request
+UPSTREAM_ERRORS = tuple(
+    error for error in (
+        getattr(openai, "APIConnectionError", None),
+        getattr(openai, "APITimeoutError", None),
+        getattr(openai, "RateLimitError", None),
+        getattr(openai, "InternalServerError", None)
+    ) if error is not None
+) + (ConnectionError, TimeoutError)
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the API while the circuit breaker is open"""
+
+class TokenBucket:
+    """Thread-safe token bucket; lower-priority callers can be kept out of a reserved share of capacity"""
+
+    def __init__(self, capacity, refill_per_second):
+        """Initialize a full bucket"""
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_take(self, amount, reserve=0.0):
+        """Take amount if that leaves at least reserve * capacity; otherwise return seconds until it would"""
+        amount = min(float(amount), self.capacity * (1 - reserve))
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+            self.updated = now
+
+            shortfall = amount + reserve * self.capacity - self.tokens
+            if shortfall <= 0:
+                self.tokens -= amount
+                return 0.0
+            return shortfall / self.refill_per_second if self.refill_per_second else float('inf')
+
+    def give_back(self, amount):
+        """Return tokens taken for a call that didn't go ahead"""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+class CircuitBreaker:
+    """Stops calls after repeated upstream failures, then lets a single trial call through after a cooldown"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """Initialize a closed breaker"""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError if calls are currently blocked; returns True if this call is the half-open trial"""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError(f"LLM circuit open after {self.failures} consecutive failures")
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._trial_in_flight:
+                    raise CircuitOpenError("LLM circuit half-open, waiting on a trial call")
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self, trial):
+        """Reset the failure count after a successful response; only the half-open trial closes the breaker"""
+        with self._lock:
+            if trial:
+                self.state = "closed"
+                self._trial_in_flight = False
+            elif self.state != "closed":
+                # Started before the breaker tripped, so it says nothing about whether the API has recovered
+                return
+            self.failures = 0
+
+    def release_trial(self, trial):
+        """Let another call be the half-open trial when this one ended without a verdict on the API"""
+        if trial:
+            with self._lock:
+                self._trial_in_flight = False
+
+    def record_failure(self, error, trial):
+        """Count an upstream failure, opening the breaker at the threshold or when the trial call fails"""
+        if not isinstance(error, UPSTREAM_ERRORS):
+            # A rejected request neither counts against the API nor proves it has recovered
+            self.release_trial(trial)
+            return
+        with self._lock:
+            if trial:
+                self._trial_in_flight = False
+            self.failures += 1
+            if trial or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"Opening LLM circuit breaker after {self.failures} consecutive failures: {error}")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+class LLMGateway:
+    """Single path for chat completion traffic: priority lanes, rate limits, coalescing, a concurrency cap and a circuit breaker"""
+
+    def __init__(self, client, max_concurrency=8, requests_per_minute=300, tokens_per_minute=80000,
+                 failure_threshold=5, reset_timeout=30, queue_timeout=60):
+        """Initialize with the underlying OpenAI client and limits"""
+        self.raw_client = client
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        # Batch work may only fill half the slots, so interactive calls arriving later aren't stuck behind it
+        self.lane_limits = {
+            "interactive": max_concurrency,
+            "background": max(1, max_concurrency - 1),
+            "batch": max(1, max_concurrency // 2)
+        }
+        # Share of each rate limit bucket a lane must leave untouched for higher-priority lanes
+        self.lane_reserves = {"interactive": 0.0, "background": 0.1, "batch": 0.3}
+
+        self.request_bucket = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self._condition = threading.Condition()
+        self._waiting = []  # heap of (priority, sequence) for calls queued for a slot
+        self._sequence = itertools.count()
+        self._active = Counter()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.stats = Counter()
+
+    def client(self, lane="interactive"):
+        """A client-like object whose chat.completions.create goes through this gateway in the given lane"""
+        if lane not in LANE_PRIORITIES:
+            raise ValueError(f"Unknown LLM lane: {lane}")
+        return GatewayClient(self, lane)
+
+    def _estimate_tokens(self, kwargs):
+        """Rough prompt plus completion size, for the tokens-per-minute bucket"""
+        prompt_chars = sum(len(str(message.get("content") or "")) for message in kwargs.get("messages", []))
+        return prompt_chars // 4 + (kwargs.get("max_tokens") or 500)
+
+    def _coalesce_key(self, kwargs):
+        """Identify identical requests"""
+        return hashlib.sha256(json.dumps(kwargs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _acquire_slot(self, lane, deadline):
+        """Wait for a concurrency slot; queued calls get slots in lane priority order, then arrival order"""
+        entry = (LANE_PRIORITIES[lane], next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while not (self._waiting[0] == entry
+                           and sum(self._active.values()) < self.max_concurrency
+                           and self._active[lane] < self.lane_limits[lane]):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"Timed out waiting for an LLM slot in the {lane} lane")
+                    self._condition.wait(remaining)
+                heapq.heappop(self._waiting)
+                self._active[lane] += 1
+            except BaseException:
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                raise
+            finally:
+                # The next queued call may now be at the head
+                self._condition.notify_all()
+
+    def _release_slot(self, lane):
+        """Give a concurrency slot back"""
+        with self._condition:
+            self._active[lane] -= 1
+            self._condition.notify_all()
+
+    def _wait_for_rate_limit(self, lane, kwargs, deadline):
+        """Wait until both the request and token buckets allow the call"""
+        reserve = self.lane_reserves[lane]
+        tokens = self._estimate_tokens(kwargs)
+        while True:
+            wait = self.request_bucket.try_take(1, reserve)
+            if not wait:
+                wait = self.token_bucket.try_take(tokens, reserve)
+                if not wait:
+                    return
+                # Give back the request we took, since the call isn't going ahead yet
+                self.request_bucket.give_back(1)
+            if time.monotonic() + min(wait, 0.25) > deadline:
+                raise TimeoutError(f"Timed out waiting for LLM rate limit in the {lane} lane")
+            self.stats["rate_limited_waits"] += 1
+            time.sleep(min(wait, 0.25))
+
+    def _start_call(self, lane, kwargs):
+        """Check the breaker and wait for a slot and rate limit headroom; returns with the slot held, and whether this is the half-open trial"""
+        trial = self.breaker.before_call()
+        # Callers' own request timeouts also bound how long they queue
+        queued_at = time.monotonic()
+        deadline = queued_at + min(self.queue_timeout, float(kwargs.get("timeout") or self.queue_timeout))
+        slot_held = False
+        try:
+            self._acquire_slot(lane, deadline)
+            slot_held = True
+            self._wait_for_rate_limit(lane, kwargs, deadline)
+        except BaseException:
+            # The call never reached the API, so it must not keep a half-open trial (or a slot) to itself
+            if slot_held:
+                self._release_slot(lane)
+            self.breaker.release_trial(trial)
+            raise
+        Tracer.annotate(queue_wait=round(time.monotonic() - queued_at, 4))
+        return trial
+
+    def _call(self, lane, kwargs):
+        """Make one non-streaming call through the gateway"""
+        trial = self._start_call(lane, kwargs)
+        try:
+            response = self.raw_client.chat.completions.create(**kwargs)
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.breaker.record_failure(e, trial)
+            raise
+        finally:
+            self._release_slot(lane)
+        self.breaker.record_success(trial)
+        self.stats[f"{lane}_calls"] += 1
+        return response
+
+    def _stream(self, lane, kwargs):
+        """Make a streaming call, holding the concurrency slot until the stream is consumed or closed"""
+        trial = self._start_call(lane, kwargs)
+        try:
+            stream = self.raw_client.chat.completions.create(**kwargs)
+        except Exception as e:
+            self._release_slot(lane)
+            self.stats["errors"] += 1
+            self.breaker.record_failure(e, trial)
+            raise
+
+        # Clients without streaming support return the whole response at once
+        if hasattr(stream, "choices"):
+            self._release_slot(lane)
+            self.breaker.record_success(trial)
+            return stream
+
+        return GatewayStream(self, lane, stream, trial)
+
+    def create(self, lane, **kwargs):
+        """Create a chat completion in a lane, recorded as an "llm" span when a trace is active"""
+        # For streams the span ends when the response starts; reading it is timed by the caller
+        with Tracer.child_span("llm", lane=lane, model=kwargs.get("model"), stream=bool(kwargs.get("stream"))):
+            return self._create(lane, kwargs)
+
+    def _create(self, lane, kwargs):
+        """Create a chat completion; identical non-streaming requests already in flight share one call"""
+        if kwargs.get("stream"):
+            return self._stream(lane, kwargs)
+
+        key = self._coalesce_key(kwargs)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not is_owner:
+            self.stats["coalesced"] += 1
+            Tracer.annotate(coalesced=True)
+            return future.result()
+
+        try:
+            response = self._call(lane, kwargs)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def get_stats(self):
+        """Current load, breaker state and counters"""
+        with self._condition:
+            active = dict(self._active)
+            waiting = len(self._waiting)
+        return dict(self.stats, active=active, waiting=waiting, breaker_state=self.breaker.state)
+
+class GatewayStream:
+    """A streamed response that holds its gateway slot until it is read to the end, fails or is closed"""
+
+    def __init__(self, gateway, lane, stream, trial):
+        """Initialize with the gateway, the lane holding the slot, the upstream stream and whether it is the half-open trial"""
+        self.gateway = gateway
+        self.lane = lane
+        self.trial = trial
+        self._stream = stream
+        self._chunks = None
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._finished:
+            raise StopIteration
+        try:
+            if self._chunks is None:
+                self._chunks = iter(self._stream)
+            return next(self._chunks)
+        except StopIteration:
+            self._finish(success=True)
+            raise
+        except Exception as e:
+            self._finish(error=e)
+            raise
+
+    def close(self):
+        """Stop reading early; closes the response so the API stops generating"""
+        if self._finished:
+            return
+        try:
+            close = getattr(self._stream, "close", None)
+            if close:
+                close()
+        finally:
+            self._finish()
+
+    def __del__(self):
+        # A stream dropped before it was read or closed must still give its slot back
+        if not getattr(self, "_finished", True):
+            self.close()
+
+    def _finish(self, success=False, error=None):
+        """Release the slot and report the outcome to the breaker, once"""
+        if self._finished:
+            return
+        self._finished = True
+        self.gateway._release_slot(self.lane)
+        if success:
+            self.gateway.breaker.record_success(self.trial)
+            self.gateway.stats[f"{self.lane}_calls"] += 1
+        elif error is not None:
+            self.gateway.stats["errors"] += 1
+            self.gateway.breaker.record_failure(error, self.trial)
+        else:
+            # An abandoned stream says nothing about the API's health either way
+            self.gateway.breaker.release_trial(self.trial)
+
+class GatewayClient:
+    """Drop-in stand-in for an OpenAI client that routes chat completions through an LLMGateway lane"""
+
+    def __init__(self, gateway, lane):
+        """Initialize with the gateway and lane"""
+        self.gateway = gateway
+        self.lane = lane
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        """Create a chat completion through the gateway"""
+        return self.gateway.create(self.lane, **kwargs)
+
+def get_upstream_client(api_key=None):
+    """The client the gateway calls: the real API, a recorder around it, or a replay of earlier recordings"""
+    # HR_BOT_LLM_REPLAY=path answers every call offline from a cassette, with timing from
+    # HR_BOT_LLM_REPLAY_LATENCY ("recorded" or e.g. "lognormal:0.8:0.5:40")
+    replay_path = os.environ.get("HR_BOT_LLM_REPLAY")
+    if replay_path:
+        seed = os.environ.get("HR_BOT_LLM_REPLAY_SEED")
+        latency = LatencyModel.from_spec(os.environ.get("HR_BOT_LLM_REPLAY_LATENCY", "recorded"), int(seed) if seed else None)
+        return ReplayClient(Cassette(replay_path), latency)
+
+    client = get_shared_openai_client(api_key)
+    record_path = os.environ.get("HR_BOT_LLM_RECORD")
+    return RecordingClient(client, Cassette(record_path)) if record_path else client
+
+@st.cache_resource(show_spinner=False)
+def get_llm_gateway(api_key=None):
+    """The process-wide gateway for an API key, with limits from HR_BOT_LLM_* environment variables"""
+    return LLMGateway(
+        get_upstream_client(api_key),
+        max_concurrency=int(os.environ.get("HR_BOT_LLM_MAX_CONCURRENCY", "8")),
+        requests_per_minute=int(os.environ.get("HR_BOT_LLM_REQUESTS_PER_MINUTE", "300")),
+        tokens_per_minute=int(os.environ.get("HR_BOT_LLM_TOKENS_PER_MINUTE", "80000"))
+    )
@@ -0,0 +1,245 @@
+# utils/llm_replay.py
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+from utils.vector_index import extract_features
+
+STREAM_PIECE_RE = re.compile(r'\S+\s*|\s+')
+
+def request_key(kwargs):
+    """Identify a request by model and messages; sampling and transport options don't change what was asked"""
+    request = {"model": kwargs.get("model"), "messages": kwargs.get("messages", [])}
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def make_completion(content, model=None, finish_reason="stop"):
+    """Build an object shaped like the SDK's ChatCompletion"""
+    message = SimpleNamespace(role="assistant", content=content)
+    return SimpleNamespace(
+        id=f"chatcmpl-replay-{int(time.time() * 1000)}",
+        object="chat.completion",
+        model=model,
+        choices=[SimpleNamespace(index=0, message=message, finish_reason=finish_reason)],
+        usage=None
+    )
+
+def make_chunk(content, model=None, finish_reason=None):
+    """Build an object shaped like the SDK's ChatCompletionChunk"""
+    delta = SimpleNamespace(role="assistant", content=content)
+    return SimpleNamespace(
+        id="chatcmpl-replay",
+        object="chat.completion.chunk",
+        model=model,
+        choices=[SimpleNamespace(index=0, delta=delta, finish_reason=finish_reason)]
+    )
+
+class LatencyModel:
+    """Samples response timing: a time-to-first-token distribution followed by a steady token rate"""
+
+    DISTRIBUTIONS = ("recorded", "fixed", "uniform", "normal", "lognormal")
+
+    def __init__(self, distribution="recorded", median=0.8, spread=0.5, tokens_per_second=40, seed=None):
+        """Initialize with a distribution name, its median (seconds) and spread, and the streaming token rate"""
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.distribution = distribution
+        self.median = median
+        self.spread = spread
+        self.tokens_per_second = tokens_per_second
+        # Seeded so benchmark runs see the same sequence of delays
+        self.random = random.Random(seed)
+
+    @classmethod
+    def from_spec(cls, spec, seed=None):
+        """Parse "distribution[:median[:spread[:tokens_per_second]]]", e.g. "lognormal:0.8:0.5:40" """
+        parts = (spec or "recorded").split(":")
+        numbers = [float(part) for part in parts[1:]]
+        defaults = [0.8, 0.5, 40]
+        median, spread, tokens_per_second = numbers + defaults[len(numbers):]
+        return cls(parts[0], median, spread, tokens_per_second, seed)
+
+    def sample_first_token(self, recorded=None):
+        """Seconds until the first token; 'recorded' uses the recorded value when there is one"""
+        distribution = self.distribution
+        if distribution == "recorded":
+            if recorded is not None:
+                return recorded
+            distribution = "lognormal"
+        if distribution == "fixed":
+            return self.median
+        if distribution == "uniform":
+            return self.random.uniform(max(0.0, self.median - self.spread), self.median + self.spread)
+        if distribution == "normal":
+            return max(0.0, self.random.gauss(self.median, self.spread))
+        # Lognormal has the long right tail real API latencies show
+        return self.median * math.exp(self.random.gauss(0, self.spread))
+
+    def sample_total(self, content, recorded_total=None, recorded_first_token=None):
+        """Seconds for a whole non-streamed response"""
+        if self.distribution == "recorded" and recorded_total is not None:
+            return recorded_total
+        return self.sample_first_token(recorded_first_token) + self.estimate_tokens(content) * self.token_delay()
+
+    def token_delay(self):
+        """Seconds between streamed tokens"""
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def estimate_tokens(self, text):
+        """Rough token count of a response"""
+        return max(1, len(text or "") // 4)
+
+class Cassette:
+    """Recorded requests and responses, stored one JSON object per line"""
+
+    def __init__(self, path):
+        """Load the recordings at path, if any"""
+        self.path = path
+        self.entries = []
+        self.by_key = {}
+        self._features = []
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _prompt_shape(self, messages):
+        """The start of the system message, which identifies which code path made the request"""
+        system = next((message.get("content") or "" for message in messages if message.get("role") == "system"), "")
+        return system[:80]
+
+    def _last_user_message(self, messages):
+        """The latest user message, which carries what varies between requests of the same kind"""
+        return next((message.get("content") or "" for message in reversed(messages) if message.get("role") == "user"), "")
+
+    def _vectorize(self, messages):
+        """Feature counts and norm of the latest user message"""
+        features = Counter(extract_features(self._last_user_message(messages)[:4000]))
+        return features, math.sqrt(sum(count * count for count in features.values()))
+
+    def _index(self, entry):
+        """Add an entry to the lookup structures"""
+        self.entries.append(entry)
+        self.by_key[entry["key"]] = entry
+        self._features.append(self._vectorize(entry["messages"]))
+
+    def add(self, kwargs, content, first_token, total, streamed):
+        """Record a completed request and append it to the file"""
+        entry = {
+            "key": request_key(kwargs),
+            "model": kwargs.get("model"),
+            "messages": kwargs.get("messages", []),
+            "content": content,
+            "first_token": first_token,
+            "total": total,
+            "stream": streamed,
+            "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        with self._lock:
+            self._index(entry)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def find(self, kwargs):
+        """Return the exact recording for a request, or the most similar one from the same code path and model"""
+        entry = self.by_key.get(request_key(kwargs))
+        if entry:
+            return entry
+
+        # Prompts embed the date and employee details, so exact matches often miss; fall back to the
+        # recording of the same kind of request whose question is most similar
+        messages = kwargs.get("messages", [])
+        shape = self._prompt_shape(messages)
+        features, norm = self._vectorize(messages)
+        best, best_rank = None, None
+        for candidate, (candidate_features, candidate_norm) in zip(self.entries, self._features):
+            if candidate["model"] != kwargs.get("model"):
+                continue
+            dot = sum(count * candidate_features.get(feature, 0) for feature, count in features.items())
+            similarity = dot / (norm * candidate_norm) if norm and candidate_norm else 0.0
+            rank = (self._prompt_shape(candidate["messages"]) == shape, similarity)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = candidate, rank
+        return best
+
+class RecordingClient:
+    """Wraps a chat client and records every completion to a cassette"""
+
+    def __init__(self, client, cassette):
+        """Initialize with the client to call and the cassette to record into"""
+        self.client = client
+        self.cassette = cassette
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        """Call the wrapped client and record the response and its timing"""
+        start_time = time.time()
+        response = self.client.chat.completions.create(**kwargs)
+        if not kwargs.get("stream") or hasattr(response, "choices"):
+            # A whole response only tells us the total time, not when the first token was ready
+            content = response.choices[0].message.content
+            self.cassette.add(kwargs, content, None, time.time() - start_time, streamed=False)
+            return response
+
+        def chunks():
+            parts = []
+            first_token = None
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token is None:
+                        first_token = time.time() - start_time
+                    parts.append(chunk.choices[0].delta.content)
+                yield chunk
+            self.cassette.add(kwargs, "".join(parts), first_token, time.time() - start_time, streamed=True)
+
+        return chunks()
+
+class ReplayClient:
+    """Stands in for an OpenAI client, answering from a cassette with simulated latency"""
+
+    DEFAULT_CONTENT = "This is a replayed response; no recording matched the request."
+
+    def __init__(self, cassette, latency=None):
+        """Initialize with a cassette and a LatencyModel"""
+        self.cassette = cassette
+        self.latency = latency or LatencyModel()
+        self.chat = self
+        self.completions = self
+        self.stats = Counter()
+
+    def lookup(self, kwargs):
+        """Return the recording to answer a request with, counting exact, similar and missing matches"""
+        entry = self.cassette.find(kwargs)
+        if entry is None:
+            self.stats["misses"] += 1
+            return {"content": self.DEFAULT_CONTENT}
+        self.stats["exact" if entry["key"] == request_key(kwargs) else "similar"] += 1
+        return entry
+
+    def create(self, **kwargs):
+        """Return a recorded completion after a sampled delay, streamed token by token when requested"""
+        entry = self.lookup(kwargs)
+        content = entry["content"]
+        model = kwargs.get("model")
+
+        if not kwargs.get("stream"):
+            time.sleep(self.latency.sample_total(content, entry.get("total"), entry.get("first_token")))
+            return make_completion(content, model)
+
+        def chunks():
+            time.sleep(self.latency.sample_first_token(entry.get("first_token")))
+            for piece in STREAM_PIECE_RE.findall(content):
+                yield make_chunk(piece, model)
+                time.sleep(self.latency.estimate_tokens(piece) * self.latency.token_delay())
+            yield make_chunk(None, model, finish_reason="stop")
+
+        return chunks()
@@ -0,0 +1,151 @@
+# utils/llm_stub_server.py
+# Run from the app directory as a module, so the utils package is importable: python -m utils.llm_stub_server
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.llm_replay import Cassette, LatencyModel, ReplayClient, STREAM_PIECE_RE
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """Serves /v1/chat/completions in the OpenAI wire format, streamed or not"""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    # Headers and body go out in separate writes; with Nagle's algorithm each response would wait on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        # Per-request logging would dominate the output of a load test
+        pass
+
+    def _send_json(self, status, body):
+        """Send a JSON response"""
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_event(self, body):
+        """Send one server-sent event as an HTTP chunk"""
+        data = f"data: {body if isinstance(body, str) else json.dumps(body)}\n\n".encode('utf-8')
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        """Answer a chat completion request from the cassette after a simulated delay"""
+        server = self.server
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with server.stats_lock:
+            server.stats["requests"] += 1
+
+        if server.error_rate and server.random.random() < server.error_rate:
+            with server.stats_lock:
+                server.stats["errors"] += 1
+            self._send_json(500, {"error": {"message": "Injected stub server error", "type": "server_error"}})
+            return
+
+        entry = server.replay.lookup(request)
+        content = entry["content"]
+        model = request.get("model")
+        created = int(time.time())
+        completion_id = f"chatcmpl-stub-{server.stats['requests']}"
+
+        if not request.get("stream"):
+            time.sleep(server.latency.sample_total(content, entry.get("total"), entry.get("first_token")))
+            tokens = server.latency.estimate_tokens(content)
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens}
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+
+        time.sleep(server.latency.sample_first_token(entry.get("first_token")))
+        self._send_event(chunk({"role": "assistant", "content": ""}))
+        for piece in STREAM_PIECE_RE.findall(content):
+            self._send_event(chunk({"content": piece}))
+            time.sleep(server.latency.estimate_tokens(piece) * server.latency.token_delay())
+        self._send_event(chunk({}, "stop"))
+        self._send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+class StubServer(ThreadingHTTPServer):
+    """Local OpenAI-compatible server that replays a cassette with configurable latency and error rate"""
+
+    daemon_threads = True
+
+    def __init__(self, cassette_path, latency=None, error_rate=0.0, host="127.0.0.1", port=0, seed=None):
+        """Initialize with a cassette path, LatencyModel and the share of requests to fail with a 500; port 0 picks a free port"""
+        super().__init__((host, port), StubRequestHandler)
+        self.latency = latency or LatencyModel(seed=seed)
+        self.replay = ReplayClient(Cassette(cassette_path), self.latency)
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "errors": 0}
+        self.stats_lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        """URL to use as the OpenAI base_url"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def handle_error(self, request, client_address):
+        """Ignore clients closing pooled connections; report anything else"""
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def start(self):
+        """Serve in a background thread and return the server"""
+        self.thread = threading.Thread(target=self.serve_forever, name="llm-stub-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        self.shutdown()
+        self.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve recorded LLM responses on an OpenAI-compatible endpoint; run from the app directory as python -m utils.llm_stub_server")
+    parser.add_argument("--cassette", default="data/llm_cassettes/default.jsonl", help="recordings made with HR_BOT_LLM_RECORD")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="recorded", help='distribution[:median[:spread[:tokens_per_second]]], e.g. "lognormal:0.8:0.5:40"')
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500 error")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = StubServer(args.cassette, LatencyModel.from_spec(args.latency, args.seed), args.error_rate, port=args.port, seed=args.seed)
+    print(f"Serving {len(server.replay.cassette.entries)} recordings at {server.base_url} (set OPENAI_BASE_URL to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,145 @@
+# utils/ocr_engine.py
+import os
+import json
+import hashlib
+import PyPDF2
+from concurrent.futures import ProcessPoolExecutor
+
+def _ocr_page(pdf_path, page_num, dpi):
+    """Render a single page and run Tesseract on it (runs in worker processes)"""
+    from pdf2image import convert_from_path
+    import pytesseract
+
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page_num + 1, last_page=page_num + 1)
+    return pytesseract.image_to_string(images[0]) if images else ""
+
+class OCREngine:
+    """OCR for image-only PDF pages with a page-level result cache"""
+
+    # Bump when rendering or OCR settings change so cached page text is redone
+    OCR_VERSION = "1"
+
+    # Aim for roughly this many pixels on the long side of the rendered page
+    TARGET_PIXELS = 3000
+    MIN_DPI = 150
+    MAX_DPI = 400
+
+    def __init__(self, cache_dir="data/ocr_cache", max_workers=None):
+        """Initialize with the directory for cached page text"""
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    def is_available(self):
+        """Check that pdf2image, pytesseract and the tesseract binary are usable"""
+        try:
+            import pdf2image
+            import pytesseract
+            pytesseract.get_tesseract_version()
+            return True
+        except Exception:
+            return False
+
+    def get_dpi(self, page):
+        """Pick a render DPI so small and large pages end up with similar pixel sizes"""
+        try:
+            long_side_inches = max(float(page.mediabox.width), float(page.mediabox.height)) / 72
+            dpi = int(self.TARGET_PIXELS / long_side_inches)
+        except Exception:
+            dpi = 300
+        return max(self.MIN_DPI, min(self.MAX_DPI, dpi))
+
+    def get_page_hash(self, page):
+        """Hash a page's content stream and images so identical pages share a cache entry"""
+        sha256 = hashlib.sha256(self.OCR_VERSION.encode())
+        contents = page.get_contents()
+        if contents is not None:
+            sha256.update(contents.get_data())
+
+        resources = page.get("/Resources")
+        xobjects = resources.get_object().get("/XObject") if resources else None
+        if xobjects:
+            for name, xobject in sorted(xobjects.get_object().items()):
+                sha256.update(name.encode())
+                stream = xobject.get_object()
+                sha256.update(getattr(stream, "_data", b"") or b"")
+
+        sha256.update(f"{page.mediabox.width}x{page.mediabox.height}".encode())
+        return sha256.hexdigest()
+
+    def _get_cache_path(self, page_hash):
+        """Get the cache file for a page hash"""
+        return os.path.join(self.cache_dir, f"{page_hash}.json")
+
+    def _read_cache(self, page_hash):
+        """Return cached text for a page, or None"""
+        cache_path = self._get_cache_path(page_hash)
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)['text']
+        except Exception as e:
+            print(f"Error reading OCR cache {cache_path}: {e}")
+            return None
+
+    def _write_cache(self, page_hash, text, dpi):
+        """Store OCR text for a page"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            cache_path = self._get_cache_path(page_hash)
+            temp_path = cache_path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'ocr_version': self.OCR_VERSION, 'dpi': dpi, 'text': text}, f)
+            os.replace(temp_path, cache_path)
+        except Exception as e:
+            print(f"Error writing OCR cache for page {page_hash}: {e}")
+
+    def ocr_pages(self, pdf_path, page_numbers):
+        """OCR the given pages, returning {page_num: text}; cached pages are not re-run"""
+        page_numbers = list(page_numbers)
+        if not page_numbers:
+            return {}
+
+        results = {}
+        pending = []  # (page_num, page_hash, dpi)
+        try:
+            with open(pdf_path, 'rb') as file:
+                pdf_reader = PyPDF2.PdfReader(file)
+                for page_num in page_numbers:
+                    page = pdf_reader.pages[page_num]
+                    page_hash = self.get_page_hash(page)
+                    cached_text = self._read_cache(page_hash)
+                    if cached_text is not None:
+                        results[page_num] = cached_text
+                    else:
+                        pending.append((page_num, page_hash, self.get_dpi(page)))
+        except Exception as e:
+            print(f"Error preparing OCR for {pdf_path}: {e}")
+            return results
+
+        if not pending:
+            return results
+
+        if not self.is_available():
+            print("OCR unavailable. Install pdf2image, pytesseract and the tesseract binary to OCR scanned pages.")
+            return results
+
+        # Rendering and OCR are CPU bound, so spread pages across processes
+        try:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+                futures = {
+                    executor.submit(_ocr_page, pdf_path, page_num, dpi): (page_num, page_hash, dpi)
+                    for page_num, page_hash, dpi in pending
+                }
+                for future, (page_num, page_hash, dpi) in futures.items():
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        print(f"Error running OCR on page {page_num + 1} of {pdf_path}: {e}")
+                        continue
+                    results[page_num] = text
+                    self._write_cache(page_hash, text, dpi)
+        except Exception as e:
+            print(f"Error running OCR pool for {pdf_path}: {e}")
+
+        return results
@@ -0,0 +1,47 @@
+# utils/openai_client.py
+import os
+import streamlit as st
+from openai import OpenAI
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+class OpenAIClientFactory:
+    """Builds OpenAI clients that keep connections alive between requests, with timeouts and retries"""
+
+    def __init__(self, api_key=None, timeout=None, connect_timeout=None, max_retries=None, max_connections=None, keepalive_expiry=None, base_url=None):
+        """Initialize with client settings; anything not given comes from HR_BOT_OPENAI_* environment variables"""
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
+        # Point at a local OpenAI-compatible server for testing; None uses the SDK default
+        self.base_url = base_url or os.environ.get("OPENAI_BASE_URL")
+        self.timeout = timeout or float(os.environ.get("HR_BOT_OPENAI_TIMEOUT", "60"))
+        self.connect_timeout = connect_timeout or float(os.environ.get("HR_BOT_OPENAI_CONNECT_TIMEOUT", "5"))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get("HR_BOT_OPENAI_MAX_RETRIES", "3"))
+        self.max_connections = max_connections or int(os.environ.get("HR_BOT_OPENAI_MAX_CONNECTIONS", "20"))
+        # Chat turns are often more than httpx's default 5 seconds apart; keep idle connections long enough to reuse them
+        self.keepalive_expiry = keepalive_expiry or float(os.environ.get("HR_BOT_OPENAI_KEEPALIVE", "120"))
+
+    def create(self):
+        """Create a client; the SDK retries connection errors, 429s and 5xx responses with jittered exponential backoff"""
+        if httpx is None:
+            # Without httpx to configure, the SDK's own pooled client is still reused by every caller
+            return OpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, max_retries=self.max_retries)
+
+        timeout = httpx.Timeout(self.timeout, connect=self.connect_timeout)
+        http_client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            follow_redirects=True
+        )
+        return OpenAI(api_key=self.api_key, base_url=self.base_url, timeout=timeout, max_retries=self.max_retries, http_client=http_client)
+
+@st.cache_resource(show_spinner=False)
+def get_shared_openai_client(api_key=None):
+    """The process-wide OpenAI client for an API key, created on first use and shared by every page and thread"""
+    return OpenAIClientFactory(api_key=api_key).create()
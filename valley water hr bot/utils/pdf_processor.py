@@ -2,29 +2,78 @@ import os
 import PyPDF2
 import tempfile
 import re
-import streamlit as st
-import sys
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+from utils.bm25_index import BM25Index
+from utils.vector_index import VectorIndex
+from utils.ocr_engine import OCREngine
+from utils.document_chunker import DocumentChunker
+
+def _extract_pages_with_pypdf2(pdf_path, page_numbers):
+    """Extract text for a batch of pages with PyPDF2 (runs in worker processes)"""
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        texts = []
+        for page_num in page_numbers:
+            try:
+                texts.append(pdf_reader.pages[page_num].extract_text() or "")
+            except Exception as e:
+                print(f"Error extracting page {page_num + 1} with PyPDF2 from {pdf_path}: {e}")
+                texts.append("")
+        return texts
+
+def _extract_pages_with_pdfplumber(pdf_path, page_numbers):
+    """Extract text for a batch of pages with pdfplumber (runs in worker processes)"""
+    try:
+        import pdfplumber
+    except ImportError:
+        print("pdfplumber not installed. Install with: pip install pdfplumber")
+        return ["" for _ in page_numbers]
+    
+    with pdfplumber.open(pdf_path) as pdf:
+        texts = []
+        for page_num in page_numbers:
+            try:
+                texts.append(pdf.pages[page_num].extract_text() or "")
+            except Exception as e:
+                print(f"Error extracting page {page_num + 1} with pdfplumber from {pdf_path}: {e}")
+                texts.append("")
+        return texts
 
 class PDFProcessor:
     """Class to handle PDF processing operations with enhanced extraction"""
     
-    def __init__(self, pdf_dir="data/pdfs"):
+    # Bump whenever extraction or normalization changes so cached text is re-extracted
+    EXTRACTOR_VERSION = "4"
+    
+    # Documents with fewer pages are extracted in-process; the pool startup isn't worth it
+    PARALLEL_MIN_PAGES = 16
+    
+    # Search indexes shared across page reruns, keyed by document text or file hash
+    _search_indexes = {}
+    
+    def __init__(self, pdf_dir="data/pdfs", index_dir="data/indexes", cache_dir="data/extraction_cache", max_workers=None, ocr_engine=None):
         """Initialize with directory containing PDF files"""
         self.pdf_dir = pdf_dir
+        self.index_dir = index_dir
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.ocr_engine = ocr_engine or OCREngine(max_workers=self.max_workers)
+        self.chunker = DocumentChunker(normalize=self.normalize_text)
         # Create directory if it doesn't exist
         os.makedirs(pdf_dir, exist_ok=True)
     
+    def get_page_count(self, pdf_path):
+        """Get the number of pages in a PDF"""
+        with open(pdf_path, 'rb') as file:
+            return len(PyPDF2.PdfReader(file).pages)
+    
     def extract_text_from_file(self, pdf_path):
         """Extract text from a PDF file using PyPDF2"""
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    page_text = page.extract_text() or ""
-                    text += page_text + "\n\n"
-                return text
+            pages = _extract_pages_with_pypdf2(pdf_path, range(self.get_page_count(pdf_path)))
+            return "\n\n".join(pages)
         except Exception as e:
             print(f"Error extracting text with PyPDF2 from {pdf_path}: {e}")
             return ""
@@ -34,11 +83,7 @@ class PDFProcessor:
         try:
             import pdfplumber
             with pdfplumber.open(pdf_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    page_text = page.extract_text() or ""
-                    text += page_text + "\n\n"
-                return text
+                return "\n\n".join(page.extract_text() or "" for page in pdf.pages)
         except ImportError:
             print("pdfplumber not installed. Install with: pip install pdfplumber")
             return ""
@@ -46,14 +91,60 @@ class PDFProcessor:
             print(f"Error extracting text with pdfplumber from {pdf_path}: {e}")
             return ""
     
+    def _extract_page_batches(self, extract_func, pdf_path, page_numbers):
+        """Run a page extractor over page batches, across processes for large documents"""
+        page_numbers = list(page_numbers)
+        if not page_numbers:
+            return {}
+        
+        if len(page_numbers) >= self.PARALLEL_MIN_PAGES and self.max_workers > 1:
+            # Contiguous batches, one per worker, so each process opens the file once
+            num_batches = min(self.max_workers, len(page_numbers))
+            batch_size = -(-len(page_numbers) // num_batches)
+            batches = [page_numbers[i:i + batch_size] for i in range(0, len(page_numbers), batch_size)]
+            try:
+                with ProcessPoolExecutor(max_workers=len(batches)) as executor:
+                    results = executor.map(extract_func, [pdf_path] * len(batches), batches)
+                    return {
+                        page_num: text
+                        for batch, texts in zip(batches, results)
+                        for page_num, text in zip(batch, texts)
+                    }
+            except Exception as e:
+                print(f"Parallel extraction failed for {pdf_path}, falling back to serial: {e}")
+        
+        try:
+            return dict(zip(page_numbers, extract_func(pdf_path, page_numbers)))
+        except Exception as e:
+            print(f"Error extracting pages from {pdf_path}: {e}")
+            return {}
+    
+    def extract_pages(self, pdf_path, use_ocr=False):
+        """Extract text page by page, falling back to pdfplumber (then OCR) only for empty pages"""
+        try:
+            page_count = self.get_page_count(pdf_path)
+        except Exception as e:
+            print(f"Error reading {pdf_path} with PyPDF2: {e}")
+            # PyPDF2 can't open the file at all, so let pdfplumber handle the whole document
+            return [self.extract_text_with_pdfplumber(pdf_path)]
+        
+        pages = self._extract_page_batches(_extract_pages_with_pypdf2, pdf_path, range(page_count))
+        
+        empty_pages = [page_num for page_num in range(page_count) if not pages.get(page_num, "").strip()]
+        if empty_pages:
+            pages.update(self._extract_page_batches(_extract_pages_with_pdfplumber, pdf_path, empty_pages))
+        
+        # Pages with no text layer at all are scanned images
+        if use_ocr:
+            image_pages = [page_num for page_num in empty_pages if not pages.get(page_num, "").strip()]
+            pages.update(self.ocr_engine.ocr_pages(pdf_path, image_pages))
+        
+        return [pages.get(page_num, "") for page_num in range(page_count)]
+    
     def enhanced_extract_text(self, pdf_path, use_ocr=False):
         """Extract text with multiple methods for best results"""
-        # Try PyPDF2 first
-        text = self.extract_text_from_file(pdf_path)
-        
-        # If text is too short, try pdfplumber as fallback
-        if len(text.strip()) < 200:  # Arbitrary threshold to detect failed extraction
-            text = self.extract_text_with_pdfplumber(pdf_path)
+        # Assemble pages with a single join rather than repeated concatenation
+        text = "\n\n".join(self.extract_pages(pdf_path, use_ocr))
         
         # Normalize and clean up the text
         return self.normalize_text(text)
@@ -90,7 +181,7 @@ class PDFProcessor:
                 temp_path = temp_file.name
             
             # Extract text from the temporary file
-            text = self.enhanced_extract_text(temp_path)
+            text = self.cached_extract_text(temp_path)
             
             # Clean up the temporary file
             os.unlink(temp_path)
@@ -100,6 +191,73 @@ class PDFProcessor:
             print(f"Error processing uploaded PDF: {e}")
             return ""
     
+    def get_file_hash(self, pdf_path):
+        """Compute the SHA-256 of a file's contents"""
+        sha256 = hashlib.sha256()
+        with open(pdf_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(block)
+        return sha256.hexdigest()
+    
+    def get_cache_path(self, file_hash, use_ocr=False):
+        """Get the extraction cache path for a content hash and the current extractor version"""
+        suffix = "_ocr" if use_ocr else ""
+        return os.path.join(self.cache_dir, f"{file_hash}_v{self.EXTRACTOR_VERSION}{suffix}.json")
+    
+    def _extract_record(self, pdf_path, use_ocr=False):
+        """Extract normalized text along with the raw pages and the pages that yielded no text"""
+        pages = self.extract_pages(pdf_path, use_ocr)
+        return {
+            'text': self.normalize_text("\n\n".join(pages)),
+            'pages': pages,
+            'empty_pages': [page_num for page_num, page_text in enumerate(pages) if not page_text.strip()]
+        }
+    
+    def get_cached_extraction(self, pdf_path, use_ocr=False):
+        """Get {'text', 'pages', 'empty_pages'} for a PDF, reusing the on-disk cache keyed by content hash"""
+        try:
+            cache_path = self.get_cache_path(self.get_file_hash(pdf_path), use_ocr)
+        except Exception as e:
+            print(f"Error hashing {pdf_path}: {e}")
+            return self._extract_record(pdf_path, use_ocr)
+        
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Error reading extraction cache {cache_path}: {e}")
+        
+        record = self._extract_record(pdf_path, use_ocr)
+        
+        # Only cache successful extractions so failures are retried next time
+        if record['text'] or record['empty_pages']:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                temp_path = cache_path + ".tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(dict(record, extractor_version=self.EXTRACTOR_VERSION, source=os.path.basename(pdf_path)), f)
+                os.replace(temp_path, cache_path)
+            except Exception as e:
+                print(f"Error writing extraction cache {cache_path}: {e}")
+        
+        return record
+    
+    def cached_extract_text(self, pdf_path, use_ocr=False):
+        """Extract normalized text, reusing the on-disk cache keyed by content hash"""
+        return self.get_cached_extraction(pdf_path, use_ocr)['text']
+    
+    def invalidate_cached_text(self, pdf_path):
+        """Remove the cached extractions for the current contents of a file"""
+        try:
+            file_hash = self.get_file_hash(pdf_path)
+            for use_ocr in (False, True):
+                cache_path = self.get_cache_path(file_hash, use_ocr)
+                if os.path.exists(cache_path):
+                    os.remove(cache_path)
+        except Exception as e:
+            print(f"Error invalidating extraction cache for {pdf_path}: {e}")
+    
     def get_available_pdfs(self):
         """Get a list of available PDFs in the pdf_dir"""
         if not os.path.exists(self.pdf_dir):
@@ -129,6 +287,10 @@ class PDFProcessor:
         # Create full path
         file_path = os.path.join(self.pdf_dir, filename)
         
+        # Drop the cached text of the file being replaced
+        if os.path.exists(file_path):
+            self.invalidate_cached_text(file_path)
+        
         # Save the file
         try:
             with open(file_path, "wb") as f:
@@ -138,55 +300,122 @@ class PDFProcessor:
             print(f"Error saving PDF: {e}")
             return None
     
-    def load_pdf_content(self, filename=None, uploaded_file=None):
+    def load_pdf_content(self, filename=None, uploaded_file=None, use_ocr=False):
         """Load PDF content either from a file in pdf_dir or an uploaded file"""
         if uploaded_file:
             return self.extract_text_from_uploaded_file(uploaded_file)
         elif filename:
             file_path = self.get_pdf_path(filename)
             if os.path.exists(file_path):
-                return self.enhanced_extract_text(file_path)
+                text = self.cached_extract_text(file_path, use_ocr)
+                # Build the search indexes once at ingest time
+                self.get_document_search_index(file_path, use_ocr)
+                self.get_document_vector_index(file_path, use_ocr)
+                return text
         return ""
     
-    def get_relevant_chunks(self, question, text, num_chunks=3, chunk_size=1000, overlap=100):
-        """Find the most relevant chunks of the document for a specific question"""
-        if not text:
-            return ""
-        
-        # Create overlapping chunks for better context
+    def chunk_text(self, text, chunk_size=1000, overlap=100):
+        """Split text into overlapping chunks for retrieval"""
         chunks = []
         for i in range(0, len(text), chunk_size - overlap):
             chunk = text[i:i + chunk_size]
             if len(chunk) > 200:  # Only keep chunks with substantial content
                 chunks.append(chunk)
+        return chunks
+    
+    def get_document_chunks(self, pdf_path, use_ocr=False):
+        """Split a PDF into heading-aware chunks carrying section and page metadata"""
+        extraction = self.get_cached_extraction(pdf_path, use_ocr)
+        return self.chunker.chunk_pages(extraction.get('pages') or [extraction['text']])
+    
+    def _get_index(self, index_class, prefix, extension, key_parts, get_chunks):
+        """Load or build an index of the given class; get_chunks returns (texts, metadata)"""
+        cache_key = (prefix,) + tuple(key_parts)
+        if cache_key in self._search_indexes:
+            return self._search_indexes[cache_key]
+        
+        # Indexes on disk are keyed by a hash of everything that determines their chunks
+        key_hash = hashlib.sha256(":".join(str(part) for part in key_parts).encode('utf-8')).hexdigest()
+        index_path = os.path.join(self.index_dir, f"{prefix}_{key_hash}.{extension}")
+        
+        index = None
+        if os.path.exists(index_path):
+            try:
+                index = index_class.load(index_path)
+            except Exception as e:
+                print(f"Error loading search index {index_path}: {e}")
         
-        if not chunks:
+        if index is None:
+            index = index_class().build(*get_chunks())
+            if index.chunks:
+                try:
+                    index.save(index_path)
+                except Exception as e:
+                    print(f"Error saving search index {index_path}: {e}")
+        
+        self._search_indexes[cache_key] = index
+        return index
+    
+    def _get_text_index(self, index_class, prefix, extension, text, chunk_size, overlap):
+        """Load or build an index over fixed-size chunks of a piece of text"""
+        return self._get_index(
+            index_class, prefix, extension, (chunk_size, overlap, text),
+            lambda: (self.chunk_text(text, chunk_size, overlap), None)
+        )
+    
+    def _get_document_index(self, index_class, prefix, extension, pdf_path, use_ocr):
+        """Load or build an index over the heading-aware chunks of a PDF"""
+        key_parts = (self.get_file_hash(pdf_path), self.EXTRACTOR_VERSION, DocumentChunker.CHUNKER_VERSION, use_ocr)
+        
+        def get_chunks():
+            chunks = self.get_document_chunks(pdf_path, use_ocr)
+            metadata = [{key: value for key, value in chunk.items() if key != 'text'} for chunk in chunks]
+            return [chunk['text'] for chunk in chunks], metadata
+        
+        return self._get_index(index_class, f"{prefix}_doc", extension, key_parts, get_chunks)
+    
+    def get_search_index(self, text, chunk_size=1000, overlap=100):
+        """Get the BM25 keyword index for a document, loading or building it as needed"""
+        return self._get_text_index(BM25Index, "bm25", "json", text, chunk_size, overlap)
+    
+    def get_vector_index(self, text, chunk_size=1000, overlap=100):
+        """Get the semantic vector index for a document, loading or building it as needed"""
+        return self._get_text_index(VectorIndex, "vectors", "npz", text, chunk_size, overlap)
+    
+    def get_document_search_index(self, pdf_path, use_ocr=False):
+        """Get the BM25 index over a PDF's section-aware chunks"""
+        return self._get_document_index(BM25Index, "bm25", "json", pdf_path, use_ocr)
+    
+    def get_document_vector_index(self, pdf_path, use_ocr=False):
+        """Get the vector index over a PDF's section-aware chunks"""
+        return self._get_document_index(VectorIndex, "vectors", "npz", pdf_path, use_ocr)
+    
+    def get_semantic_chunks(self, question, text, num_chunks=4, min_score=0.05, chunk_size=1000, overlap=100):
+        """Find semantically relevant chunks with the local vector index (no API call)"""
+        if not text:
+            return ""
+        
+        index = self.get_vector_index(text, chunk_size, overlap)
+        top_chunks = index.get_chunks(question, num_chunks, min_score=min_score)
+        
+        # Empty result lets callers fall back to keyword retrieval
+        return "\n\n==========\n\n".join(top_chunks)
+    
+    def get_relevant_chunks(self, question, text, num_chunks=3, chunk_size=1000, overlap=100):
+        """Find the most relevant chunks of the document for a specific question"""
+        if not text:
+            return ""
+        
+        index = self.get_search_index(text, chunk_size, overlap)
+        
+        if not index.chunks:
             return text
         
-        # Convert question to lowercase and tokenize to keywords
-        question_lower = question.lower()
-        # Remove common stop words
-        stop_words = {'a', 'an', 'the', 'is', 'are', 'do', 'does', 'what', 'when', 'where', 'how', 'why', 'who'}
-        keywords = [word for word in re.findall(r'\b\w+\b', question_lower) if word not in stop_words]
-        
-        # Score chunks based on keyword matching
-        scores = []
-        for chunk in chunks:
-            chunk_lower = chunk.lower()
-            # Count occurrences of each keyword
-            score = sum(chunk_lower.count(keyword) for keyword in keywords)
-            # Bonus for chunks that contain multiple keywords
-            unique_keywords = sum(1 for keyword in keywords if keyword in chunk_lower)
-            score += unique_keywords * 2  # Weight for diversity of keywords
-            scores.append(score)
+        top_chunks = index.get_chunks(question, num_chunks)
         
         # If no good matches, return first chunks as default
-        if max(scores) == 0:
-            return "\n\n".join(chunks[:num_chunks])
-        
-        # Get top chunks
-        top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:num_chunks]
-        top_chunks = [chunks[i] for i in top_indices]
+        if not top_chunks:
+            return "\n\n".join(index.chunks[:num_chunks])
         
         # Return the most relevant chunks, joined with separators
         return "\n\n==========\n\n".join(top_chunks)
@@ -217,7 +446,6 @@ class PDFProcessor:
         
         return holidays
 
-    @st.cache_data
     def cached_load_pdf_content(self, filename=None, uploaded_file=None):
-        """Cached version for Streamlit to avoid reprocessing PDFs"""
+        """Cached version to avoid reprocessing PDFs (text is cached on disk by content hash)"""
         return self.load_pdf_content(filename, uploaded_file)
\ No newline at end of file
@@ -0,0 +1,176 @@
+# utils/prompt_builder.py
+import math
+import re
+from utils.conversation_summarizer import ConversationSummarizer
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+class PromptBuilder:
+    """Assembles chat messages for the model within a token budget"""
+
+    # Marks where retrieved document content goes in the system message
+    CONTEXT_PLACEHOLDER = "<<RELEVANT_CONTENT>>"
+    CONTEXT_SEPARATOR = "\n\n==========\n\n"
+
+    # Chat formatting adds a few tokens per message and primes the reply
+    TOKENS_PER_MESSAGE = 4
+    REPLY_PRIMING_TOKENS = 3
+
+    # An answer without any document content is worse than a prompt slightly over budget
+    MIN_CONTEXT_TOKENS = 300
+
+    def __init__(self, max_prompt_tokens=6000, max_context_chunks=4, max_history_messages=10,
+                 context_share=0.6, duplicate_threshold=0.8, model="gpt-4"):
+        """Initialize with the prompt budget, retrieval/history limits and the share of the budget documents may use"""
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_context_chunks = max_context_chunks
+        self.max_history_messages = max_history_messages
+        self.context_share = context_share
+        self.duplicate_threshold = duplicate_threshold
+        self.summarizer = ConversationSummarizer(max_length=160)
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except Exception as e:
+                print(f"Error loading tokenizer for {model}, estimating token counts: {e}")
+
+    def count_tokens(self, text):
+        """Count tokens exactly with tiktoken if available, otherwise estimate them"""
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        # Common words are one token, long ones split into pieces of roughly four characters
+        return sum(1 if len(piece) <= 4 else math.ceil(len(piece) / 4) for piece in TOKEN_PIECE_RE.findall(text))
+
+    def count_message_tokens(self, messages):
+        """Tokens a list of chat messages takes up in the prompt"""
+        return sum(self.TOKENS_PER_MESSAGE + self.count_tokens(message["content"]) for message in messages) + self.REPLY_PRIMING_TOKENS
+
+    def _shingles(self, text):
+        """Word trigrams used to detect overlapping chunks"""
+        words = re.findall(r'\w+', text.lower())
+        return {tuple(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+
+    def dedupe_chunks(self, chunks):
+        """Drop chunks whose text is mostly contained in a higher-ranked chunk"""
+        kept = []
+        kept_shingles = []
+        for chunk in chunks:
+            # The first line is the source label, which differs even for identical text
+            shingles = self._shingles(chunk.split("\n", 1)[-1])
+            if any(len(shingles & other) >= self.duplicate_threshold * len(shingles) for other in kept_shingles):
+                continue
+            kept.append(chunk)
+            kept_shingles.append(shingles)
+        return kept
+
+    def _truncate(self, text, max_tokens):
+        """Cut text to at most max_tokens, at a word boundary"""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        # Leave room for the ellipsis
+        max_tokens -= self.count_tokens(" ...")
+        pieces = text.split(" ")
+        low, high = 0, len(pieces)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(" ".join(pieces[:middle])) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return " ".join(pieces[:low]) + " ..."
+
+    def compact_history(self, messages):
+        """Summarize earlier turns into short bullet points using the local summarizer"""
+        lines = []
+        question = None
+        for message in messages:
+            if message["role"] == "user":
+                question = message["content"]
+            elif message["role"] == "assistant" and question is not None:
+                summary = self.summarizer.summarize(question, message["content"])
+                lines.append(f"- Employee asked: {question[:150]} / You answered: {summary}")
+                question = None
+        if question is not None:
+            lines.append(f"- Employee asked: {question[:150]}")
+        return "Summary of earlier messages in this conversation:\n" + "\n".join(lines) if lines else ""
+
+    def build(self, system_template, question, context_chunks=None, history=None, empty_context=""):
+        """Return (messages, report), fitting documents and history into the budget after the system prompt and question"""
+        # Turns beyond twice the verbatim limit are too old to be worth even a summary line
+        history = [message for message in (history or []) if message.get("content")]
+        too_old = max(0, len(history) - self.max_history_messages * 2)
+        history = history[too_old:]
+        base_system = system_template.replace(self.CONTEXT_PLACEHOLDER, "")
+        fixed_tokens = self.count_message_tokens([
+            {"role": "system", "content": base_system},
+            {"role": "user", "content": question}
+        ])
+        available = max(0, self.max_prompt_tokens - fixed_tokens)
+
+        # Documents: best-ranked first, up to their share of what's left; always keep (part of) the top chunk
+        unique_chunks = self.dedupe_chunks(context_chunks or [])
+        context_budget = max(int(available * self.context_share), self.MIN_CONTEXT_TOKENS)
+        separator_tokens = self.count_tokens(self.CONTEXT_SEPARATOR)
+        chunks = []
+        context_tokens = 0
+        for chunk in unique_chunks[:self.max_context_chunks]:
+            chunk_tokens = self.count_tokens(chunk) + (separator_tokens if chunks else 0)
+            if context_tokens + chunk_tokens > context_budget:
+                if not chunks:
+                    chunk = self._truncate(chunk, context_budget)
+                    chunks.append(chunk)
+                    context_tokens = self.count_tokens(chunk)
+                break
+            chunks.append(chunk)
+            context_tokens += chunk_tokens
+        context = self.CONTEXT_SEPARATOR.join(chunks) or empty_context
+
+        # History: newest messages verbatim while they fit; whatever is older gets summarized, or dropped if that doesn't fit
+        history_budget = max(0, available - context_tokens)
+        recent = []
+        history_tokens = 0
+        for message in reversed(history):
+            message_tokens = self.TOKENS_PER_MESSAGE + self.count_tokens(message["content"])
+            if history_tokens + message_tokens > history_budget or len(recent) >= self.max_history_messages:
+                break
+            recent.insert(0, {"role": message["role"], "content": message["content"]})
+            history_tokens += message_tokens
+
+        # A reply without its question is confusing, so start the kept history on a user message
+        while recent and recent[0]["role"] != "user":
+            history_tokens -= self.TOKENS_PER_MESSAGE + self.count_tokens(recent.pop(0)["content"])
+
+        older = history[:len(history) - len(recent)]
+        summary_message = None
+        if older:
+            summary = self._truncate(self.compact_history(older), max(0, history_budget - history_tokens - self.TOKENS_PER_MESSAGE))
+            if summary.strip(" .") and self.count_tokens(summary) + self.TOKENS_PER_MESSAGE <= history_budget - history_tokens:
+                summary_message = {"role": "system", "content": summary}
+
+        messages = [{"role": "system", "content": system_template.replace(self.CONTEXT_PLACEHOLDER, context)}]
+        if summary_message:
+            messages.append(summary_message)
+        messages.extend(recent)
+        messages.append({"role": "user", "content": question})
+
+        report = {
+            "prompt_tokens": self.count_message_tokens(messages),
+            "budget": self.max_prompt_tokens,
+            "context_tokens": self.count_tokens(context),
+            "history_tokens": sum(self.TOKENS_PER_MESSAGE + self.count_tokens(message["content"]) for message in messages[1:-1]),
+            "chunks_used": len(chunks),
+            "duplicate_chunks": len(context_chunks or []) - len(unique_chunks),
+            "history_messages": len(recent),
+            "history_summarized": len(older) if summary_message else 0,
+            "history_dropped": too_old + (len(older) if not summary_message else 0),
+            "estimated": self.encoding is None
+        }
+        return messages, report
@@ -0,0 +1,38 @@
+# utils/quantile_sketch.py
+import math
+
+class QuantileSketch:
+    """Log-spaced histogram buckets that give percentiles within a fixed relative error from bucket counts alone"""
+
+    def __init__(self, relative_accuracy=0.02, min_value=1 / 60):
+        """Initialize with the relative error of estimates and the value below which everything shares the first bucket;
+        bucket indexes depend on both, so persisted counts must always be read with the same settings"""
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+
+    def bucket(self, value):
+        """Bucket index for a value; bucket i > 0 holds (min_value * gamma^(i-1), min_value * gamma^i]"""
+        if value <= self.min_value:
+            return 0
+        return max(1, math.ceil(math.log(value / self.min_value) / self.log_gamma))
+
+    def bucket_value(self, index):
+        """Estimate for values in a bucket, within relative_accuracy of any of them"""
+        if index <= 0:
+            return self.min_value
+        return 2 * self.min_value * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, counts, p):
+        """The p-th percentile from {bucket index: count}, or None if there are no values"""
+        total = sum(counts.values())
+        if not total:
+            return None
+        rank = p / 100 * (total - 1)
+        running = 0
+        for index in sorted(counts):
+            running += counts[index]
+            if running > rank:
+                return self.bucket_value(index)
+        return self.bucket_value(max(counts))
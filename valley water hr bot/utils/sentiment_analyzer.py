@@ -1,5 +1,4 @@
 import os
-from openai import OpenAI
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -9,14 +8,15 @@ from datetime import datetime, timedelta
 from collections import Counter
 import streamlit as st
 import json
+from utils.llm_gateway import get_llm_gateway
 
 class SentimentAnalyzer:
     """Class for analyzing sentiment and extracting insights from HR conversations"""
 
-    def __init__(self, openai_api_key=None):
-        """Initialize with OpenAI API key"""
+    def __init__(self, openai_api_key=None, openai_client=None):
+        """Initialize with an OpenAI client, or the shared gateway's batch lane for an API key"""
         self.api_key = openai_api_key or os.environ.get("OPENAI_API_KEY")
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = openai_client or get_llm_gateway(self.api_key).client("batch")
 
     def analyze_conversation(self, question, answer):
         """Analyze a single conversation for sentiment and key topics"""
@@ -0,0 +1,114 @@
+# utils/structured_answer.py
+import json
+import re
+
+ANSWER_START_RE = re.compile(r'"answer"\s*:\s*"')
+
+class StructuredAnswerParser:
+    """Prompt instructions and validation for single-call JSON answers (answer, follow-ups, topic, summary)"""
+
+    TOPIC_CATEGORIES = [
+        "Benefits", "Policies", "Procedures", "Career Development", "Compensation",
+        "Time Off", "Document Analysis", "Emergency", "Other"
+    ]
+
+    NUM_SUGGESTIONS = 3
+    MAX_SUMMARY_LENGTH = 200
+
+    def get_instructions(self):
+        """Output format instructions appended to the system message"""
+        return f"""
+Respond with a single JSON object and nothing else, using exactly these keys in this order:
+{{
+  "answer": "your full answer to the employee, formatted with markdown as described above",
+  "suggestions": ["{self.NUM_SUGGESTIONS} follow-up questions the employee might ask next, each one casual sentence ending with a question mark"],
+  "topic": "one of: {', '.join(self.TOPIC_CATEGORIES)}",
+  "summary": "one short sentence summarizing this question and answer"
+}}
+"""
+
+    def _load_json(self, text):
+        """Load the outermost JSON object, tolerating code fences and text around it"""
+        start = text.find('{')
+        end = text.rfind('}')
+        if start == -1 or end <= start:
+            raise ValueError("No JSON object in response")
+        # strict=False accepts raw newlines inside strings, which models often emit in long answers
+        return json.loads(text[start:end + 1], strict=False)
+
+    def parse(self, text):
+        """Validate a structured response, returning {'answer', 'suggestions', 'topic', 'summary'}; raises ValueError"""
+        try:
+            data = self._load_json(text or "")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+
+        if not isinstance(data, dict):
+            raise ValueError("Response is not a JSON object")
+
+        answer = data.get("answer")
+        if not isinstance(answer, str) or not answer.strip():
+            raise ValueError("Missing answer")
+
+        suggestions = data.get("suggestions")
+        if not isinstance(suggestions, list):
+            suggestions = []
+        suggestions = [
+            re.sub(r'^(\d+[\.\)]|[-*•])\s*', '', suggestion).strip()
+            for suggestion in suggestions if isinstance(suggestion, str)
+        ]
+        suggestions = [suggestion for suggestion in suggestions if '?' in suggestion][:self.NUM_SUGGESTIONS]
+
+        # Map the label onto a known category, case-insensitively
+        topic = data.get("topic") if isinstance(data.get("topic"), str) else ""
+        topic = next((category for category in self.TOPIC_CATEGORIES if category.lower() == topic.strip().lower()), "Other")
+
+        summary = data.get("summary") if isinstance(data.get("summary"), str) else ""
+        summary = summary.strip()[:self.MAX_SUMMARY_LENGTH] or None
+
+        return {
+            "answer": answer.strip(),
+            "suggestions": suggestions,
+            "topic": topic,
+            "summary": summary
+        }
+
+    def get_display_text(self, text):
+        """What to show of a partially received response: its answer field, or the raw text if it isn't JSON"""
+        stripped = (text or "").lstrip()
+        if stripped and stripped[0] not in '{`':
+            return text
+        return self.extract_partial_answer(text)
+
+    def extract_partial_answer(self, text):
+        """Decode as much of the "answer" string as has arrived so far, for streaming display"""
+        match = ANSWER_START_RE.search(text or "")
+        if not match:
+            return ""
+
+        chars = []
+        i = match.end()
+        while i < len(text):
+            char = text[i]
+            if char == '\\':
+                # Stop before an escape sequence that hasn't fully arrived yet
+                length = 6 if text[i + 1:i + 2] == 'u' else 2
+                if i + length > len(text):
+                    break
+                chars.append(text[i:i + length])
+                i += length
+                continue
+            if char == '"':
+                break
+            chars.append(char)
+            i += 1
+
+        try:
+            answer = json.loads('"' + "".join(chars) + '"', strict=False)
+        except ValueError:
+            return ""
+
+        # Drop the first half of a surrogate pair (e.g. an emoji) whose second half hasn't arrived
+        if answer and '\ud800' <= answer[-1] <= '\udbff':
+            answer = answer[:-1]
+        return answer
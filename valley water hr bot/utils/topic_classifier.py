@@ -0,0 +1,130 @@
+# utils/topic_classifier.py
+import re
+import threading
+import time
+import zlib
+import numpy as np
+from utils.vector_index import extract_features
+
+class TopicClassifier:
+    """Multinomial naive Bayes over hashed n-grams, trained on topics already stored with conversations"""
+
+    # One model per database per process, shared by every session
+    _shared = {}
+    _lock = threading.Lock()
+
+    MIN_TRAINING_ROWS = 50        # below this the model defers every conversation to the LLM
+    REFRESH_INTERVAL = 60         # seconds between checks for newly labeled conversations
+    FULL_RETRAIN_INTERVAL = 6 * 60 * 60  # periodic rebuild picks up relabeled and deleted rows
+    MAX_EVIDENCE = 20             # feature count the evidence of a long conversation is scaled down to
+
+    def __init__(self, db_manager, categories, num_features=2 ** 16, alpha=0.1, min_confidence=0.9):
+        """Initialize an untrained model for a DBManager and its list of topic categories"""
+        self.db_manager = db_manager
+        self.categories = list(categories)
+        self.num_features = num_features
+        self.alpha = alpha
+        self.min_confidence = min_confidence
+        self._train_lock = threading.Lock()
+        self._reset()
+
+    @classmethod
+    def shared(cls, db_manager, categories):
+        """Return the process-wide classifier for a database, creating it on first use"""
+        with cls._lock:
+            classifier = cls._shared.get(db_manager.db_path)
+            if classifier is None:
+                classifier = cls(db_manager, categories)
+                cls._shared[db_manager.db_path] = classifier
+            return classifier
+
+    def _reset(self):
+        """Forget everything learned so far"""
+        self.feature_counts = np.zeros((len(self.categories), self.num_features), dtype=np.float64)
+        self.class_counts = np.zeros(len(self.categories), dtype=np.float64)
+        self.log_prior = None
+        self.log_likelihood = None
+        self.last_row_id = 0
+        self.last_refresh = 0
+        self.last_full_train = time.time()
+
+    def _hash_features(self, question, answer):
+        """Hashed feature indices; question and answer features are kept apart since the question carries more signal"""
+        features = [f"q|{feature}" for feature in extract_features(question or "")]
+        features.extend(f"a|{feature}" for feature in extract_features(answer or ""))
+        return np.array([zlib.crc32(feature.encode('utf-8')) % self.num_features for feature in features], dtype=np.int64)
+
+    def normalize_label(self, topic):
+        """Map a stored topic such as "Category: Benefits" onto a known category, or None"""
+        topic = re.sub(r'^\s*category\s*:\s*', '', topic or "", flags=re.IGNORECASE).strip().rstrip('.').lower()
+        return next((category for category in self.categories if category.lower() == topic), None)
+
+    def _add_rows(self, rows):
+        """Add labeled rows to the counts; rows whose topic isn't a known category are skipped"""
+        category_index = {category: i for i, category in enumerate(self.categories)}
+        added = 0
+        for row in rows:
+            self.last_row_id = max(self.last_row_id, row['id'])
+            label = category_index.get(self.normalize_label(row['topic']))
+            if label is None:
+                continue
+            indices = self._hash_features(row['question'], row['answer'])
+            self.feature_counts[label] += np.bincount(indices, minlength=self.num_features)
+            self.class_counts[label] += 1
+            added += 1
+        return added
+
+    def _update_parameters(self):
+        """Recompute log probabilities from the counts (Laplace smoothed)"""
+        smoothed = self.feature_counts + self.alpha
+        self.log_likelihood = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+        self.log_prior = np.log((self.class_counts + 1) / (self.class_counts.sum() + len(self.categories)))
+
+    def refresh(self, force=False):
+        """Train on conversations labeled since the last refresh, rebuilding from scratch periodically"""
+        now = time.time()
+        if not force and now - self.last_refresh < self.REFRESH_INTERVAL:
+            return 0
+
+        with self._train_lock:
+            if not force and now - self.last_refresh < self.REFRESH_INTERVAL:
+                return 0
+            if now - self.last_full_train >= self.FULL_RETRAIN_INTERVAL:
+                self._reset()
+
+            try:
+                rows = self.db_manager.get_topic_training_rows(after_id=self.last_row_id)
+            except Exception as e:
+                print(f"Error loading topic training data: {e}")
+                return 0
+
+            added = self._add_rows(rows)
+            if added or self.log_likelihood is None:
+                self._update_parameters()
+            self.last_refresh = now
+            return added
+
+    def predict_proba(self, question, answer):
+        """Return {category: probability} for a conversation, or None while there is too little training data"""
+        self.refresh()
+        log_likelihood, log_prior = self.log_likelihood, self.log_prior
+        if log_likelihood is None or self.class_counts.sum() < self.MIN_TRAINING_ROWS:
+            return None
+
+        # Naive Bayes treats every n-gram as independent evidence, which pushes long texts to near-certain
+        # scores; scaling the evidence down to at most MAX_EVIDENCE features keeps the confidence meaningful
+        indices = self._hash_features(question, answer)
+        if not len(indices):
+            return None
+        scores = log_prior + log_likelihood[:, indices].sum(axis=1) * min(1.0, self.MAX_EVIDENCE / len(indices))
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        return dict(zip(self.categories, probabilities.tolist()))
+
+    def predict(self, question, answer):
+        """Return the most likely category if the model is confident enough, otherwise None"""
+        probabilities = self.predict_proba(question, answer)
+        if not probabilities:
+            return None
+        topic, confidence = max(probabilities.items(), key=lambda item: item[1])
+        return topic if confidence >= self.min_confidence else None
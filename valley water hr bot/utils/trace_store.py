@@ -0,0 +1,294 @@
+# utils/trace_store.py
+import json
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from utils.tracing import Tracer
+
+def weighted_percentile(pairs, p):
+    """The p-th percentile of (value, weight) pairs; sampled traces stand in for 1/sample_rate requests"""
+    pairs = sorted(pair for pair in pairs if pair[0] is not None)
+    if not pairs:
+        return None
+    total = sum(weight for _, weight in pairs)
+    threshold = total * p / 100
+    running = 0.0
+    for value, weight in pairs:
+        running += weight
+        if running >= threshold:
+            return value
+    return pairs[-1][0]
+
+class TraceStore:
+    """Samples finished traces and writes their spans to a local SQLite database from a background thread"""
+
+    # One store per database file per process, shared by every page and session
+    _stores = {}
+    _lock = threading.Lock()
+
+    BATCH_SIZE = 100
+    PRUNE_INTERVAL = 60 * 60  # seconds between deletions of traces older than the retention period
+
+    def __init__(self, db_path="data/trace_database.db", sample_rate=0.2, slow_threshold=10.0, retention_days=14, max_queue=1000):
+        """Initialize with the database path, share of ordinary traces to keep, seconds above which a trace is always kept,
+        days to keep traces, and how many traces may wait to be written before new ones are dropped"""
+        self.db_path = db_path
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.retention_days = retention_days
+        self.random = random.Random()
+        self.stats = {"sampled": 0, "skipped": 0, "dropped": 0, "written": 0}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._last_prune = 0
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._init_db()
+        self.thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+
+    @classmethod
+    def shared(cls, db_path=None):
+        """The process-wide store, configured from HR_BOT_TRACE_* environment variables and receiving every trace
+        unless HR_BOT_TRACING=0"""
+        db_path = db_path or os.environ.get("HR_BOT_TRACE_DB", "data/trace_database.db")
+        with cls._lock:
+            store = cls._stores.get(db_path)
+            if store is None:
+                store = cls(
+                    db_path,
+                    sample_rate=float(os.environ.get("HR_BOT_TRACE_SAMPLE_RATE", "0.2")),
+                    slow_threshold=float(os.environ.get("HR_BOT_TRACE_SLOW_SECONDS", "10")),
+                    retention_days=int(os.environ.get("HR_BOT_TRACE_RETENTION_DAYS", "14"))
+                )
+                store.thread.start()
+                if os.environ.get("HR_BOT_TRACING", "1") != "0":
+                    Tracer.add_listener(store.record)
+                cls._stores[db_path] = store
+            return store
+
+    def _get_connection(self):
+        """Get a connection to the trace database"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """Create the trace tables if they don't exist"""
+        conn = self._get_connection()
+        # WAL lets the admin page read while the writer thread inserts
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript('''
+        CREATE TABLE IF NOT EXISTS traces (
+            trace_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            duration REAL NOT NULL,
+            error TEXT,
+            employee_id TEXT,
+            conversation_id TEXT,
+            outcome TEXT,
+            sample_reason TEXT,
+            weight REAL NOT NULL DEFAULT 1,
+            attributes TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_traces_started ON traces (name, started_at);
+        CREATE INDEX IF NOT EXISTS idx_traces_employee ON traces (employee_id, started_at);
+
+        CREATE TABLE IF NOT EXISTS trace_spans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trace_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            parent TEXT,
+            depth INTEGER NOT NULL,
+            start_offset REAL NOT NULL,
+            duration REAL,
+            error TEXT,
+            attributes TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_trace_spans_trace ON trace_spans (trace_id);
+        ''')
+        conn.commit()
+        conn.close()
+
+    def sample_reason(self, trace):
+        """Why a trace should be kept ('error', 'slow' or 'sampled'), or None to skip it"""
+        if trace.get("error") or trace.get("attributes", {}).get("outcome") == "error":
+            return "error"
+        if trace["duration"] >= self.slow_threshold:
+            return "slow"
+        if self.random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    def record(self, trace):
+        """Trace listener: keep errors, slow traces and a sample of the rest, without blocking the request"""
+        reason = self.sample_reason(trace)
+        if reason is None:
+            self.stats["skipped"] += 1
+            return
+        try:
+            self._queue.put_nowait((trace, reason))
+            self.stats["sampled"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def _run(self):
+        """Write queued traces in batches"""
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                if time.time() - self._last_prune > self.PRUNE_INTERVAL:
+                    self.prune()
+            except Exception as e:
+                print(f"Error writing traces: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        """Insert traces and their spans in one transaction"""
+        trace_rows = []
+        span_rows = []
+        for trace, reason in batch:
+            attributes = trace.get("attributes", {})
+            # Ordinary traces are a sample, so each one stands for 1/sample_rate requests in percentiles
+            weight = 1 / self.sample_rate if reason == "sampled" and self.sample_rate else 1
+            trace_rows.append((
+                trace["trace_id"], trace["name"],
+                datetime.fromtimestamp(trace["started_at"]).strftime('%Y-%m-%d %H:%M:%S.%f'),
+                trace["duration"], trace.get("error"),
+                attributes.get("employee_id"), attributes.get("conversation_id"), attributes.get("outcome"),
+                reason, weight, json.dumps(attributes, default=str)
+            ))
+            for position, span in enumerate(trace["spans"]):
+                span_rows.append((
+                    trace["trace_id"], position, span["name"], span["parent"], span["depth"],
+                    span["offset"], span["duration"], span["error"],
+                    json.dumps(span["attributes"], default=str) if span["attributes"] else None
+                ))
+
+        conn = self._get_connection()
+        try:
+            conn.executemany('''
+            INSERT OR REPLACE INTO traces
+            (trace_id, name, started_at, duration, error, employee_id, conversation_id, outcome, sample_reason, weight, attributes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', trace_rows)
+            conn.executemany('''
+            INSERT INTO trace_spans (trace_id, position, name, parent, depth, start_offset, duration, error, attributes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', span_rows)
+            conn.commit()
+            self.stats["written"] += len(trace_rows)
+        finally:
+            conn.close()
+
+    def prune(self):
+        """Delete traces older than the retention period"""
+        self._last_prune = time.time()
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+        conn = self._get_connection()
+        try:
+            conn.execute("DELETE FROM trace_spans WHERE trace_id IN (SELECT trace_id FROM traces WHERE started_at < ?)", (cutoff,))
+            conn.execute("DELETE FROM traces WHERE started_at < ?", (cutoff,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def flush(self, timeout=10):
+        """Wait until every queued trace has been written; returns False on timeout"""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if time.time() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def get_traces(self, days=7, name="chat_turn", min_duration=0.0, employee_id=None, limit=50):
+        """Slowest traces of a kind in the last days, optionally for one employee"""
+        conn = self._get_connection()
+        query = '''
+        SELECT trace_id, name, started_at, duration, error, employee_id, conversation_id, outcome, sample_reason
+        FROM traces
+        WHERE name = ? AND started_at >= ? AND duration >= ?
+        '''
+        params = [name, (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S'), min_duration]
+        if employee_id:
+            query += " AND employee_id = ?"
+            params.append(employee_id)
+        query += " ORDER BY duration DESC LIMIT ?"
+        params.append(limit)
+        rows = [dict(row) for row in conn.execute(query, params).fetchall()]
+        conn.close()
+        return rows
+
+    def get_trace_spans(self, trace_id):
+        """The spans of one trace in the order they started"""
+        conn = self._get_connection()
+        rows = conn.execute('''
+        SELECT name, parent, depth, start_offset, duration, error, attributes
+        FROM trace_spans WHERE trace_id = ? ORDER BY position
+        ''', (trace_id,)).fetchall()
+        conn.close()
+
+        spans = []
+        for row in rows:
+            span = dict(row)
+            span["attributes"] = json.loads(span["attributes"]) if span["attributes"] else {}
+            spans.append(span)
+        return spans
+
+    def get_latency_summary(self, days=7, name="chat_turn"):
+        """Traced request count and weighted p50/p95/p99 duration over the last days"""
+        conn = self._get_connection()
+        rows = conn.execute('''
+        SELECT duration, weight, sample_reason FROM traces WHERE name = ? AND started_at >= ?
+        ''', (name, (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S'))).fetchall()
+        conn.close()
+
+        pairs = [(row["duration"], row["weight"]) for row in rows]
+        return {
+            "stored": len(rows),
+            "estimated_requests": round(sum(weight for _, weight in pairs)),
+            "slow": sum(1 for row in rows if row["sample_reason"] == "slow"),
+            "errors": sum(1 for row in rows if row["sample_reason"] == "error"),
+            "p50": weighted_percentile(pairs, 50),
+            "p95": weighted_percentile(pairs, 95),
+            "p99": weighted_percentile(pairs, 99)
+        }
+
+    def get_stage_breakdown(self, days=7, name="chat_turn"):
+        """Per-stage (top-level span) count, mean and weighted p50/p95 seconds, slowest stages first"""
+        conn = self._get_connection()
+        rows = conn.execute('''
+        SELECT s.trace_id, s.name, s.duration, t.weight
+        FROM trace_spans s JOIN traces t ON t.trace_id = s.trace_id
+        WHERE t.name = ? AND t.started_at >= ? AND s.depth = 1 AND s.duration IS NOT NULL
+        ''', (name, (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S'))).fetchall()
+        conn.close()
+
+        stages = {}
+        for row in rows:
+            stages.setdefault(row["name"], []).append((row["duration"], row["weight"]))
+
+        breakdown = []
+        for stage, pairs in stages.items():
+            total_weight = sum(weight for _, weight in pairs)
+            breakdown.append({
+                "stage": stage,
+                "count": len(pairs),
+                "mean": sum(duration * weight for duration, weight in pairs) / total_weight,
+                "p50": weighted_percentile(pairs, 50),
+                "p95": weighted_percentile(pairs, 95),
+                "total": sum(duration * weight for duration, weight in pairs)
+            })
+        return sorted(breakdown, key=lambda stage: stage["total"], reverse=True)
@@ -0,0 +1,180 @@
+# utils/tracing.py
+import functools
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+SQL_WHITESPACE_RE = re.compile(r'\s+')
+
+class Tracer:
+    """Times the steps of a request as nested spans and hands each finished trace to listeners"""
+
+    # Spans nest per thread; a span opened with no trace active starts a new trace
+    _local = threading.local()
+    _listeners = []
+    _lock = threading.Lock()
+
+    @classmethod
+    def add_listener(cls, listener):
+        """Call listener(trace) with every finished trace, from the thread that ran it"""
+        with cls._lock:
+            if listener not in cls._listeners:
+                cls._listeners.append(listener)
+
+    @classmethod
+    def remove_listener(cls, listener):
+        """Stop sending traces to a listener"""
+        with cls._lock:
+            if listener in cls._listeners:
+                cls._listeners.remove(listener)
+
+    @classmethod
+    def is_active(cls):
+        """Whether a trace is being recorded on this thread"""
+        return bool(getattr(cls._local, "stack", None))
+
+    @classmethod
+    def current_trace(cls):
+        """The trace being recorded on this thread, or None"""
+        stack = getattr(cls._local, "stack", None)
+        return stack[0]["trace"] if stack else None
+
+    @classmethod
+    def annotate(cls, **attributes):
+        """Add attributes to the innermost open span on this thread"""
+        stack = getattr(cls._local, "stack", None)
+        if stack:
+            stack[-1]["span"]["attributes"].update(attributes)
+
+    @classmethod
+    @contextmanager
+    def span(cls, name, **attributes):
+        """Time the enclosed block as a span named name"""
+        stack = getattr(cls._local, "stack", None)
+        if stack is None:
+            stack = cls._local.stack = []
+
+        start = time.perf_counter()
+        if stack:
+            trace = stack[0]["trace"]
+            parent = stack[-1]["span"]
+        else:
+            trace = {"trace_id": uuid.uuid4().hex, "name": name, "started_at": time.time(), "start": start, "spans": []}
+            parent = None
+        span = {
+            "name": name,
+            "parent": parent["name"] if parent else None,
+            "depth": parent["depth"] + 1 if parent else 0,
+            "offset": start - trace["start"],
+            "duration": None,
+            "attributes": dict(attributes),
+            "error": None
+        }
+        trace["spans"].append(span)
+        stack.append({"trace": trace, "span": span})
+
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span["duration"] = time.perf_counter() - start
+            stack.pop()
+            if not stack:
+                trace["duration"] = span["duration"]
+                trace["error"] = span["error"]
+                trace["attributes"] = span["attributes"]
+                cls._finish(trace)
+
+    @classmethod
+    @contextmanager
+    def child_span(cls, name, **attributes):
+        """Like span, but only recorded inside a trace; for low-level calls (queries, API calls) that happen everywhere"""
+        if not cls.is_active():
+            yield None
+            return
+        with cls.span(name, **attributes) as span:
+            yield span
+
+    @classmethod
+    def wrap(cls, func):
+        """Bind func to the current span so spans it opens on another thread nest under it"""
+        stack = getattr(cls._local, "stack", None)
+        if not stack:
+            return func
+        parent = stack[-1]
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            thread_stack = getattr(cls._local, "stack", None)
+            if thread_stack is None:
+                thread_stack = cls._local.stack = []
+            # The borrowed entry is never finished here, so the trace is still completed by its own thread
+            thread_stack.append(parent)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                thread_stack.pop()
+        return wrapper
+
+    @classmethod
+    def traced(cls, name):
+        """Decorator that runs a function inside a span"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with cls.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @classmethod
+    def _finish(cls, trace):
+        """Send a finished trace to every listener; a failing listener never breaks the request"""
+        with cls._lock:
+            listeners = list(cls._listeners)
+        for listener in listeners:
+            try:
+                listener(trace)
+            except Exception as e:
+                print(f"Error in trace listener: {e}")
+
+class TracedCursor(sqlite3.Cursor):
+    """SQLite cursor that records each statement as a "db" span when a trace is active"""
+
+    def execute(self, sql, parameters=()):
+        if not Tracer.is_active():
+            return super().execute(sql, parameters)
+        with Tracer.span("db", sql=_sql_label(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not Tracer.is_active():
+            return super().executemany(sql, seq_of_parameters)
+        with Tracer.span("db", sql=_sql_label(sql)):
+            return super().executemany(sql, seq_of_parameters)
+
+class TracedConnection(sqlite3.Connection):
+    """SQLite connection whose cursors are traced; pass as sqlite3.connect(..., factory=TracedConnection)"""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        # Committing waits on the disk, often longer than the statements themselves
+        with Tracer.child_span("db", sql="COMMIT"):
+            return super().commit()
+
+def _sql_label(sql):
+    """Statement text for a span, whitespace collapsed; parameters are never recorded"""
+    return SQL_WHITESPACE_RE.sub(' ', sql).strip()[:200]
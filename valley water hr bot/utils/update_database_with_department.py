@@ -1,5 +1,5 @@
 import sqlite3
-import json
+from utils.employee_directory import EmployeeDirectory
 
 def add_department_column():
     """Add department column to conversations table"""
@@ -19,14 +19,13 @@ def add_department_column():
             print("Column 'department' already exists.")
         
         # Update existing rows with department information
-        with open("data/employee_database.json", "r") as f:
-            employee_data = json.load(f)
+        directory = EmployeeDirectory.shared()
         
         cursor.execute("SELECT id, employee_id FROM conversations")
         conversations = cursor.fetchall()
         
         for conv_id, emp_id in conversations:
-            department = employee_data.get(emp_id, {}).get("department", "Unknown")
+            department = directory.get_department(emp_id)
             cursor.execute(
                 "UPDATE conversations SET department = ? WHERE id = ?", 
                 (department, conv_id)
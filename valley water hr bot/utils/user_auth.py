@@ -2,6 +2,7 @@ import json
 import os
 import hashlib
 import streamlit as st
+from utils.employee_directory import EmployeeDirectory
 
 class UserAuth:
     """Class to handle user authentication functionality"""
@@ -10,21 +11,14 @@ class UserAuth:
         """Initialize with paths to employee and credentials data"""
         self.employee_db_path = employee_db_path
         self.credentials_path = credentials_path
-        self.employees = self._load_employee_database()
+        # Loaded once per process and shared, instead of parsed for every UserAuth
+        self.directory = EmployeeDirectory.shared(employee_db_path)
         self.credentials = self._load_credentials()
     
-    def _load_employee_database(self):
-        """Load the employee database from JSON file"""
-        if os.path.exists(self.employee_db_path):
-            try:
-                with open(self.employee_db_path, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"Error loading employee database: {e}")
-                return {}
-        else:
-            print(f"Employee database not found at {self.employee_db_path}")
-            return {}
+    @property
+    def employees(self):
+        """All employee records keyed by ID"""
+        return self.directory.get_all()
     
     def _load_credentials(self):
         """Load the credentials from JSON file"""
@@ -63,7 +57,7 @@ class UserAuth:
     
     def get_employee_data(self, employee_id):
         """Get employee data by ID"""
-        return self.employees.get(employee_id)
+        return self.directory.get(employee_id)
     
     def is_admin(self, employee_id):
         """Check if an employee has admin privileges"""
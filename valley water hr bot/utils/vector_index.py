@@ -0,0 +1,125 @@
+# utils/vector_index.py
+import os
+import re
+import json
+import zlib
+import numpy as np
+
+STOP_WORDS = {'a', 'an', 'the', 'is', 'are', 'do', 'does', 'what', 'when', 'where', 'how', 'why', 'who',
+              'i', 'my', 'me', 'can', 'of', 'to', 'in', 'on', 'for', 'and', 'or', 'be', 'it', 'this', 'that'}
+
+def extract_features(text):
+    """Turn text into word, word-bigram and character-trigram features"""
+    words = [word for word in re.findall(r'\b\w+\b', text.lower()) if word not in STOP_WORDS]
+    features = list(words)
+    features.extend(f"{first} {second}" for first, second in zip(words, words[1:]))
+    # Character trigrams let "vacations" match "vacation" and similar variants
+    for word in words:
+        padded = f"#{word}#"
+        features.extend(f"~{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+class VectorIndex:
+    """Local semantic index using hashed TF-IDF vectors with LSA projection"""
+
+    def __init__(self, num_features=2 ** 13, num_components=128):
+        """Initialize an empty index with hashing and projection sizes"""
+        self.num_features = num_features
+        self.num_components = num_components
+        self.chunks = []
+        self.metadata = []         # optional per-chunk dicts, e.g. section and page range
+        self.idf = None
+        self.tfidf_matrix = None   # chunks x features, rows L2-normalized
+        self.components = None     # features x components (LSA basis)
+        self.lsa_matrix = None     # chunks x components, rows L2-normalized
+
+    def _hash_counts(self, text):
+        """Count hashed features for a piece of text"""
+        indices = [zlib.crc32(feature.encode('utf-8')) % self.num_features for feature in extract_features(text)]
+        return np.bincount(np.array(indices, dtype=np.int64), minlength=self.num_features).astype(np.float32)
+
+    @staticmethod
+    def _normalize(matrix):
+        """L2-normalize rows, leaving all-zero rows untouched"""
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def build(self, chunks, metadata=None):
+        """Vectorize chunks and compute the LSA projection"""
+        self.chunks = list(chunks)
+        self.metadata = list(metadata) if metadata else []
+        if not self.chunks:
+            return self
+
+        counts = np.vstack([self._hash_counts(chunk) for chunk in self.chunks])
+
+        # Sublinear term frequency with smoothed inverse document frequency
+        doc_freq = (counts > 0).sum(axis=0)
+        self.idf = (np.log((1 + len(self.chunks)) / (1 + doc_freq)) + 1).astype(np.float32)
+        self.tfidf_matrix = self._normalize(np.log1p(counts) * self.idf).astype(np.float32)
+
+        # Truncated SVD gives a low-rank "concept" space for synonym-style matches
+        _, _, vt = np.linalg.svd(self.tfidf_matrix, full_matrices=False)
+        rank = min(self.num_components, vt.shape[0])
+        self.components = vt[:rank].T.astype(np.float32)
+        self.lsa_matrix = self._normalize(self.tfidf_matrix @ self.components).astype(np.float32)
+        return self
+
+    def search(self, query, top_k=3, lsa_weight=0.5):
+        """Return the top_k (chunk_id, similarity) pairs for a query, best first"""
+        if not self.chunks:
+            return []
+
+        query_vector = self._normalize(np.log1p(self._hash_counts(query)) * self.idf)
+        if not query_vector.any():
+            return []
+
+        # Blend exact-term similarity with similarity in the LSA concept space
+        lexical_scores = self.tfidf_matrix @ query_vector
+        concept_scores = self.lsa_matrix @ self._normalize(query_vector @ self.components)
+        scores = (1 - lsa_weight) * lexical_scores + lsa_weight * concept_scores
+
+        top_k = min(top_k, len(self.chunks))
+        top_indices = np.argpartition(-scores, top_k - 1)[:top_k]
+        top_indices = top_indices[np.argsort(-scores[top_indices])]
+        return [(int(i), float(scores[i])) for i in top_indices]
+
+    def get_chunks(self, query, top_k=3, min_score=0.0):
+        """Return the text of the top_k chunks scoring above min_score"""
+        return [self.chunks[chunk_id] for chunk_id, score in self.search(query, top_k) if score > min_score]
+
+    def get_metadata(self, chunk_id):
+        """Return the metadata stored for a chunk, or an empty dict"""
+        return self.metadata[chunk_id] if chunk_id < len(self.metadata) else {}
+
+    def save(self, path):
+        """Write the index to disk as a compressed NumPy archive"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp.npz"
+        np.savez_compressed(
+            temp_path,
+            settings=np.array([self.num_features, self.num_components]),
+            chunks=np.array(self.chunks, dtype=str),
+            metadata=np.array([json.dumps(entry) for entry in self.metadata], dtype=str),
+            idf=self.idf,
+            tfidf_matrix=self.tfidf_matrix,
+            components=self.components,
+            lsa_matrix=self.lsa_matrix
+        )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index previously written with save"""
+        with np.load(path) as data:
+            num_features, num_components = (int(value) for value in data['settings'])
+            index = cls(num_features=num_features, num_components=num_components)
+            index.chunks = [str(chunk) for chunk in data['chunks']]
+            if 'metadata' in data.files:
+                index.metadata = [json.loads(str(entry)) for entry in data['metadata']]
+            index.idf = data['idf']
+            index.tfidf_matrix = data['tfidf_matrix']
+            index.components = data['components']
+            index.lsa_matrix = data['lsa_matrix']
+        return index